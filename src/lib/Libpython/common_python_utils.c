@@ -798,6 +798,75 @@ pbsv1mod_meth_logmsg(PyObject *self, PyObject *args, PyObject *kwds)
 		severity, pbs_python_daemon_name, emsg);
 	Py_RETURN_NONE;
 }
+
+/*
+ * will_logmsg module method implementation and documentation
+ *
+ */
+
+const char pbsv1mod_meth_will_logmsg_doc[] =
+"will_logmsg(strSeverity)\n\
+  where:\n\
+\n\
+   strSeverity: one of the module constants accepted by pbs.logmsg()\n\
+\n\
+  returns:\n\
+         True if pbs.logmsg() would record a message at this level,\n\
+         False otherwise\n\
+";
+
+/**
+ * @brief
+ *	This is the wrapper function to the pbs.will_logmsg() call in the hook
+ *	world. It maps the loglevel to an eventtype the same way pbs.logmsg()
+ *	does and asks will_log_event() whether the daemon's log event mask
+ *	records it, so that hooks can skip building messages nobody will see.
+ *
+ * @param[in]	self - parent object
+ * @param[in]	args - the list of arguments:
+ * 			args[0] = loglevel	(pbs.LOG_DEBUG, pbs.EVENT_DEBUG4, etc...)
+ *
+ * @return PyObject *
+ * @retval Py_True	- a message at loglevel would be logged
+ * @retval Py_False	- a message at loglevel would be discarded
+ * @retval NULL		- which causes an exception to the executing hook script.
+ *
+ */
+PyObject *
+pbsv1mod_meth_will_logmsg(PyObject *self, PyObject *args, PyObject *kwds)
+{
+
+	static char *kwlist[] = {"loglevel", NULL};
+
+	int   loglevel;
+	int   eventtype;
+
+	if (!PyArg_ParseTupleAndKeywords(args, kwds,
+		"i:will_logmsg",
+		kwlist,
+		&loglevel
+		)
+		) {
+		return NULL;
+	}
+
+	if (!VALID_SEVERITY_VALUE(loglevel) &&
+		!VALID_EVENTTYPE_VALUE(loglevel)) {
+		PyErr_Format(PyExc_TypeError, "Invalid severity or eventtype value <%d>",
+			loglevel);
+		return NULL;
+	}
+
+	/* same eventtype that pbsv1mod_meth_logmsg() hands to log_event() */
+	if (VALID_EVENTTYPE_VALUE(loglevel))
+		eventtype = loglevel;
+	else
+		eventtype = (PBSEVENT_ADMIN | PBSEVENT_SYSTEM);
+
+	if (will_log_event(eventtype))
+		Py_RETURN_TRUE;
+	Py_RETURN_FALSE;
+}
 #undef  VALID_SEVERITY_VALUE
 
 /*
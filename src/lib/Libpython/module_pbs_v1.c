@@ -75,6 +75,10 @@ extern char pbsv1mod_meth_logmsg_doc[]; /* common_python_utils.c */
 extern PyObject * pbsv1mod_meth_logmsg(PyObject *self,
 	PyObject *args, PyObject *kwds);
 
+extern char pbsv1mod_meth_will_logmsg_doc[]; /* common_python_utils.c */
+extern PyObject * pbsv1mod_meth_will_logmsg(PyObject *self,
+	PyObject *args, PyObject *kwds);
+
 extern char pbsv1mod_meth_logjobmsg_doc[]; /* common_python_utils.c */
 extern PyObject * pbsv1mod_meth_logjobmsg(PyObject *self,
 	PyObject *args, PyObject *kwds
@@ -571,6 +575,8 @@ static PyMethodDef pbs_v1_module_methods[] = {
 		METH_VARARGS | METH_KEYWORDS, pbsv1mod_meth_vnode_ntype_to_str_doc},
 	{"logmsg", (PyCFunction) pbsv1mod_meth_logmsg,
 		METH_VARARGS | METH_KEYWORDS, pbsv1mod_meth_logmsg_doc},
+	{"will_logmsg", (PyCFunction) pbsv1mod_meth_will_logmsg,
+		METH_VARARGS | METH_KEYWORDS, pbsv1mod_meth_will_logmsg_doc},
 	{PY_LOGJOBMSG_METHOD, (PyCFunction) pbsv1mod_meth_logjobmsg,
 		METH_VARARGS | METH_KEYWORDS, pbsv1mod_meth_logjobmsg_doc},
 	{PY_GET_PYTHON_DAEMON_NAME_METHOD,
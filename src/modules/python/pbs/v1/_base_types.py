@@ -99,6 +99,8 @@ __all__ = ['_generic_attr',
 import _pbs_v1
 import sys
 import math
+from collections import namedtuple
+from functools import lru_cache
 _size = _pbs_v1.svr_types._size
 _LOG = _pbs_v1.logmsg
 _IS_SETTABLE = _pbs_v1.is_attrib_val_settable
@@ -114,7 +116,10 @@ class PbsAttributeDescriptor():
       - Add the attribute name to the dictionary 'attributes' on the instance if
         it exists.
       - Since a Descriptor is a class level object, to maintain unique values
-        across instances, we maintain an internal dictionary.
+        across instances, each value is kept in the instance's own __dict__
+        under the attribute name. A data descriptor takes precedence over
+        the instance __dict__ on lookup, so the entry is only ever reached
+        through __get__, and it goes away together with the instance.
     """
 
     def __init__(self, cls, name, default_value, value_type=None, resc_attr=None, is_entity=0):
@@ -150,8 +155,6 @@ class PbsAttributeDescriptor():
 
         __attributes = getattr(cls, _ATTRIBUTES_KEY_NAME)
         __attributes[name] = None
-        #: now we need to maintain a unique value for each object
-        self.__per_instance = {}
 
     #: m(__init__)
 
@@ -166,15 +169,17 @@ class PbsAttributeDescriptor():
         #: if this attribute has never been accessed or set by the instance then
         #: we just return the default value
         #: NOTE: Doing the more compact:
-        #   return self.__per_instance.setdefault(obj,self._get_default_value())
+        #   return per_instance.setdefault(self._name,self._get_default_value())
         #  caused pbs_resource to be instantiated every time. Probably due to
         #  _get_default_value() getting evaluatd every time.
 
-        if obj not in self.__per_instance:
+        per_instance = obj.__dict__
+        try:
+            return per_instance[self._name]
+        except KeyError:
             v = self._get_default_value()
-            self.__per_instance[obj] = v
-
-        return self.__per_instance[obj]
+            per_instance[self._name] = v
+            return v
     #: m(__get__)
 
     def __set__(self, obj, value):
@@ -209,7 +214,7 @@ class PbsAttributeDescriptor():
             else:
                 set_value = self._value_type[0](value)
         #:
-        self.__per_instance[obj] = set_value
+        obj.__dict__[self._name] = set_value
     #: m(__set__)
 
     def _set_resc_atttr(self, resc_attr, is_entity=0):
@@ -224,7 +229,7 @@ class PbsAttributeDescriptor():
     def __delete__(self, obj):
         """__delete__, we just set the attribute value to None"""
 
-        self.__per_instance[obj] = None
+        obj.__dict__[self._name] = None
     #: m(__delete__)
 
     def _get_default_value(self):
@@ -321,28 +326,186 @@ class _generic_attr():
 
 #: C(_generic_attr)
 
-#: ---------------------  VALUE TYPES         ---------------------
-# to_bytes: given a _size 'sz' value, returns an integer which is the
-# equivalent number of bytes.
+#: ---------------------  PARSERS             ---------------------
+#
+# The parsers below turn the string forms of select, exec_vnode, size and
+# duration values into immutable tuples. Results are memoized on the input
+# string, since hooks tend to look at the same few resource requests over
+# and over; callers must build new values rather than modify what is
+# returned.
 
+_PARSE_CACHE_SIZE = 1024
+
+_SIZE_10KB = _size("10kb")
+_SIZE_1GB = _size("1gb")
+
+#: a chunk of a select spec: 'count' is the number of chunks, 'explicit' is
+#: False if the spec did not give one (i.e. 1 is implied), and 'resources'
+#: is a tuple of (name, value) pairs, value being None for a bare name.
+_select_chunk = namedtuple('_select_chunk', ['count', 'explicit',
+                                             'resources'])
+
+#: a vnode entry of an exec_vnode spec: 'vnode_name' is None if no vnode
+#: name was given, and 'resources' is a tuple of (name, value) pairs.
+_vnode_chunk = namedtuple('_vnode_chunk', ['vnode_name', 'resources'])
+
+
+def _parse_resources(items):
+    """
+    Given a sequence of "<res>=<val>" strings, return a tuple of
+    (<res>, <val>) pairs, <val> being None for an item with no '='.
+    """
+    resources = []
+    for item in items:
+        if item.find("=") == -1:
+            resources.append((item, None))
+        else:
+            resources.append(tuple(item.split("=", 1)))
+    return tuple(resources)
+
+
+def _format_resources(resources):
+    """
+    Inverse of _parse_resources(), returning a list of strings.
+    """
+    return [r if v is None else "%s=%s" % (r, v) for (r, v) in resources]
+
+
+@lru_cache(maxsize=_PARSE_CACHE_SIZE)
+def _parse_select(spec):
+    """
+    Given a select spec "[N:]res=val[:res=val][+[N:]res=val...]", return
+    a tuple of _select_chunk.
+    """
+    chunks = []
+    for chunk in spec.split("+"):
+        items = chunk.split(":")
+        if items[0].isdigit():
+            chunks.append(_select_chunk(int(items[0]), True,
+                                        _parse_resources(items[1:])))
+        else:
+            chunks.append(_select_chunk(1, False, _parse_resources(items)))
+    return tuple(chunks)
+
+
+def _format_select(chunks):
+    """
+    Inverse of _parse_select().
+    """
+    specs = []
+    for chunk in chunks:
+        items = _format_resources(chunk.resources)
+        if chunk.explicit:
+            items.insert(0, str(chunk.count))
+        specs.append(":".join(items))
+    return "+".join(specs)
+
+
+@lru_cache(maxsize=_PARSE_CACHE_SIZE)
+def _parse_vchunk(achunk):
+    """
+    Given "<vnode>:<res1>=<val1>:...", return a _vnode_chunk.
+    """
+    vnode_name = None
+    resources = []
+    for item in achunk.split(":"):
+        if item.find("=") == -1:
+            vnode_name = item
+        else:
+            resources.append(item)
+    return _vnode_chunk(vnode_name, _parse_resources(resources))
 
-def to_bytes(sz):
 
-    s_str = str(sz).rstrip("bB")
-    sl = len(s_str)
+@lru_cache(maxsize=_PARSE_CACHE_SIZE)
+def _parse_exec_vnode(spec):
+    """
+    Given an exec_vnode spec "(vnA:res=val)+(vnB:res=val+vnC:res=val)",
+    return a tuple with one entry per parenthesized group, each being a
+    tuple of _vnode_chunk.
+    """
+    groups = []
+    group = None
+    for v in spec.split("+"):
+        if group is None:
+            group = []
+            in_parens = v.startswith("(")
+        group.append(_parse_vchunk(v.strip("(").strip(")")))
+        if not in_parens or v.endswith(")"):
+            groups.append(tuple(group))
+            group = None
+    if group:
+        groups.append(tuple(group))
+    return tuple(groups)
+
+
+def _format_exec_vnode(groups):
+    """
+    Inverse of _parse_exec_vnode().
+    """
+    specs = []
+    for group in groups:
+        vnodes = []
+        for chunk in group:
+            items = _format_resources(chunk.resources)
+            if chunk.vnode_name is not None:
+                items.insert(0, chunk.vnode_name)
+            vnodes.append(":".join(items))
+        specs.append("(%s)" % "+".join(vnodes))
+    return "+".join(specs)
+
+
+@lru_cache(maxsize=_PARSE_CACHE_SIZE)
+def _size_to_bytes(s_str):
+    """
+    Given the string form of a size, return its number of bytes.
+    """
+    s_str = s_str.rstrip("bB")
     wordsz = 1
-    if (s_str[sl - 1] == "w") or (s_str[sl - 1] == "W"):
+    if s_str.endswith(("w", "W")):
         s_str = s_str.rstrip("wW")
         wordsz = _pbs_v1.wordsize()
 
-    sl = len(s_str)
-    if (s_str[sl - 1] == "k") or (s_str[sl - 1] == "K"):
+    if s_str.endswith(("k", "K")):
         s_num = int(s_str.rstrip("kK")) * 1024
     else:
         s_num = int(s_str)
 
-    s_num *= wordsz
-    return s_num
+    return s_num * wordsz
+
+
+@lru_cache(maxsize=_PARSE_CACHE_SIZE)
+def _transform_size(s_str):
+    """
+    Given the string form of a size, return the _size used by
+    transform_sizes() for it.
+    """
+    s = _size(s_str)
+    if s.__le__(_SIZE_10KB):
+        # make all values at least 10kb to prevent rounding up errors
+        # in normalize_size().  Here, we make it relative to 1gb.
+        return _size(_size_to_bytes(str(s)) + 1073741824)
+    return _size(s.__add__(_SIZE_1GB))
+
+
+@lru_cache(maxsize=_PARSE_CACHE_SIZE)
+def _duration_to_secs(valstr):
+    """
+    Given the string form of a duration, validate it and return its
+    number of seconds. Invalid values raise and are not memoized.
+    """
+    # validates against the 'walltime' attribute entry of the
+    # the server 'resource' table
+    _pbs_v1.validate_input("resc", "walltime", valstr)
+    return _pbs_v1.duration_to_secs(valstr)
+
+
+#: ---------------------  VALUE TYPES         ---------------------
+# to_bytes: given a _size 'sz' value, returns an integer which is the
+# equivalent number of bytes.
+
+
+def to_bytes(sz):
+    return _size_to_bytes(str(sz))
 
 # transform_sizes: return _size transformation of 'sz1' and 'sz2' that
 # can be fed to the richcompare functions of _size without causing an
@@ -351,32 +514,13 @@ def to_bytes(sz):
 
 def transform_sizes(sz1, sz2):
 
-    s_num = -1
-    s = sz1
-    if isinstance(sz1, (int, size)):
-        s = _size(str(sz1))
-        if s.__le__(_size("10kb")):
-            # make all values at least 10kb to prevent rounding up errors
-            # in normalize_size().  Here, we make it relative to 1gb.
-            s_num = to_bytes(s) + 1073741824
-            s = _size(s_num)
-
-    o_num = -1
-    o = sz2
-    if isinstance(sz2, (int, size)):
-        o = _size(str(sz2))
-        if o.__le__(_size("10kb")):
-            # make all values at least 10kb to prevent rounding up errors
-            # in normalize_size()
-            o_num = to_bytes(o) + 1073741824
-            o = _size(o_num)
-
-    if s_num == -1 and isinstance(s, _size):
-        s = _size(s.__add__(_size("1gb")))
-    if o_num == -1 and isinstance(o, _size):
-        o = _size(o.__add__(_size("1gb")))
-
-    l = [s, o]
+    l = []
+    for sz in (sz1, sz2):
+        if isinstance(sz, (int, size)):
+            sz = _transform_size(str(sz))
+        elif isinstance(sz, _size):
+            sz = _size(sz.__add__(_SIZE_1GB))
+        l.append(sz)
     return l
 
 
@@ -561,11 +705,7 @@ class duration(int):
     _derived_types = (int,)
 
     def __new__(cls, value):
-        valstr = str(value)
-        # validates against the 'walltime' attribute entry of the
-        # the server 'resource' table
-        _pbs_v1.validate_input("resc", "walltime", valstr)
-        return int.__new__(cls, _pbs_v1.duration_to_secs(valstr))
+        return int.__new__(cls, _duration_to_secs(str(value)))
 
     def __init__(self, value):
         self.duration_str = str(value)
@@ -1030,66 +1170,40 @@ class select(_generic_attr):
         else:
             raise ValueError("bad increment specs")
 
-        ret_str = ""
-        i = 0  # index to each chunk in the + separated spec
-        for chunk in str(self).split("+"):
-            if i != 0:
-                ret_str += '+'
-            j = 0  # index to items within a chunk separated by ':'
-            for subchunk in chunk.split(":"):
-                c_str = subchunk
-                if j == 0:
-                    # given <chunk_ct>:<res1>=<val1>:<res2>=<val2> or
-                    # <res1>=<val1>:<res2>:<val2> (without <chunk_ct>),
-                    # here we're looking at the first field:
-                    # subchunk=<chunk_ct> or subchunk=<res1>=<val1>
-                    save_str = None
-                    if not subchunk.isdigit():
-                        # detected a first field that is not
-                        # a <chunk_ct>, so default to 1
-                        subchunk = "1"
-                        save_str = c_str
-                    chunk_ct = int(subchunk)
-
-                    if i == 0:
-                        chunk_ct -= 1  # don't touch the first chunk which lands in MS
-
-                    if chunk_ct <= 0:
-                        num = 0
-                    elif increment:
-                        num = chunk_ct + increment
-                    elif percent_inc:
-                        num = int(math.ceil(chunk_ct * percent_inc))
-                    elif increment_dict is not None and i in increment_dict:
-                        if isinstance(increment_dict[i], (int, int)):
-                            inc = increment_dict[i]
-                            num = chunk_ct + inc
-                        elif isinstance(increment_dict[i], str):
-                            if increment_dict[i].endswith('%'):
-                                p_inc = float(
-                                    increment_dict[i][:-1]) / 100 + 1.0
-                                num = int(math.ceil(chunk_ct * p_inc))
-                            else:
-                                inc = int(increment_dict[i])
-                                num = chunk_ct + inc
+        chunks = []
+        # i: index to each chunk in the + separated spec
+        for (i, chunk) in enumerate(_parse_select(str(self))):
+            chunk_ct = chunk.count
+            if i == 0:
+                chunk_ct -= 1  # don't touch the first chunk which lands in MS
+
+            if chunk_ct <= 0:
+                num = 0
+            elif increment:
+                num = chunk_ct + increment
+            elif percent_inc:
+                num = int(math.ceil(chunk_ct * percent_inc))
+            elif increment_dict is not None and i in increment_dict:
+                if isinstance(increment_dict[i], (int, int)):
+                    inc = increment_dict[i]
+                    num = chunk_ct + inc
+                elif isinstance(increment_dict[i], str):
+                    if increment_dict[i].endswith('%'):
+                        p_inc = float(
+                            increment_dict[i][:-1]) / 100 + 1.0
+                        num = int(math.ceil(chunk_ct * p_inc))
                     else:
-                        raise ValueError("bad increment specs")
+                        inc = int(increment_dict[i])
+                        num = chunk_ct + inc
+            else:
+                raise ValueError("bad increment specs")
 
-                    if (i == 0):
-                        num += 1  # put back the decremented count
+            if (i == 0):
+                num += 1  # put back the decremented count
 
-                    if save_str:
-                        c_str = "%s:%s" % (num, save_str)
-                    else:
-                        c_str = "%s" % (num)
-                else:
-                    ret_str += ":"
-                ret_str += c_str
-                j += 1
+            chunks.append(chunk._replace(count=num, explicit=True))
 
-            i += 1
-
-        return select(ret_str)
+        return select(_format_select(chunks))
 
 
 class place(_generic_attr):
@@ -1709,15 +1823,16 @@ class vchunk():
     def __init__(self, achunk):
         """__init__"""
 
-        ch = achunk.split(":")
+        if isinstance(achunk, _vnode_chunk):
+            chunk = achunk
+        else:
+            chunk = _parse_vchunk(achunk)
         self.chunk_resources = pbs_resource("Resource_List")
-        for c in ch:
-            if c.find("=") == -1:
-                self.vnode_name = c
-            else:
-                rs = c.split("=", 1)
-                descr = getattr(pbs_resource, rs[0])
-                self.chunk_resources[rs[0]] = descr._value_type[0](rs[1])
+        if chunk.vnode_name is not None:
+            self.vnode_name = chunk.vnode_name
+        for (r, v) in chunk.resources:
+            descr = getattr(pbs_resource, r)
+            self.chunk_resources[r] = descr._value_type[0](v)
     #: m(__init__)
 
 
@@ -1744,8 +1859,7 @@ class exec_vnode(_generic_attr):
         _pbs_v1.validate_input("job", "exec_vnode", value)
         super().__init__(value)
         self.chunks = list()
-        vals = value.split("+")
-        i = 0
-        for v in vals:
-            self.chunks.append(vchunk(v.strip("(").strip(")")))
+        for group in _parse_exec_vnode(value):
+            for chunk in group:
+                self.chunks.append(vchunk(chunk))
 #: --------         EXPORTED TYPES DICTIONARY                      ---------
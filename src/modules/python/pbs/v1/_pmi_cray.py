@@ -53,13 +53,32 @@ from subprocess import Popen, PIPE
 from pbs.v1._pmi_types import BackendError
 import pbs
 from pbs.v1._pmi_utils import _running_excl, _pbs_conf, _get_vnode_names, \
-    _svr_vnode
+    pmi_pbsvnodes
 
 pbsexec = _pbs_conf("PBS_EXEC")
 if pbsexec is None:
     raise BackendError("PBS_EXEC not found")
 
 
+#
+# _capmc: path of the capmc command, looked up by _capmc_cmd() on first use.
+_capmc = None
+
+
+def _capmc_cmd():
+    """
+    Return the path of the capmc command.
+    """
+    global _capmc
+    if _capmc is None:
+        # full path to capmc given by Cray
+        _capmc = os.path.join(os.path.sep, 'opt', 'cray',
+                              'capmc', 'default', 'bin', 'capmc')
+        if not os.path.exists(_capmc):
+            _capmc = "capmc"		# should be in PATH then
+    return _capmc
+
+
 def launch(jid, args):
     """
     Run capmc and return the structured output.
@@ -72,16 +91,19 @@ def launch(jid, args):
     """
     import json
 
-    # full path to capmc given by Cray
-    cmd = os.path.join(os.path.sep, 'opt', 'cray',
-                       'capmc', 'default', 'bin', 'capmc')
-    if not os.path.exists(cmd):
-        cmd = "capmc"		# should be in PATH then
-    cmd = cmd + " " + args
+    cmd = _capmc_cmd() + " " + args
     fail = ""
 
     pbs.logjobmsg(jid, "launch: " + cmd)
-    cmd_run = Popen(cmd, shell=True, stdout=PIPE, stderr=PIPE)
+    # capmc is run directly rather than through a shell, the arguments
+    # (subcommand, options, nid lists and numbers) need no expansion
+    try:
+        cmd_run = Popen([_capmc_cmd()] + args.split(), stdout=PIPE,
+                        stderr=PIPE, universal_newlines=True)
+    except OSError as e:
+        fail = "%s: %s" % (cmd, str(e))
+        pbs.logjobmsg(jid, fail)
+        raise BackendError(fail)
     (cmd_out, cmd_err) = cmd_run.communicate()
     exitval = cmd_run.returncode
     if exitval != 0:
@@ -120,13 +142,10 @@ def jobnids(job):
     :returns: set of nids from node's resources_available[craynid].
     """
     nidset = set()
-    craynid = "PBScraynid"
     for vname in _get_vnode_names(job):
-        vnode = _svr_vnode(vname)
-        try:
-            nidset.add(int(vnode.resources_available[craynid]))
-        except Exception:
-            pass
+        nid = pmi_pbsvnodes.nid(vname)
+        if nid is not None:
+            nidset.add(nid)
     return nidset
 
 
@@ -139,13 +158,10 @@ def nodenids(hosts):
     :returns: set of nids from node's resources_available[craynid].
     """
     nidset = set()
-    craynid = "PBScraynid"
     for vnames in hosts:
-        vnode = _svr_vnode(vnames)
-        try:
-            nidset.add(int(vnode.resources_available[craynid]))
-        except Exception:
-            pass
+        nid = pmi_pbsvnodes.nid(vnames)
+        if nid is not None:
+            nidset.add(nid)
     return nidset
 
 
@@ -286,10 +302,69 @@ def job_energy(job, nids, cnt):
     return energy
 
 
-class Pmi:
+class _EnergyBatch:
+    """
+    Energy counters of the nodes of all the jobs of an EXECHOST_PERIODIC
+    event.  They are read with a single capmc call the first time the
+    usage of one of the jobs is asked for, then each job gets the sum of
+    the counters of its own nids.  The counters are read again for the
+    next event.
+    """
+
+    def __init__(self):
+        self.event = None
+        self.nidsets = dict()
+        self.counters = None
+
+    def _load(self, e):
+        """
+        Read the energy counters of the nids of the jobs of event 'e'.
+        Only the jobs for which get_usage() can return a value are
+        included: the jobs this MoM is mother superior of, with an
+        initial energy value saved by activate_profile().
+        """
+        self.event = e
+        self.nidsets = dict()
+        self.counters = None
+        allnids = set()
+        for jobid in list(e.job_list.keys()):
+            j = e.job_list[jobid]
+            if not j.in_ms_mom() or not os.path.isfile(energy_file(j)):
+                continue
+            nidset = jobnids(j)
+            allnids.update(nidset)
+            self.nidsets[jobid] = nidset
+        nids, cnt = nidlist(None, allnids)
+        ret = node_energy("all", nids, cnt)
+        if ret is not None and "nodes" in ret:
+            self.counters = dict()
+            for node in ret["nodes"]:
+                self.counters[node["nid"]] = node["energy_ctr"]
+
+    def job_energy(self, e, job):
+        """
+        Return the energy counter of 'job' during event 'e', or None if no
+        energy value is available.
+        """
+        if self.event is not e:
+            self._load(e)
+        if job.id not in self.nidsets:
+            # not known when the counters were read, ask on its own
+            nids, cnt = nidlist(job)
+            return job_energy(job, nids, cnt)
+        if self.counters is None:
+            return None
+        energy = 0
+        for nid in self.nidsets[job.id]:	# owned by job of interest
+            energy += self.counters.get(nid, 0)
+        pbs.logjobmsg(job.id, "Cray: get_usage: energy %dJ" % energy)
+        return energy
+
 
-    ninfo = None
-    nidarray = dict()
+_energy_batch = _EnergyBatch()
+
+
+class Pmi:
 
     def __init__(self, pyhome=None):
         pbs.logmsg(pbs.EVENT_DEBUG3, "Cray: init")
@@ -320,30 +395,9 @@ class Pmi:
         e = pbs.event()
         if e.type == pbs.EXECHOST_PERIODIC:
             # This function will be called for each job in turn when
-            # running from a periodic hook.  Here we fill in some
-            # global variables just once and use the information
-            # for each job in turn.  Save the result of calling capmc
-            # for all running jobs in the variable ninfo.  Keep a
-            # dictionary with the job id's as keys holding a set
-            # of nid numbers.
-            if Pmi.ninfo is None:
-                allnids = set()
-                for jobid in list(e.job_list.keys()):
-                    j = e.job_list[jobid]
-                    nidset = jobnids(j)
-                    allnids.update(nidset)
-                    Pmi.nidarray[jobid] = nidset
-                nids, cnt = nidlist(None, allnids)
-                Pmi.ninfo = node_energy("all", nids, cnt)
-            nidset = Pmi.nidarray[job.id]
-            energy = None
-            if Pmi.ninfo is not None and "nodes" in Pmi.ninfo:
-                energy = 0
-                for node in Pmi.ninfo["nodes"]:
-                    if node["nid"] in nidset:		# owned by job of interest
-                        energy += node["energy_ctr"]
-                pbs.logjobmsg(job.id, "Cray: get_usage: energy %dJ" %
-                              energy)
+            # running from a periodic hook, so read the energy counters
+            # of all the jobs in one capmc call.
+            energy = _energy_batch.job_energy(e, job)
         else:
             nids, cnt = nidlist(job)
             energy = job_energy(job, nids, cnt)
@@ -562,11 +616,7 @@ class Pmi:
             ready = out['ready']
         else:
             return nodeset
-        craynid = "PBScraynid"
-        for vnames in hosts:
-            vnode = _svr_vnode(vnames)
-            if craynid in vnode.resources_available:
-                nid = int(vnode.resources_available[craynid])
-                if nid in ready:
-                    nodeset.add(vnames)
+        hosts = set(hosts)
+        for nid in ready:
+            nodeset.update(pmi_pbsvnodes.nid_vnodes(int(nid)) & hosts)
         return nodeset
@@ -45,6 +45,7 @@ Utility power functions.
 """
 
 import pbs
+import json
 import os
 import sys
 
@@ -142,16 +143,137 @@ def _get_vnode_names(job):
     return vnodes
 
 
+class _VnodeCache:
+    """
+    Vnodes obtained from the server, indexed by name and by Cray nid,
+    which is shared by all the vnodes of a host.
+
+    All the vnodes are fetched on the first lookup.  On the first lookup
+    of each later event only the attributes in stamp_attribs are fetched
+    for all the vnodes.  Vnodes where any of them changed, and new
+    vnodes, are then fetched again in full, and vnodes that went away
+    are dropped.
+    """
+
+    craynid = "PBScraynid"
+    stamp_attribs = ["state", "last_state_change_time", "jobs",
+                     "power_provisioning",
+                     "resources_available." + craynid]
+    # Past this many changed vnodes, fetching them all at once is cheaper
+    max_refetch = 100
+
+    def __init__(self):
+        self.event = None
+        self.vnodes = dict()
+        self.stamps = dict()
+        self.nids = dict()
+        self.nid_names = dict()
+
+    def _stamp(self, vn):
+        stamp = []
+        for attrib in self.stamp_attribs:
+            (name, _, resc) = attrib.partition(".")
+            try:
+                val = getattr(vn, name)
+                if resc:
+                    val = val[resc]
+            except Exception:
+                val = None
+            stamp.append(str(val))
+        return stamp
+
+    def _drop(self, name):
+        del self.vnodes[name]
+        del self.stamps[name]
+        nid = self.nids.pop(name, None)
+        if nid is not None:
+            names = self.nid_names[nid]
+            names.discard(name)
+            if not names:
+                del self.nid_names[nid]
+
+    def _add(self, vn):
+        if vn.name in self.vnodes:
+            self._drop(vn.name)
+        self.vnodes[vn.name] = vn
+        self.stamps[vn.name] = self._stamp(vn)
+        try:
+            nid = int(vn.resources_available[self.craynid])
+        except Exception:
+            return
+        self.nids[vn.name] = nid
+        # several vnodes share the nid of the host, e.g. one per NUMA node
+        self.nid_names.setdefault(nid, set()).add(vn.name)
+
+    def refresh(self):
+        """
+        Bring the cache up to date with the server.
+        """
+        server = pbs.server()
+        if not self.vnodes:
+            for vn in server.vnodes():
+                self._add(vn)
+            return
+        names = set()
+        changed = []
+        for vn in server.vnodes(attribs=self.stamp_attribs):
+            names.add(vn.name)
+            if self.stamps.get(vn.name) != self._stamp(vn):
+                changed.append(vn.name)
+        for name in set(self.vnodes) - names:
+            self._drop(name)
+        if len(changed) > self.max_refetch:
+            changed = set(changed)
+            for vn in server.vnodes():
+                if vn.name in changed:
+                    self._add(vn)
+        else:
+            for name in changed:
+                vn = server.vnode(name)
+                if vn is not None:
+                    self._add(vn)
+
+    def _current(self):
+        e = pbs.event()
+        if e is not self.event or not self.vnodes:
+            self.event = e
+            self.refresh()
+
+    def vnode(self, name):
+        """
+        Return the vnode object of vnode name, raising KeyError if there
+        is no such vnode.
+        """
+        self._current()
+        return self.vnodes[name]
+
+    def nid(self, name):
+        """
+        Return the Cray nid of vnode name, or None if it has none.
+        Raise KeyError if there is no such vnode.
+        """
+        self._current()
+        if name not in self.vnodes:
+            raise KeyError(name)
+        return self.nids.get(name)
+
+    def nid_vnodes(self, nid):
+        """
+        Return the set of names of the vnodes with Cray nid nid, empty if
+        there is none.
+        """
+        self._current()
+        return frozenset(self.nid_names.get(nid, ()))
+
+
+#
+# pmi_pbsvnodes: cache of the server vnodes used by the power functions.
+pmi_pbsvnodes = _VnodeCache()
+
+
 def _svr_vnode(name):
     # Return a vnode object obtained from the server by name.
-    # Save the values in a global dictionary for future use.
-    global pmi_pbsconf
-    if "pmi_pbsvnodes" not in globals():
-        global pmi_pbsvnodes
-        pmi_pbsvnodes = dict()
-        for vn in pbs.server().vnodes():
-            pmi_pbsvnodes[vn.name] = vn
-    return pmi_pbsvnodes[name]
+    return pmi_pbsvnodes.vnode(name)
 
 
 def _running_excl(job):
@@ -163,3 +285,234 @@ def _running_excl(job):
             if job.id != id:
                 return False
     return True
+
+
+def _power_view(vnode, resvlist, neededby=0):
+    """
+    Return everything the power on/off decision for a vnode depends on,
+    in a form that can be saved as json and compared with what was seen
+    in an earlier run of the periodic event.
+    """
+    resvs = []
+    if vnode.resv:
+        for resid in str(vnode.resv).split(","):
+            resid = resid.lstrip()
+            resv = resvlist[resid]
+            resvs.append([resid, int(resv.reserve_state or 0),
+                          int(resv.reserve_start or 0)])
+    try:
+        craynid = str(vnode.resources_available["PBScraynid"] or "")
+    except Exception:
+        craynid = ""
+    return [int(vnode.state or 0), int(vnode.last_used_time or 0),
+            int(vnode.last_state_change_time or 0),
+            bool(vnode.poweroff_eligible), craynid, resvs, int(neededby)]
+
+
+class _PowerState:
+    """
+    State the PBS_power hook keeps between runs of the periodic event,
+    saved as json so that it survives the hook being restarted.
+
+    It holds the parsed hook config and, for each vnode, its power state,
+    when that last changed, any transition still in progress, and what
+    the vnode looked like when it was last evaluated.  For each host it
+    also keeps the durations of its last few boots.
+    """
+
+    # Number of boot durations kept for each host
+    boot_samples = 5
+
+    def __init__(self, path):
+        self.path = path
+        self.config = None
+        self.config_key = None
+        self.vnodes = dict()
+        self.boots = dict()
+        self.observed = set()
+        self.modified = False
+        try:
+            with open(path) as fp:
+                data = json.load(fp)
+            self.config = data["config"]
+            self.config_key = data["config_key"]
+            self.vnodes = data["vnodes"]
+            self.boots = data.get("boots", {})
+        except (IOError, OSError):
+            pass
+        except (ValueError, KeyError, TypeError):
+            pbs.logmsg(pbs.EVENT_DEBUG,
+                       "%s: ignoring unreadable power state" % path)
+
+    def read_config(self, config_file):
+        """
+        Return the hook config, reading config_file again only if it
+        changed since the last time.
+        """
+        key = [config_file, os.stat(config_file).st_mtime]
+        if self.config is None or key != self.config_key:
+            with open(config_file) as fp:
+                self.config = json.load(fp)
+            self.config_key = key
+            # Every vnode has to be evaluated again with the new settings
+            for ent in self.vnodes.values():
+                ent["seen"] = None
+            self.modified = True
+        return self.config
+
+    def observe(self, name, host, view, time_now):
+        """
+        Note that vnode name on host was seen looking like view.  Return
+        True if it has to be evaluated again because it changed since it
+        was last evaluated or a time its evaluation depends on is reached.
+        """
+        self.observed.add(name)
+        ent = self.vnodes.get(name)
+        if ent is None:
+            ent = {"host": host, "power": "on", "changed": time_now,
+                   "pending": None, "since": None, "seen": None,
+                   "recheck": 0}
+            self.vnodes[name] = ent
+            self.modified = True
+        elif ent["host"] != host:
+            ent["host"] = host
+            ent["seen"] = None
+            self.modified = True
+        return ent["seen"] != view or time_now >= ent["recheck"]
+
+    def evaluated(self, name, view, recheck):
+        """
+        Record the view vnode name was evaluated with and the time at
+        which it has to be evaluated again even if it does not change.
+        """
+        ent = self.vnodes[name]
+        ent["seen"] = view
+        ent["recheck"] = recheck
+        self.modified = True
+
+    def prune(self):
+        """
+        Forget the vnodes that were not observed in this run.
+        """
+        for name in set(self.vnodes) - self.observed:
+            del self.vnodes[name]
+            self.modified = True
+
+    def _host_vnodes(self, hosts):
+        hosts = set(hosts)
+        return [ent for ent in self.vnodes.values() if ent["host"] in hosts]
+
+    def start(self, hosts, transition, time_now):
+        """
+        Record that the vnodes of hosts are on their way to the power
+        state transition.  time_now is None if it is not known when the
+        transition started.
+        """
+        for ent in self._host_vnodes(hosts):
+            ent["pending"] = transition
+            ent["since"] = time_now
+        self.modified = True
+
+    def finish(self, hosts, power, time_now):
+        """
+        Record that the vnodes of hosts are now in the power state power.
+        For a power on the time it took is added to the boot durations
+        of the host.
+        """
+        booted = set()
+        for ent in self._host_vnodes(hosts):
+            host = ent["host"]
+            if power == "on" and ent["pending"] == "on" and \
+                    ent["since"] is not None and host not in booted:
+                booted.add(host)
+                boots = self.boots.setdefault(host, [])
+                boots.append(time_now - ent["since"])
+                del boots[:-self.boot_samples]
+            ent["power"] = power
+            ent["changed"] = time_now
+            ent["pending"] = None
+            ent["since"] = None
+        self.modified = True
+
+    def boot_time(self, host):
+        """
+        Return the longest of the recorded boot durations of host, or
+        None if none was recorded yet.
+        """
+        if self.boots.get(host):
+            return max(self.boots[host])
+        return None
+
+    def pending_hosts(self, transition):
+        """
+        Return the hosts with a transition to power state transition
+        still in progress.
+        """
+        return sorted({ent["host"] for ent in self.vnodes.values()
+                       if ent["pending"] == transition})
+
+    def save(self):
+        """
+        Write the state out if it was modified.  The file is replaced as
+        a whole so a hook killed while saving leaves the old state behind.
+        """
+        if not self.modified:
+            return
+        data = {"config": self.config, "config_key": self.config_key,
+                "vnodes": self.vnodes, "boots": self.boots}
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as fp:
+            json.dump(data, fp)
+        os.rename(tmp, self.path)
+        self.modified = False
+
+
+class _PowerPlanner:
+    """
+    Decide when the PBS_power hook has to start powering on a sleeping
+    host so that it is up by the time a reservation or a queued job needs
+    it, rather than once the demand is already there.
+
+    The lead time of a host is its longest recorded boot, or default_boot
+    until one is recorded.  A host is powered on by the run of the
+    periodic event that is the last one to start it in time, which is
+    why the event frequency counts too.  Boots are only seen to finish
+    when a later run asks for the status of the host, so the recorded
+    durations round up to a multiple of the frequency and err on the
+    early side.
+    """
+
+    def __init__(self, state, time_now, freq, default_boot=900):
+        self.state = state
+        self.time_now = time_now
+        self.freq = freq
+        self.default_boot = default_boot
+
+    def boot_time(self, host):
+        """
+        Return how long host is expected to take to boot.
+        """
+        boot = self.state.boot_time(host)
+        if boot is None:
+            return self.default_boot
+        return boot
+
+    def start_by(self, host, neededby):
+        """
+        Return the latest time host can be powered on to be up at neededby.
+        """
+        return neededby - self.boot_time(host)
+
+    def power_on_now(self, host, neededby):
+        """
+        Return True if host needed at neededby has to be powered on in
+        this run, as the next one would be too late.
+        """
+        return self.start_by(host, neededby) < self.time_now + self.freq
+
+    def recheck(self, host, neededby):
+        """
+        Return the time of the run that has to look at host again to
+        power it on in time for neededby.
+        """
+        return self.start_by(host, neededby) - self.freq
@@ -103,6 +103,238 @@ def get_local_nodename():
     return(_pbs_v1.get_local_host_name())
 
 
+#
+# _server_connections: keeps one connection handle per server for the
+#                      lifetime of the hook, so that repeated object
+#                      lookups do not pay a connect and authentication
+#                      round trip each.
+class _server_connections():
+    """
+    This represents the pool of server connections used by pbs_statobj().
+    """
+
+    def __init__(self):
+        """__init__"""
+        self._cons = {}
+    #: m(__init__)
+
+    def get(self, connect_server=None):
+        """
+        get([connect_server])
+            Returns a tuple (con, reused) where 'con' is a connection
+            handle to 'connect_server' (or "localhost" if None), or a
+            negative value if the server could not be contacted, and
+            'reused' is True if the handle was opened earlier.
+        """
+        if connect_server is None:
+            connect_server = "localhost"
+        con = self._cons.get(connect_server, -1)
+        if con >= 0:
+            return (con, True)
+        con = pbs_connect(connect_server)
+        if con >= 0:
+            self._cons[connect_server] = con
+        return (con, False)
+    #: m(get)
+
+    def drop(self, connect_server=None):
+        """
+        drop([connect_server])
+            Closes the pooled connection to 'connect_server', if any.
+        """
+        if connect_server is None:
+            connect_server = "localhost"
+        con = self._cons.pop(connect_server, -1)
+        if con >= 0:
+            pbs_disconnect(con)
+    #: m(drop)
+
+    def alive(self, connect_server=None):
+        """
+        alive([connect_server])
+            Returns True if the pooled connection to 'connect_server'
+            still gets replies from the server, probed with a status of
+            the server state. A connection that does not is closed, so
+            that the next get() opens a fresh one.
+        """
+        if connect_server is None:
+            connect_server = "localhost"
+        con = self._cons.get(connect_server, -1)
+        if con < 0:
+            return False
+        (a, nodes) = _attribs_to_attrl([ATTR_status])
+        if pbs_statserver(con, a, None) is not None:
+            return True
+        self.drop(connect_server)
+        return False
+    #: m(alive)
+
+    def close_all(self):
+        """
+        close_all()
+            Closes all the pooled connections.
+        """
+        for server_name in list(self._cons):
+            self.drop(server_name)
+    #: m(close_all)
+
+
+_server_conns = _server_connections()
+
+#
+# _stat_cache: objects returned by pbs_statobj(..., use_cache=True), keyed by
+#              (objtype, name, connect_server, filter_queue, attribs). It
+#              is emptied at the start of every event and by
+#              invalidate_stat_cache().
+_stat_cache = {}
+
+
+def _close_server_connections():
+    try:
+        _server_conns.close_all()
+    except:
+        pass
+
+
+try:
+    import atexit
+    atexit.register(_close_server_connections)
+except:
+    pass
+
+
+def invalidate_stat_cache(objtype=None, name=None):
+    """
+    invalidate_stat_cache([objtype][, name])
+        Discards cached server objects so that the next lookup queries
+        the server again. With no arguments, the whole cache is emptied.
+        Otherwise only entries matching 'objtype' (e.g. "job", "vnode")
+        and/or 'name' are discarded.
+    """
+    if objtype is None and name is None:
+        _stat_cache.clear()
+        return
+    for key in list(_stat_cache):
+        if objtype is not None and key[0] != objtype:
+            continue
+        if name is not None and key[1] != name:
+            continue
+        del _stat_cache[key]
+
+
+#
+# _attribs_to_attrl: converts a list of attribute names, given either as
+#                    "<attribute>" or "<attribute>.<resource>", into an
+#                    attrl list that restricts a stat request to those
+#                    attributes. Returns a tuple (head, nodes) where 'nodes'
+#                    holds every element of the list, since the 'next'
+#                    links alone do not keep them alive.
+def _attribs_to_attrl(attribs):
+    head = None
+    nodes = []
+    for attrib in attribs:
+        a = attrl()
+        if "." in attrib:
+            (a.name, a.resource) = attrib.split(".", 1)
+        else:
+            a.name = attrib
+        a.value = ""
+        a.next = head
+        head = a
+        nodes.append(a)
+    return (head, nodes)
+
+
+#
+# _criteria_to_attropl: converts a dictionary of job selection criteria,
+#                       mapping "<attribute>" or "<attribute>.<resource>"
+#                       to the wanted value, into an attropl list for
+#                       pbs_selstat(). The job's queue is selected through
+#                       the "destination" attribute, as qselect -q does.
+#                       Returns a tuple (head, nodes) like
+#                       _attribs_to_attrl().
+def _criteria_to_attropl(criteria):
+    head = None
+    nodes = []
+    for (attrib, value) in criteria.items():
+        a = attropl()
+        if attrib == ATTR_queue:
+            attrib = ATTR_q
+        if "." in attrib:
+            (a.name, a.resource) = attrib.split(".", 1)
+        else:
+            a.name = attrib
+        a.value = str(value)
+        a.op = EQ
+        a.next = head
+        head = a
+        nodes.append(a)
+    return (head, nodes)
+
+
+#
+# _batch_status_matches: returns True if the batch_status entry 'b' has
+#                        every attribute in 'criteria' set to the wanted
+#                        value. A vnode state matches if the wanted state
+#                        is any of the states reported (e.g. "offline"
+#                        matches "down,offline").
+def _batch_status_matches(b, criteria):
+    for (attrib, value) in criteria.items():
+        if "." in attrib:
+            (n, r) = attrib.split(".", 1)
+        else:
+            (n, r) = (attrib, None)
+        value = str(value)
+        found = False
+        a = b.attribs
+        while(a):
+            if a.name == n and (a.resource or None) == r:
+                if n == ATTR_NODE_state:
+                    found = value in a.value.split(",")
+                else:
+                    found = (a.value == value)
+                break
+            a = a.next
+        if not found:
+            return False
+    return True
+
+
+#
+# _first_match: returns the first batch_status entry, starting at 'b', that
+#               satisfies 'criteria', or None. Entries that are skipped are
+#               never decoded into PBS objects.
+def _first_match(b, criteria):
+    while b and not _batch_status_matches(b, criteria):
+        b = b.next
+    return b
+
+
+#
+# _statobj_batch: issues the stat call matching 'objtype' on connection
+#                 'con', returning a tuple (batch_status, header_str).
+#                 'header_str' is None if 'objtype' is unknown.
+def _statobj_batch(con, objtype, name, attribs=None):
+    a = None
+    if attribs:
+        (a, nodes) = _attribs_to_attrl(attribs)
+    if(objtype == "job"):
+        return (pbs_statjob(con, name, a, None),
+                "pbs.server().job(%s)" % (name,))
+    elif(objtype == "queue"):
+        return (pbs_statque(con, name, a, None),
+                "pbs.server().queue(%s)" % (name,))
+    elif(objtype == "vnode"):
+        return (pbs_statvnode(con, name, a, None),
+                "pbs.server().vnode(%s)" % (name,))
+    elif(objtype == "resv"):
+        return (pbs_statresv(con, name, a, None),
+                "pbs.server().resv(%s)" % (name,))
+    elif(objtype == "server"):
+        return (pbs_statserver(con, a, None), "pbs.server()")
+    return (None, None)
+
+
 #
 # pbs_statobj: general-purpose function that connects to server named
 #           'connect_server' or if None, use "localhost", and depending
@@ -110,10 +342,15 @@ def get_local_nodename():
 #            pbs_statresv(), pbs_statvnode(), or pbs_statserver(), and
 #            returning results in a new object of type _job, _queue,
 #            _resv, _vnode, or _server.
+#            The connection is kept open in _server_conns and reused by
+#            later calls until the hook exits.
 #            NOTE: 'filter_queue' is used for a "job" type, which means
 #                  the job must be in the queue 'filter_queue' for the
 #                  job object to be instantiated.
-def pbs_statobj(objtype, name=None, connect_server=None, filter_queue=None):
+#                  'attribs', if given, restricts the request to the
+#                  listed attributes.
+def pbs_statobj(objtype, name=None, connect_server=None, filter_queue=None,
+                use_cache=False, attribs=None):
     """
     Returns a PBS (e.g. _job, _queue, _resv, _vnode, _server) object
     that is populated with data obtained by calling PBS APIs:
@@ -129,14 +366,39 @@ def pbs_statobj(objtype, name=None, connect_server=None, filter_queue=None):
     'filter_queue' is used for a "job" type, which means
     the job must be in the queue 'filter_queue' for the
     job object to be instantiated.
+
+    If 'use_cache' is True, an object already obtained during the
+    current event is returned instead of querying the server again.
+    See invalidate_stat_cache().
+
+    If 'attribs' is a list of attribute names (e.g. ["state",
+    "resources_available.ncpus"]), only those attributes are requested
+    from the server and set in the returned object; the others are left
+    unset. By default all the attributes are fetched.
     """
 
+    if attribs:
+        attribs = sorted(set(attribs))
+        if filter_queue is not None and ATTR_queue not in attribs:
+            # needed to apply the queue filter below
+            attribs.append(ATTR_queue)
+    else:
+        attribs = None
+
+    if use_cache:
+        key = (objtype, name, connect_server, filter_queue,
+               attribs and tuple(attribs))
+        if key in _stat_cache:
+            return _stat_cache[key]
+        obj = pbs_statobj(objtype, name, connect_server, filter_queue,
+                          attribs=attribs)
+        if obj is not None:
+            _stat_cache[key] = obj
+        return obj
+
     _pbs_v1.set_c_mode()
 
-    if(connect_server == None):
-        con = pbs_connect("localhost")
-    else:
-        con = pbs_connect(connect_server)
+    (con, reused) = _server_conns.get(connect_server)
 
     if con < 0:
         _pbs_v1.logmsg(_pbs_v1.LOG_DEBUG,
@@ -145,28 +407,26 @@ def pbs_statobj(objtype, name=None, connect_server=None, filter_queue=None):
         _pbs_v1.set_python_mode()
         return None
 
-    if(objtype == "job"):
-        bs = pbs_statjob(con, name, None, None)
-        header_str = "pbs.server().job(%s)" % (name,)
-    elif(objtype == "queue"):
-        bs = pbs_statque(con, name, None, None)
-        header_str = "pbs.server().queue(%s)" % (name,)
-    elif(objtype == "vnode"):
-        bs = pbs_statvnode(con, name, None, None)
-        header_str = "pbs.server().vnode(%s)" % (name,)
-    elif(objtype == "resv"):
-        bs = pbs_statresv(con, name, None, None)
-        header_str = "pbs.server().resv(%s)" % (name,)
-    elif(objtype == "server"):
-        bs = pbs_statserver(con, None, None)
-        header_str = "pbs.server()"
-    else:
+    (bs, header_str) = _statobj_batch(con, objtype, name, attribs)
+    if header_str is None:
         _pbs_v1.logmsg(_pbs_v1.LOG_DEBUG,
                        "pbs_statobj: Bad object type %s" % (objtype))
-        pbs_disconnect(con)
         _pbs_v1.set_python_mode()
         return None
 
+    if bs is None and reused and not _server_conns.alive(connect_server):
+        # the pooled connection was closed by the server (e.g. on
+        # restart), so retry once on a fresh one. If the connection is
+        # still good, the object simply does not exist.
+        (con, reused) = _server_conns.get(connect_server)
+        if con < 0:
+            _pbs_v1.logmsg(_pbs_v1.LOG_DEBUG,
+                           "pbs_statobj: Unable to connect to server %s"
+                           % (connect_server))
+            _pbs_v1.set_python_mode()
+            return None
+        (bs, header_str) = _statobj_batch(con, objtype, name, attribs)
+
     server_data_fp = get_server_data_fp()
 
     b = bs
@@ -185,7 +445,6 @@ def pbs_statobj(objtype, name=None, connect_server=None, filter_queue=None):
         else:
             _pbs_v1.logmsg(_pbs_v1.LOG_DEBUG,
                            "pbs_statobj: Bad object type %s" % (objtype))
-            pbs_disconnect(con)
             if server_data_fp:
                 server_data_fp.close()
             _pbs_v1.set_python_mode()
@@ -209,7 +468,6 @@ def pbs_statobj(objtype, name=None, connect_server=None, filter_queue=None):
             elif(objtype == "job"):
                 if((filter_queue != None) and (n == ATTR_queue) and
                         (filter_queue != v)):
-                    pbs_disconnect(con)
                     if server_data_fp:
                         server_data_fp.close()
                     _pbs_v1.set_python_mode()
@@ -265,7 +523,6 @@ def pbs_statobj(objtype, name=None, connect_server=None, filter_queue=None):
 
         b = b.next
 
-    pbs_disconnect(con)
     if server_data_fp:
         server_data_fp.close()
     _pbs_v1.set_python_mode()
@@ -602,8 +859,11 @@ class _queue():
         super(_queue, self).__setattr__(name, value)
     #: m(__setattr__)
 
-    def job(self, jobid):
-        """Return a job object representing jobid that belongs to queue"""
+    def job(self, jobid, attribs=None):
+        """
+        Return a job object representing jobid that belongs to queue.
+        If 'attribs' is given, only the listed attributes are fetched.
+        """
 
         if jobid.find(".") == -1:
             jobid = jobid + "." + _pbs_v1.get_pbs_server_name()
@@ -623,16 +883,20 @@ class _queue():
                 return _pbs_v1.get_job_static(jobid, sn, qn)
 
             return pbs_statobj("job", jobid, self._connect_server,
-                               self.name)
+                               self.name, use_cache=True, attribs=attribs)
         else:
             return _pbs_v1.get_job(jobid, self.name)
     #: m(job)
 
-    def jobs(self):
+    def jobs(self, attribs=None, criteria=None):
         """
             Returns an iterator that loops over the list of jobs on this queue.
+            If 'attribs' is given, only the listed attributes are fetched.
+            If 'criteria' is given (e.g. {"job_state": "R"}), only the jobs
+            with those attribute values are returned.
         """
-        return pbs_iter("jobs", "",  self.name, self._connect_server)
+        return pbs_iter("jobs", "",  self.name, self._connect_server,
+                        attribs=attribs, criteria=criteria)
     #: m(jobs)
 
 #: C(_queue)
@@ -670,10 +934,11 @@ class _server():
         return str(self.name)
     #: m(__str__)
 
-    def queue(self, qname):
+    def queue(self, qname, attribs=None):
         """
-        queue(strQname)
+        queue(strQname[, attribs])
             strQname -  name of a PBS queue (without the @host part) to query.
+            attribs - optional list of the attribute names to fetch.
 
           Returns a queue object representing the queue <queue name> that is
           managed by server s.
@@ -690,15 +955,17 @@ class _server():
                     sn = self._connect_server
                 return _pbs_v1.get_queue_static(qname, sn)
 
-            return pbs_statobj("queue", qname, self._connect_server)
+            return pbs_statobj("queue", qname, self._connect_server,
+                               use_cache=True, attribs=attribs)
         else:
             return _pbs_v1.get_queue(qname)
     #: m(queue)
 
-    def job(self, jobid):
+    def job(self, jobid, attribs=None):
         """
-        job(strJobid)
+        job(strJobid[, attribs])
             strJobid - PBS jobid to query.
+            attribs - optional list of the attribute names to fetch.
           Returns a job object representing jobid
         """
         if jobid.find(".") == -1:
@@ -712,15 +979,18 @@ class _server():
                     sn = self._connect_server
                 return _pbs_v1.get_job_static(jobid, sn, "")
 
-            return pbs_statobj("job", jobid, self._connect_server)
+            return pbs_statobj("job", jobid, self._connect_server,
+                               use_cache=True, attribs=attribs)
         else:
             return _pbs_v1.get_job(jobid)
     #: m(job)
 
-    def vnode(self, vname):
+    def vnode(self, vname, attribs=None):
         """
-        vnode(strVname)
+        vnode(strVname[, attribs])
             strVname - PBS vnode name to query.
+            attribs - optional list of the attribute names to fetch,
+                      e.g. ["state", "resources_available.ncpus"].
           Returns a vnode object representing vname
         """
         if _pbs_v1.get_python_daemon_name() == "pbs_python":
@@ -731,13 +1001,17 @@ class _server():
                     sn = self._connect_server
                 return _pbs_v1.get_vnode_static(vname, sn)
 
-            return pbs_statobj("vnode", vname, self._connect_server)
+            return pbs_statobj("vnode", vname, self._connect_server,
+                               use_cache=True, attribs=attribs)
         else:
             return _pbs_v1.get_vnode(vname)
     #: m(vnode)
 
-    def resv(self, resvid):
-        """Return a resv object representing resvid"""
+    def resv(self, resvid, attribs=None):
+        """
+        Return a resv object representing resvid.
+        If 'attribs' is given, only the listed attributes are fetched.
+        """
 
         if _pbs_v1.get_python_daemon_name() == "pbs_python":
             if _pbs_v1.use_static_data():
@@ -747,14 +1021,16 @@ class _server():
                     sn = self._connect_server
                 return _pbs_v1.get_resv_static(resvid, sn)
 
-            return pbs_statobj("resv", resvid, self._connect_server)
+            return pbs_statobj("resv", resvid, self._connect_server,
+                               use_cache=True, attribs=attribs)
         else:
             return _pbs_v1.get_resv(resvid)
     #: m(resv)
 
     # NAS localmod 014
     if NAS_mod != None and NAS_mod != 0:
-        def jobs(self, ignore_fin=None, qname=None, username=None):
+        def jobs(self, ignore_fin=None, qname=None, username=None,
+                 attribs=None, criteria=None):
             """
             Returns an iterator that loops over the list of jobs
             on this server.
@@ -762,43 +1038,60 @@ class _server():
             - if ignore_fin is an integer != 0, finished jobs are ignored
             - qname returns jobs from that queue
             - username returns jobs with that euser
+            If 'attribs' is given, only the listed attributes are fetched.
             """
 
             return pbs_iter("jobs", "",  qname, self._connect_server,
-                            ignore_fin, username)
+                            ignore_fin, username, attribs, criteria)
         #: m(jobs_nas)
     else:
-        def jobs(self):
+        def jobs(self, attribs=None, criteria=None):
             """
             Returns an iterator that loops over the list of jobs
             on this server.
+            If 'attribs' is given, only the listed attributes are fetched.
+            If 'criteria' is given (e.g. {"job_state": "R"}), the server
+            only returns the jobs with those attribute values.
             """
 
-            return pbs_iter("jobs", "",  "", self._connect_server)
+            return pbs_iter("jobs", "",  "", self._connect_server,
+                            attribs=attribs, criteria=criteria)
         #: m(jobs)
 
-    def vnodes(self):
+    def vnodes(self, attribs=None, criteria=None):
         """
         Returns an iterator that loops over the list of vnodes
         on this server.
+        If 'attribs' is given, only the listed attributes are fetched.
+        If 'criteria' is given (e.g. {"state": "offline"}), only the
+        objects with those attribute values are returned.
         """
 
-        return pbs_iter("vnodes", "",  "", self._connect_server)
+        return pbs_iter("vnodes", "",  "", self._connect_server,
+                        attribs=attribs, criteria=criteria)
     #: m(vnodes)
 
-    def queues(self):
+    def queues(self, attribs=None, criteria=None):
         """
         Returns an iterator that loops over the list of queues on this server.
+        If 'attribs' is given, only the listed attributes are fetched.
+        If 'criteria' is given (e.g. {"enabled": "True"}), only the
+        objects with those attribute values are returned.
         """
-        return pbs_iter("queues", "",  "", self._connect_server)
+        return pbs_iter("queues", "",  "", self._connect_server,
+                        attribs=attribs, criteria=criteria)
     #: m(queues)
 
-    def resvs(self):
+    def resvs(self, attribs=None, criteria=None):
         """
         Returns an iterator that loops over the list of reservations on this
         server.
+        If 'attribs' is given, only the listed attributes are fetched.
+        If 'criteria' is given (e.g. {"queue": "R123"}), only the
+        reservations with those attribute values are returned.
         """
-        return pbs_iter("resvs", "", "", self._connect_server)
+        return pbs_iter("resvs", "", "", self._connect_server,
+                        attribs=attribs, criteria=criteria)
     #: m(resvs)
 
     def scheduler_restart_cycle(self):
@@ -843,7 +1136,7 @@ def server():
         if _pbs_v1.use_static_data():
             return _pbs_v1.get_server_static()
         connect_server = _pbs_v1.get_pbs_server_name()
-        return pbs_statobj("server", None, connect_server)
+        return pbs_statobj("server", None, connect_server, use_cache=True)
     else:
         return _pbs_v1.server()
 #
@@ -880,6 +1173,8 @@ class _event():
         self.requestor = rq_user
         self.requestor_host = rq_host
         self._readonly = False
+        # objects looked up for a previous event are stale
+        _stat_cache.clear()
     #: m(__init__)
 
     def accept(self, ecode=0):
@@ -970,6 +1265,13 @@ class pbs_iter():
                 a list of jobs on <queue_name>@<server_name>
 
     connect_server Name of the pbs server to get various stats.
+    attribs        Optional list of the attribute names to fetch for each
+                   object, when querying the server from pbs_python.
+    criteria       Optional dictionary mapping attribute names to the
+                   values the returned objects must have, when querying
+                   the server from pbs_python. Jobs are selected by the
+                   server itself (see pbs_selstat()); other objects that
+                   do not match are skipped without being decoded.
     """
     # NAS localmod 014
     if NAS_mod != None and NAS_mod != 0:
@@ -982,7 +1284,7 @@ class pbs_iter():
 
         def __init__(self, pbs_obj_name, pbs_filter1, pbs_filter2,
                      connect_server=None, pbs_ignore_fin=None,
-                     pbs_username=None):
+                     pbs_username=None, attribs=None, criteria=None):
 
             self._caller = _pbs_v1.get_python_daemon_name()
             if self._caller == "pbs_python":
@@ -995,6 +1297,7 @@ class pbs_iter():
                     sn = connect_server
 
                 self.type = pbs_obj_name
+                self._criteria = None
                 if _pbs_v1.use_static_data():
                     if(self.type == "jobs"):
                         self.bs = iter(_pbs_v1.get_job_static("", sn, ""))
@@ -1019,6 +1322,14 @@ class pbs_iter():
                                    % (connect_server))
                     return None
 
+                a = None
+                if attribs:
+                    if criteria:
+                        # the values tested by the criteria must be fetched
+                        attribs = list(attribs) + \
+                            [k for k in criteria if k not in attribs]
+                    (a, nodes) = _attribs_to_attrl(attribs)
+
                 if(self.type == "jobs"):
                     _pbs_v1.logmsg(_pbs_v1.LOG_DEBUG,
                                    "pbs_iter: pbs_python mode not"
@@ -1027,11 +1338,14 @@ class pbs_iter():
                     self.con = -1
                     return None
                 elif(self.type == "queues"):
-                    self.bs = pbs_statque(self.con, None, None, None)
+                    self.bs = pbs_statque(self.con, None, a, None)
+                    self._criteria = criteria
                 elif(self.type == "vnodes"):
-                    self.bs = pbs_statvnode(self.con, None, None, None)
+                    self.bs = pbs_statvnode(self.con, None, a, None)
+                    self._criteria = criteria
                 elif(self.type == "resvs"):
-                    self.bs = pbs_statresv(self.con, None, None, None)
+                    self.bs = pbs_statresv(self.con, None, a, None)
+                    self._criteria = criteria
                 else:
                     _pbs_v1.logmsg(_pbs_v1.LOG_DEBUG,
                                    "pbs_iter/init: Bad object iterator type %s"
@@ -1063,7 +1377,8 @@ class pbs_iter():
                     self.ignore_fin, self.filter_user)
     else:
         def __init__(self, pbs_obj_name, pbs_filter1,
-                     pbs_filter2, connect_server=None):
+                     pbs_filter2, connect_server=None, attribs=None,
+                     criteria=None):
 
             self._caller = _pbs_v1.get_python_daemon_name()
             if self._caller == "pbs_python":
@@ -1076,6 +1391,7 @@ class pbs_iter():
                     sn = connect_server
 
                 self.type = pbs_obj_name
+                self._criteria = None
                 if _pbs_v1.use_static_data():
                     if(self.type == "jobs"):
                         self.bs = iter(_pbs_v1.get_job_static("", sn, ""))
@@ -1100,14 +1416,32 @@ class pbs_iter():
                                    % (connect_server))
                     return None
 
+                a = None
+                if attribs:
+                    if criteria:
+                        # the values tested by the criteria must be fetched
+                        attribs = list(attribs) + \
+                            [k for k in criteria if k not in attribs]
+                    (a, nodes) = _attribs_to_attrl(attribs)
+
                 if(self.type == "jobs"):
-                    self.bs = pbs_statjob(self.con, pbs_filter2, None, None)
+                    if criteria:
+                        criteria = dict(criteria)
+                        if pbs_filter2:
+                            criteria[ATTR_queue] = pbs_filter2
+                        (c, cnodes) = _criteria_to_attropl(criteria)
+                        self.bs = pbs_selstat(self.con, c, a, None)
+                    else:
+                        self.bs = pbs_statjob(self.con, pbs_filter2, a, None)
                 elif(self.type == "queues"):
-                    self.bs = pbs_statque(self.con, None, None, None)
+                    self.bs = pbs_statque(self.con, None, a, None)
+                    self._criteria = criteria
                 elif(self.type == "vnodes"):
-                    self.bs = pbs_statvnode(self.con, None, None, None)
+                    self.bs = pbs_statvnode(self.con, None, a, None)
+                    self._criteria = criteria
                 elif(self.type == "resvs"):
-                    self.bs = pbs_statresv(self.con, None, None, None)
+                    self.bs = pbs_statresv(self.con, None, a, None)
+                    self._criteria = criteria
                 else:
                     _pbs_v1.logmsg(_pbs_v1.LOG_DEBUG,
                                    "pbs_iter/init: Bad object iterator type %s"
@@ -1132,6 +1466,8 @@ class pbs_iter():
     if NAS_mod != None and NAS_mod != 0:
         def __next__(self):
             if self._caller == "pbs_python":
+                if self._criteria:
+                    self.bs = _first_match(self.bs, self._criteria)
                 if not hasattr(self, "bs") or self.bs == None:
                     if not _pbs_v1.use_static_data():
                         pbs_disconnect(self.con)
@@ -1279,6 +1615,8 @@ class pbs_iter():
     else:
         def __next__(self):
             if self._caller == "pbs_python":
+                if self._criteria:
+                    self.bs = _first_match(self.bs, self._criteria)
                 if not hasattr(self, "bs") or self.bs == None:
                     if not _pbs_v1.use_static_data():
                         pbs_disconnect(self.con)
@@ -1369,7 +1707,7 @@ class pbs_iter():
                             if (pr == None):
                                 _pbs_v1.logmsg(_pbs_v1.LOG_DEBUG,
                                                "pbs_statobj: missing %s" % (n))
-                                a = a.__next__
+                                a = a.next
                                 continue
 
                             vo = getattr(pr, r)
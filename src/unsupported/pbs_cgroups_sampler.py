@@ -0,0 +1,484 @@
+#!/usr/bin/env python3
+# coding: utf-8
+
+# Copyright (C) 1994-2021 Altair Engineering, Inc.
+# For more information, contact Altair at www.altair.com.
+#
+# This file is part of both the OpenPBS software ("OpenPBS")
+# and the PBS Professional ("PBS Pro") software.
+#
+# Open Source License Information:
+#
+# OpenPBS is free software. You can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# OpenPBS is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Commercial License Information:
+#
+# PBS Pro is commercially licensed software that shares a common core with
+# the OpenPBS software.  For a copy of the commercial license terms and
+# conditions, go to: (http://www.pbspro.com/agreement.html) or contact the
+# Altair Legal Department.
+#
+# Altair's dual-license business model allows companies, individuals, and
+# organizations to create proprietary derivative works of OpenPBS and
+# distribute them - whether embedded or bundled with other software -
+# under a commercial license agreement.
+#
+# Use of Altair's trademarks, including but not limited to "PBS™",
+# "OpenPBS®", "PBS Professional®", and "PBS Pro™" and Altair's logos is
+# subject to Altair's trademark licensing policies.
+
+
+"""
+Sample the cgroups of PBS jobs into a ring buffer.
+
+This optional service runs on execution hosts that use the pbs_cgroups
+hook. It reads the counters of every job cgroup at a fixed rate and
+appends them to a ring buffer kept in a memory mapped file. When the
+hook configuration sets "usage_sampler_file" to the same file, the
+exechost_periodic event reads the aggregated values from the buffer
+instead of sampling the cgroups itself. Memory peaks are then tracked
+at the sampling rate and cpupercent is averaged over the samples.
+The I/O of the jobs is reported as resources_used.io_bytes if the hook
+configuration also enables "report_io_bytes" and io_bytes is defined
+on the server as a size resource.
+
+Usage:
+    pbs_cgroups_sampler.py [-r root] [-p prefix] [-f file] [-i interval]
+                           [-s slots] [-n count]
+    pbs_cgroups_sampler.py --dump [-f file] [-w window]
+
+--dump prints the usage aggregated from the buffer as JSON and exits.
+The cgroup root may point to a copy of the cgroup tree for testing.
+
+The layout of the buffer must be kept in sync with UsageSampleReader
+in pbs_cgroups.PY.
+"""
+
+import argparse
+import json
+import mmap
+import os
+import signal
+import struct
+import sys
+import time
+
+# Buffer layout: a header followed by a fixed number of record slots.
+# Header: magic, version, record size, slots, interval, number of
+# records written, time of the last write and the sampler PID.
+MAGIC = b'PBSCGSR1'
+VERSION = 1
+HEADER = struct.Struct('<8sIIIdQdI')
+HEADER_SIZE = 64
+# Record: sequence number, time, job ID, the values in FIELDS and the
+# sequence number again. A record is only valid if both sequence
+# numbers match the position it is read from.
+FIELDS = ('mem', 'vmem', 'hpmem', 'cput', 'io_bytes',
+          'mem_failcnt', 'vmem_failcnt', 'hpmem_failcnt')
+RECORD = struct.Struct('<Qd64s%dQQ' % len(FIELDS))
+# Value stored for counters that could not be read
+NONE = 0xFFFFFFFFFFFFFFFF
+# Values that are peaks, kept as the maximum of all samples
+PEAKS = ('mem', 'vmem', 'hpmem')
+
+
+#
+# CLASS SampleBuffer
+#
+class SampleBuffer(object):
+    """
+    Ring buffer of usage samples in a memory mapped file
+    """
+
+    def __init__(self, path, slots=4096, writable=False):
+        self.path = path
+        self.slots = slots
+        self.writable = writable
+        self.head = 0
+        self.mmap = None
+        self.fd = -1
+
+    def __repr__(self):
+        return ('SampleBuffer(%s, %s, %s)' %
+                (repr(self.path), repr(self.slots), repr(self.writable)))
+
+    def _size(self):
+        return HEADER_SIZE + self.slots * RECORD.size
+
+    def open(self, interval=0.0):
+        """
+        Map the buffer. A writer reuses an existing buffer with the same
+        layout, so the samples survive a restart, and creates it otherwise.
+        """
+        if not self.writable:
+            self.fd = os.open(self.path, os.O_RDONLY)
+            self.mmap = mmap.mmap(self.fd, 0, access=mmap.ACCESS_READ)
+            header = self.header()
+            if header is None:
+                raise ValueError('Invalid sample buffer: %s' % self.path)
+            self.slots = header['slots']
+            return
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        reuse = os.fstat(self.fd).st_size == self._size()
+        if not reuse:
+            os.ftruncate(self.fd, self._size())
+        self.mmap = mmap.mmap(self.fd, self._size())
+        header = self.header()
+        if reuse and header is not None and header['slots'] == self.slots:
+            self.head = header['head']
+        else:
+            self.mmap[:] = b'\0' * self._size()
+            self.head = 0
+        self._write_header(interval, time.time())
+
+    def close(self):
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def header(self):
+        """
+        Return the header as a dictionary, or None if it is not valid
+        """
+        if len(self.mmap) < HEADER_SIZE:
+            return None
+        (magic, version, record_size, slots, interval, head, updated,
+         pid) = HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC or version != VERSION or \
+                record_size != RECORD.size or slots == 0 or \
+                len(self.mmap) < HEADER_SIZE + slots * record_size:
+            return None
+        return {'slots': slots, 'interval': interval, 'head': head,
+                'updated': updated, 'pid': pid}
+
+    def _write_header(self, interval, updated):
+        HEADER.pack_into(self.mmap, 0, MAGIC, VERSION, RECORD.size,
+                         self.slots, interval, self.head, updated,
+                         os.getpid())
+
+    def append(self, records, interval):
+        """
+        Append (time, jobid, values) records and publish the new head
+        """
+        for timestamp, jobid, values in records:
+            seq = self.head + 1
+            offset = HEADER_SIZE + (self.head % self.slots) * RECORD.size
+            args = [seq, timestamp, jobid.encode('utf-8')[:64]]
+            for field in FIELDS:
+                value = values.get(field)
+                args.append(NONE if value is None else int(value))
+            args.append(seq)
+            RECORD.pack_into(self.mmap, offset, *args)
+            self.head += 1
+        self._write_header(interval, time.time())
+
+    def records(self):
+        """
+        Yield the valid (time, jobid, values) records, oldest first
+        """
+        header = self.header()
+        if header is None:
+            return
+        head = header['head']
+        for seq in range(max(0, head - self.slots), head):
+            offset = HEADER_SIZE + (seq % self.slots) * RECORD.size
+            record = RECORD.unpack_from(self.mmap, offset)
+            if record[0] != seq + 1 or record[-1] != seq + 1:
+                # Overwritten while it was read
+                continue
+            values = {}
+            for field, value in zip(FIELDS, record[3:-1]):
+                if value != NONE:
+                    values[field] = value
+            yield (record[1], record[2].rstrip(b'\0').decode('utf-8'),
+                   values)
+
+
+def aggregate(records, jobids=None, window=120.0, now=None):
+    """
+    Aggregate the records of each job. The peaks are the maximum of all
+    samples, the counters come from the latest sample and cpupercent is
+    averaged over the samples taken in the last window seconds.
+    """
+    if now is None:
+        now = time.time()
+    usage = {}
+    first = {}
+    for timestamp, jobid, values in records:
+        if jobids is not None and jobid not in jobids:
+            continue
+        result = usage.setdefault(jobid, {})
+        for field, value in values.items():
+            if field in PEAKS:
+                result[field] = max(value, result.get(field, 0))
+            else:
+                result[field] = value
+        if 'cput' not in values:
+            continue
+        if timestamp >= now - window and jobid not in first:
+            first[jobid] = (timestamp, values['cput'])
+        if jobid in first and timestamp > first[jobid][0]:
+            elapsed = timestamp - first[jobid][0]
+            used = (values['cput'] - first[jobid][1]) / 1e9
+            result['cpupercent'] = max(0, int(100.0 * used / elapsed))
+    return usage
+
+
+#
+# CLASS CgroupSampler
+#
+class CgroupSampler(object):
+    """
+    Read the counters of the job cgroups under a cgroup v1 or v2 tree
+    """
+
+    def __init__(self, root, prefix='pbs_jobs'):
+        self.root = root
+        self.prefix = prefix
+        self.cgroup_version = 1
+        if os.path.isfile(os.path.join(root, 'cgroup.controllers')):
+            self.cgroup_version = 2
+        # Peaks observed for each job, for kernels without peak counters
+        self.peaks = {}
+
+    def __repr__(self):
+        return 'CgroupSampler(%s, %s)' % (repr(self.root), repr(self.prefix))
+
+    def _jobs_dir(self, subsys=''):
+        return os.path.join(self.root, subsys, self.prefix + '.service',
+                            'jobid')
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, 'r') as desc:
+                return desc.read()
+        except (IOError, OSError):
+            return None
+
+    def _read_int(self, path):
+        data = self._read(path)
+        if data is None:
+            return None
+        try:
+            return int(data.split()[0])
+        except (IndexError, ValueError):
+            return None
+
+    def _read_key(self, path, key):
+        """
+        Return the value of a "key value" line of a cgroup file
+        """
+        data = self._read(path)
+        if data is None:
+            return None
+        for line in data.splitlines():
+            fields = line.split()
+            if len(fields) == 2 and fields[0] == key:
+                try:
+                    return int(fields[1])
+                except ValueError:
+                    return None
+        return None
+
+    def _read_io(self, path):
+        """
+        Return the bytes read and written from a blkio or io.stat file
+        """
+        data = self._read(path)
+        if data is None:
+            return None
+        total = 0
+        for line in data.splitlines():
+            fields = line.split()
+            if self.cgroup_version == 2:
+                for field in fields[1:]:
+                    name, _, value = field.partition('=')
+                    if name in ('rbytes', 'wbytes'):
+                        total += int(value)
+            elif len(fields) == 2 and fields[0] == 'Total':
+                return int(fields[1])
+        return total
+
+    def _listdir(self, path):
+        try:
+            return [name for name in os.listdir(path)
+                    if name[:1].isdigit() and
+                    os.path.isdir(os.path.join(path, name))]
+        except OSError:
+            return []
+
+    def jobs(self):
+        """
+        Return the job IDs that have a cgroup
+        """
+        if self.cgroup_version == 2:
+            return sorted(self._listdir(self._jobs_dir()))
+        jobids = set()
+        for subsys in ('memory', 'cpuacct', 'hugetlb', 'blkio'):
+            jobids.update(self._listdir(self._jobs_dir(subsys)))
+        return sorted(jobids)
+
+    @staticmethod
+    def _max(*values):
+        """
+        Return the largest of the values that are not None, or None
+        """
+        values = [val for val in values if val is not None]
+        if not values:
+            return None
+        return max(values)
+
+    def _sample_v1(self, jobid):
+        values = {}
+        memdir = os.path.join(self._jobs_dir('memory'), jobid)
+        for field, name in (('mem', 'memory.'), ('vmem', 'memory.memsw.')):
+            path = os.path.join(memdir, name)
+            values[field] = self._max(
+                self._read_int(path + 'usage_in_bytes'),
+                self._read_int(path + 'max_usage_in_bytes'))
+            values[field + '_failcnt'] = self._read_int(path + 'failcnt')
+        path = os.path.join(self._jobs_dir('hugetlb'), jobid, 'hugetlb.2MB.')
+        values['hpmem'] = self._max(
+            self._read_int(path + 'usage_in_bytes'),
+            self._read_int(path + 'max_usage_in_bytes'))
+        values['hpmem_failcnt'] = self._read_int(path + 'failcnt')
+        values['cput'] = self._read_int(
+            os.path.join(self._jobs_dir('cpuacct'), jobid, 'cpuacct.usage'))
+        values['io_bytes'] = self._read_io(
+            os.path.join(self._jobs_dir('blkio'), jobid,
+                         'blkio.throttle.io_service_bytes'))
+        return values
+
+    def _sample_v2(self, jobid):
+        values = {}
+        path = os.path.join(self._jobs_dir(), jobid)
+        mem = self._max(
+            self._read_int(os.path.join(path, 'memory.current')),
+            self._read_int(os.path.join(path, 'memory.peak')))
+        swap = self._max(
+            self._read_int(os.path.join(path, 'memory.swap.current')),
+            self._read_int(os.path.join(path, 'memory.swap.peak')))
+        values['mem'] = mem
+        if mem is not None and swap is not None:
+            # memory.swap.* does not include memory
+            values['vmem'] = swap + mem
+        values['hpmem'] = self._read_int(
+            os.path.join(path, 'hugetlb.2MB.current'))
+        values['mem_failcnt'] = self._read_key(
+            os.path.join(path, 'memory.events'), 'max')
+        values['vmem_failcnt'] = self._read_key(
+            os.path.join(path, 'memory.swap.events'), 'max')
+        values['hpmem_failcnt'] = self._read_key(
+            os.path.join(path, 'hugetlb.2MB.events'), 'max')
+        usec = self._read_key(os.path.join(path, 'cpu.stat'), 'usage_usec')
+        if usec is not None:
+            values['cput'] = usec * 1000
+        values['io_bytes'] = self._read_io(os.path.join(path, 'io.stat'))
+        return values
+
+    def sample(self):
+        """
+        Return a (time, jobid, values) record for every job cgroup
+        """
+        timestamp = time.time()
+        records = []
+        jobids = self.jobs()
+        for jobid in jobids:
+            if self.cgroup_version == 2:
+                values = self._sample_v2(jobid)
+            else:
+                values = self._sample_v1(jobid)
+            peaks = self.peaks.setdefault(jobid, {})
+            for field in PEAKS:
+                if values.get(field) is not None:
+                    peaks[field] = max(values[field], peaks.get(field, 0))
+                    values[field] = peaks[field]
+            records.append((timestamp, jobid, values))
+        for jobid in list(self.peaks):
+            if jobid not in jobids:
+                del self.peaks[jobid]
+        return records
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Sample the cgroups of PBS jobs into a ring buffer')
+    parser.add_argument('-r', '--root', default='/sys/fs/cgroup',
+                        help='cgroup mount point (default: %(default)s)')
+    parser.add_argument('-p', '--prefix', default='pbs_jobs',
+                        help='cgroup_prefix of the hook '
+                        '(default: %(default)s)')
+    parser.add_argument('-f', '--file',
+                        default='/dev/shm/pbs_cgroups_samples',
+                        help='ring buffer file (default: %(default)s)')
+    parser.add_argument('-i', '--interval', type=float, default=1.0,
+                        help='seconds between samples (default: '
+                        '%(default)s)')
+    parser.add_argument('-s', '--slots', type=int, default=65536,
+                        help='records kept in the buffer (default: '
+                        '%(default)s)')
+    parser.add_argument('-n', '--count', type=int, default=0,
+                        help='exit after this many samples (default: run '
+                        'until terminated)')
+    parser.add_argument('-d', '--dump', action='store_true',
+                        help='print the aggregated usage as JSON and exit')
+    parser.add_argument('-w', '--window', type=float, default=120.0,
+                        help='seconds cpupercent is averaged over with '
+                        '--dump (default: %(default)s)')
+    args = parser.parse_args()
+    if args.interval <= 0 or args.slots <= 0:
+        parser.error('interval and slots must be positive')
+
+    if args.dump:
+        buf = SampleBuffer(args.file)
+        buf.open()
+        try:
+            json.dump(aggregate(buf.records(), window=args.window),
+                      sys.stdout, indent=4, sort_keys=True)
+            sys.stdout.write('\n')
+        finally:
+            buf.close()
+        return 0
+
+    # Exit cleanly, leaving a consistent buffer, when terminated
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    sampler = CgroupSampler(args.root, args.prefix)
+    buf = SampleBuffer(args.file, args.slots, writable=True)
+    buf.open(args.interval)
+    try:
+        count = 0
+        deadline = time.time()
+        while not args.count or count < args.count:
+            buf.append(sampler.sample(), args.interval)
+            count += 1
+            if args.count and count >= args.count:
+                break
+            # Keep a fixed rate regardless of how long sampling took
+            deadline += args.interval
+            delay = deadline - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                deadline = time.time()
+    finally:
+        buf.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
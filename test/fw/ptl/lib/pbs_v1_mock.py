@@ -0,0 +1,578 @@
+# coding: utf-8
+
+# Copyright (C) 1994-2021 Altair Engineering, Inc.
+# For more information, contact Altair at www.altair.com.
+#
+# This file is part of both the OpenPBS software ("OpenPBS")
+# and the PBS Professional ("PBS Pro") software.
+#
+# Open Source License Information:
+#
+# OpenPBS is free software. You can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# OpenPBS is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Commercial License Information:
+#
+# PBS Pro is commercially licensed software that shares a common core with
+# the OpenPBS software.  For a copy of the commercial license terms and
+# conditions, go to: (http://www.pbspro.com/agreement.html) or contact the
+# Altair Legal Department.
+#
+# Altair's dual-license business model allows companies, individuals, and
+# organizations to create proprietary derivative works of OpenPBS and
+# distribute them - whether embedded or bundled with other software -
+# under a commercial license agreement.
+#
+# Use of Altair's trademarks, including but not limited to "PBS™",
+# "OpenPBS®", "PBS Professional®", and "PBS Pro™" and Altair's logos is
+# subject to Altair's trademark licensing policies.
+
+"""
+Stand-in for the _pbs_v1 C extension module, so that the pure Python
+part of the hook runtime (pbs.v1) can be imported and exercised outside
+of the PBS daemons, e.g. by bin/pbs_hook_bench, and hook scripts loaded
+on top of it with load_hook().
+
+Only what the Python runtime itself calls into is provided. Values are
+not validated and nothing is sent to a server, so any measurement made
+against it covers the Python side of the runtime only.
+"""
+
+import os
+import re
+import sys
+import types
+
+# Vnode state constants
+ND_STATE_FREE = 0x00
+ND_STATE_OFFLINE = 0x01
+ND_STATE_DOWN = 0x02
+ND_STATE_DELETED = 0x04
+ND_STATE_UNRESOLVABLE = 0x08
+ND_STATE_JOBBUSY = 0x10
+ND_STATE_STALE = 0x20
+ND_STATE_JOB_EXCLUSIVE = 0x40
+ND_STATE_BUSY = 0x80
+ND_STATE_UNKNOWN = 0x100
+ND_STATE_NEEDS_HELLOSVR = 0x200
+ND_STATE_INIT = 0x400
+ND_STATE_PROV = 0x800
+ND_STATE_WAIT_PROV = 0x1000
+ND_STATE_RESV_EXCLUSIVE = 0x2000
+ND_STATE_OFFLINE_BY_MOM = 0x4000
+ND_STATE_MARKEDDOWN = 0x8000
+ND_STATE_NEED_ADDRS = 0x10000
+ND_STATE_MAINTENANCE = 0x20000
+ND_STATE_SLEEP = 0x40000
+ND_STATE_NEED_CREDENTIALS = 0x80000
+ND_STATE_VNODE_AVAILABLE = (ND_STATE_FREE | ND_STATE_JOBBUSY |
+                            ND_STATE_JOB_EXCLUSIVE |
+                            ND_STATE_RESV_EXCLUSIVE | ND_STATE_BUSY)
+ND_STATE_VNODE_UNAVAILABLE = (ND_STATE_STALE | ND_STATE_OFFLINE |
+                              ND_STATE_DOWN | ND_STATE_DELETED |
+                              ND_STATE_UNKNOWN | ND_STATE_UNRESOLVABLE |
+                              ND_STATE_OFFLINE_BY_MOM |
+                              ND_STATE_MAINTENANCE | ND_STATE_SLEEP)
+
+# Vnode type and sharing constants
+ND_PBS = 0
+ND_DEFAULT_SHARED = 1
+ND_DEFAULT_EXCL = 2
+ND_IGNORE_EXCL = 3
+ND_FORCE_EXCL = 4
+ND_DEFAULT_EXCLHOST = 5
+ND_FORCE_EXCLHOST = 6
+
+# Job states
+JOB_STATE_TRANSIT = 0
+JOB_STATE_QUEUED = 1
+JOB_STATE_HELD = 2
+JOB_STATE_WAITING = 3
+JOB_STATE_RUNNING = 4
+JOB_STATE_EXITING = 5
+JOB_STATE_EXPIRED = 6
+JOB_STATE_BEGUN = 7
+JOB_STATE_MOVED = 8
+JOB_STATE_FINISHED = 9
+JOB_STATE_SUSPEND = 400
+JOB_STATE_SUSPEND_USERACTIVE = 410
+
+# Server states and queue types
+SV_STATE_IDLE = 1
+SV_STATE_HOT = 2
+SV_STATE_ACTIVE = 3
+SV_STATE_SHUTDEL = 4
+SV_STATE_SHUTIMM = 5
+SV_STATE_SHUTSIG = 6
+QTYPE_EXECUTION = 1
+QTYPE_ROUTE = 2
+
+# Log message severity
+LOG_DEBUG = 0x0005
+LOG_WARNING = 0x0006
+LOG_ERROR = 0x0007
+
+# Log events levels
+EVENT_ERROR = 0x0001
+EVENT_SYSTEM = 0x0002
+EVENT_ADMIN = 0x0004
+EVENT_JOB = 0x0008
+EVENT_JOB_USAGE = 0x0010
+EVENT_SECURITY = 0x0020
+EVENT_SCHED = 0x0040
+EVENT_DEBUG = 0x0080
+EVENT_DEBUG2 = 0x0100
+EVENT_RESV = 0x0200
+EVENT_DEBUG3 = 0x0400
+EVENT_DEBUG4 = 0x0800
+EVENT_FORCE = 0x8000
+
+# Event types
+QUEUEJOB = 0x01
+MODIFYJOB = 0x02
+RESVSUB = 0x04
+MOVEJOB = 0x08
+RUNJOB = 0x10
+PROVISION = 0x20
+EXECJOB_BEGIN = 0x40
+EXECJOB_PROLOGUE = 0x80
+EXECJOB_EPILOGUE = 0x100
+EXECJOB_END = 0x200
+EXECJOB_PRETERM = 0x400
+EXECJOB_LAUNCH = 0x800
+EXECHOST_PERIODIC = 0x1000
+EXECHOST_STARTUP = 0x2000
+EXECJOB_ATTACH = 0x4000
+PERIODIC = 0x8000
+RESV_END = 0x10000
+EXECJOB_RESIZE = 0x20000
+EXECJOB_ABORT = 0x40000
+EXECJOB_POSTSUSPEND = 0x80000
+EXECJOB_PRERESUME = 0x100000
+MANAGEMENT = 0x200000
+MODIFYVNODE = 0x400000
+MOM_EVENTS = (EXECJOB_BEGIN | EXECJOB_PROLOGUE | EXECJOB_EPILOGUE |
+              EXECJOB_END | EXECJOB_PRETERM | EXECHOST_PERIODIC |
+              EXECJOB_LAUNCH | EXECHOST_STARTUP | EXECJOB_ATTACH |
+              EXECJOB_RESIZE | EXECJOB_ABORT | EXECJOB_POSTSUSPEND |
+              EXECJOB_PRERESUME)
+
+_WORDSIZE = 8
+_SIZE_RE = re.compile(r'^(\d+)([kmgtp]?)([bw]?)$', re.IGNORECASE)
+_SIZE_SHIFTS = {'': 0, 'k': 10, 'm': 20, 'g': 30, 't': 40, 'p': 50}
+_SIZE_SUFFIXES = dict((v, k) for (k, v) in _SIZE_SHIFTS.items())
+
+_VNODE_STATES = {
+    'free': ND_STATE_FREE,
+    'offline': ND_STATE_OFFLINE,
+    'offline_by_mom': ND_STATE_OFFLINE_BY_MOM,
+    'down': ND_STATE_DOWN,
+    'Stale': ND_STATE_STALE,
+    'job-busy': ND_STATE_JOBBUSY,
+    'job-exclusive': ND_STATE_JOB_EXCLUSIVE,
+    'resv-exclusive': ND_STATE_RESV_EXCLUSIVE,
+    'busy': ND_STATE_BUSY,
+    'state-unknown': ND_STATE_UNKNOWN,
+    'provisioning': ND_STATE_PROV,
+    'wait-provisioning': ND_STATE_WAIT_PROV,
+    'maintenance': ND_STATE_MAINTENANCE,
+    'initializing': ND_STATE_INIT,
+    'unresolvable': ND_STATE_UNRESOLVABLE,
+    'sleep': ND_STATE_SLEEP
+}
+_VNODE_SHARING = {
+    'default_shared': ND_DEFAULT_SHARED,
+    'default_excl': ND_DEFAULT_EXCL,
+    'ignore_excl': ND_IGNORE_EXCL,
+    'force_excl': ND_FORCE_EXCL,
+    'default_exclhost': ND_DEFAULT_EXCLHOST,
+    'force_exclhost': ND_FORCE_EXCLHOST
+}
+
+_python_mode = True
+_pbs_statobj = None
+_event = None
+
+#
+# log_event_mask: the event classes that will_logmsg() reports as logged,
+#                 like the $logevent setting of a MoM
+log_event_mask = 0x1ff
+
+
+class _size:
+    """
+    Python equivalent of the _size type of the C module: a number of
+    bytes or words with an optional k, m, g, t or p multiplier.
+    """
+
+    def __init__(self, value):
+        if isinstance(value, _size):
+            (self._num, self._shift, self._words) = \
+                (value._num, value._shift, value._words)
+        elif isinstance(value, str):
+            m = _SIZE_RE.match(value.strip())
+            if m is None:
+                raise TypeError('%s: bad value for _size' % (value,))
+            self._num = int(m.group(1))
+            self._shift = _SIZE_SHIFTS[m.group(2).lower()]
+            self._words = m.group(3).lower() == 'w'
+        elif isinstance(value, int):
+            if value < 0:
+                raise TypeError('_size instance cannot be negative')
+            (self._num, self._shift, self._words) = (value, 0, False)
+        else:
+            raise TypeError('Bad _size value')
+
+    def __str__(self):
+        return '%d%s%s' % (self._num, _SIZE_SUFFIXES[self._shift],
+                           'w' if self._words else 'b')
+
+    __repr__ = __str__
+
+    def _normalize(self, other):
+        """
+        Return the number of self and other in a common unit, rounding
+        plain bytes up to kilobytes as normalize_size() does.
+        """
+        sizes = []
+        for s in (self, other):
+            num = s._num
+            if s._words and not (self._words and other._words):
+                num *= _WORDSIZE
+            shift = s._shift
+            if shift == 0:
+                num = (num + 1023) >> 10
+                shift = 10
+            sizes.append([num, shift])
+        low = min(sizes[0][1], sizes[1][1])
+        for s in sizes:
+            s[0] <<= s[1] - low
+        return (sizes[0][0], sizes[1][0], low,
+                self._words and other._words)
+
+    def _compare(self, other):
+        if not isinstance(other, _size):
+            return None
+        (a, b, shift, words) = self._normalize(other)
+        return (a > b) - (a < b)
+
+    def __eq__(self, other):
+        c = self._compare(other)
+        return c is not None and c == 0
+
+    def __ne__(self, other):
+        c = self._compare(other)
+        return c is not None and c != 0
+
+    def __lt__(self, other):
+        c = self._compare(other)
+        return c is not None and c < 0
+
+    def __le__(self, other):
+        c = self._compare(other)
+        return c is not None and c <= 0
+
+    def __gt__(self, other):
+        c = self._compare(other)
+        return c is not None and c > 0
+
+    def __ge__(self, other):
+        c = self._compare(other)
+        return c is not None and c >= 0
+
+    __hash__ = object.__hash__
+
+    def _from_num(self, num, shift, words):
+        s = _size(0)
+        (s._num, s._shift, s._words) = (num, shift, words)
+        return s
+
+    def __add__(self, other):
+        if not isinstance(other, _size):
+            return NotImplemented
+        (a, b, shift, words) = self._normalize(other)
+        return self._from_num(a + b, shift, words)
+
+    def __sub__(self, other):
+        if not isinstance(other, _size):
+            return NotImplemented
+        (a, b, shift, words) = self._normalize(other)
+        if b > a:
+            raise ArithmeticError(
+                'expression evaluates to wrong _size value (underflow?)')
+        return self._from_num(a - b, shift, words)
+
+
+svr_types = types.SimpleNamespace(_size=_size)
+
+
+def logmsg(level, msg):
+    pass
+
+
+def logjobmsg(jobid, msg):
+    pass
+
+
+def will_logmsg(level):
+    if level in (LOG_DEBUG, LOG_WARNING, LOG_ERROR):
+        level = EVENT_ADMIN | EVENT_SYSTEM
+    return bool(level & (log_event_mask | EVENT_FORCE))
+
+
+def wordsize():
+    return _WORDSIZE
+
+
+def in_python_mode():
+    return _python_mode
+
+
+def set_python_mode():
+    global _python_mode
+    _python_mode = True
+
+
+def set_c_mode():
+    global _python_mode
+    _python_mode = False
+
+
+def in_site_hook():
+    return True
+
+
+def get_python_daemon_name():
+    return 'pbs_python'
+
+
+def use_static_data():
+    return False
+
+
+def get_pbs_conf():
+    return {}
+
+
+def get_server_data_file():
+    return None
+
+
+def get_local_host_name():
+    return 'localhost'
+
+
+def get_pbs_server_name():
+    return 'localhost'
+
+
+def set_pbs_statobj(func):
+    global _pbs_statobj
+    _pbs_statobj = func
+
+
+def is_attrib_val_settable(descr, obj, value):
+    return True
+
+
+def validate_input(table, name, value):
+    pass
+
+
+def duration_to_secs(value):
+    secs = 0
+    for part in str(value).split('.')[0].split(':'):
+        secs = secs * 60 + int(part)
+    return secs
+
+
+def size_to_kbytes(sz):
+    s = _size(str(sz))
+    num = s._num * (_WORDSIZE if s._words else 1)
+    if s._shift == 0:
+        return (num + 1023) >> 10
+    return num << (s._shift - 10)
+
+
+def str_to_vnode_state(value):
+    state = 0
+    for s in str(value).split(','):
+        state |= _VNODE_STATES.get(s.strip(), 0)
+    return state
+
+
+def vnode_state_to_str(value):
+    if value == ND_STATE_FREE:
+        return 'free'
+    names = [k for (k, v) in _VNODE_STATES.items() if v and value & v]
+    return ','.join(names)
+
+
+def str_to_vnode_ntype(value):
+    return ND_PBS
+
+
+def vnode_ntype_to_str(value):
+    return 'PBS' if value == ND_PBS else ''
+
+
+def str_to_vnode_sharing(value):
+    return _VNODE_SHARING.get(value, 0)
+
+
+def vnode_sharing_to_str(value):
+    for (k, v) in _VNODE_SHARING.items():
+        if v == value:
+            return k
+    return ''
+
+
+def set_event(ev):
+    """
+    Set the object returned by event(), like the C layer does before
+    running a hook script.
+    """
+    global _event
+    _event = ev
+
+
+def event():
+    return _event
+
+
+def _event_accept():
+    pass
+
+
+def _event_reject(msg=None):
+    pass
+
+
+def _event_param_mod_allow():
+    pass
+
+
+def _event_param_mod_disallow():
+    pass
+
+
+def mark_vnode_set(vnode_name, attr_name, value):
+    pass
+
+
+def load_resource_value(resc):
+    pass
+
+
+def resource_str_value(resc):
+    return ''
+
+
+def iter_nextfunc(*args):
+    return None
+
+
+def server():
+    return None
+
+
+def get_job(*args):
+    return None
+
+
+def get_queue(*args):
+    return None
+
+
+def get_resv(*args):
+    return None
+
+
+def get_vnode(*args):
+    return None
+
+
+def release_nodes(*args):
+    return None
+
+
+def reboot(*args):
+    pass
+
+
+def scheduler_restart_cycle(*args):
+    pass
+
+
+# vnode attributes defined by load_pbs(), with the types of their values
+_VNODE_ATTRIBUTES = [('comment', (str,))]
+
+
+def load_pbs(pbs_dir, pbs_ifl=None):
+    """
+    Import the pbs package from directory 'pbs_dir' on top of this mock
+    and return it.  'pbs_ifl' is the module standing in for the pbs_ifl
+    module of pbs_python; by default no server can be connected to.
+    The runtime imports the IFL calls by name, so a caller that fakes
+    server replies afterwards replaces them in pbs.v1._svr_types.
+    """
+    if 'pbs' in sys.modules:
+        return sys.modules['pbs']
+    from ptl.lib import pbs_ifl_mock
+    if pbs_ifl is None:
+        pbs_ifl = types.ModuleType('pbs_ifl')
+        pbs_ifl.__dict__.update((k, v) for (k, v) in
+                                pbs_ifl_mock.__dict__.items()
+                                if not k.startswith('__'))
+        pbs_ifl.pbs_connect = lambda server: -1
+    sys.modules['_pbs_v1'] = sys.modules[__name__]
+    sys.modules['_pbs_ifl'] = types.ModuleType('_pbs_ifl')
+    sys.modules['pbs_ifl'] = pbs_ifl
+    sys.path.insert(0, pbs_dir)
+    import pbs
+
+    # the C layer defines the attributes of the PBS objects from the
+    # attribute tables of the server; define those the hooks under test
+    # read
+    descriptor = pbs.v1._base_types.PbsAttributeDescriptor
+    for (name, value_type) in _VNODE_ATTRIBUTES:
+        if not hasattr(pbs.v1._svr_types._vnode, name):
+            setattr(pbs.v1._svr_types._vnode, name,
+                    descriptor(pbs.v1._svr_types._vnode, name, None,
+                               value_type))
+
+    # the C layer hands out the server object of the event
+    svr = pbs.v1._svr_types._server('localhost')
+    pbs.server = lambda: svr
+    sys.modules[__name__].server = pbs.server
+    return pbs
+
+
+def load_hook(hook_file, pbs_dir, name=None):
+    """
+    Load hook script 'hook_file' as a module named 'name' (by default
+    the base name of the file), with the pbs package from 'pbs_dir' on
+    top of this mock, and return it.  Hooks that only run their event
+    handling code when loaded by the hook interpreter, like
+    pbs_cgroups, can then have their classes and functions exercised
+    on their own.
+    """
+    load_pbs(pbs_dir)
+    if name is None:
+        name = os.path.splitext(os.path.basename(hook_file))[0]
+    hook = types.ModuleType(name)
+    hook.__file__ = hook_file
+    with open(hook_file, 'r') as desc:
+        code = compile(desc.read(), hook_file, 'exec')
+    exec(code, hook.__dict__)
+    return hook
@@ -51,6 +51,7 @@ import sys
 import tempfile
 import traceback
 import inspect
+from concurrent.futures import ThreadPoolExecutor
 from subprocess import PIPE, Popen
 
 from ptl.utils.pbs_testusers import PBS_ALL_USERS, PbsUser
@@ -59,6 +60,7 @@ DFLT_RSYNC_CMD = ['rsync', '-e', 'ssh', '--progress', '--partial', '-ravz']
 DFLT_COPY_CMD = ['scp', '-p']
 DFLT_RSH_CMD = ['ssh']
 DFLT_SUDO_CMD = ['sudo', '-H']
+DFLT_MAX_WORKERS = 16
 
 logging.DEBUG2 = logging.DEBUG - 1
 logging.INFOCLI = logging.INFO - 1
@@ -141,6 +143,7 @@ class DshUtils(object):
     rsh_cmd = DFLT_RSH_CMD
     sudo_cmd = DFLT_SUDO_CMD
     copy_cmd = DFLT_COPY_CMD
+    max_workers = DFLT_MAX_WORKERS
     tmpfilelist = []
     tmpdirlist = []
 
@@ -814,7 +817,8 @@ class DshUtils(object):
     def run_cmd(self, hosts=None, cmd=None, sudo=False, stdin=None,
                 stdout=PIPE, stderr=PIPE, input=None, cwd=None, env=None,
                 runas=None, logerr=True, as_script=False, wait_on_script=True,
-                level=logging.INFOCLI2, port=None):
+                level=logging.INFOCLI2, port=None, parallel=False,
+                max_workers=None):
         """
         Run a command on a host or list of hosts.
 
@@ -853,12 +857,23 @@ class DshUtils(object):
         :type port: str
         :param port: port number used with remote host IP address
                      for ssh
+        :param parallel: If True, run the command on all the hosts at
+                         once and return the result of each host.
+                         Defaults to False, in which case the hosts are
+                         run one after the other and only the result of
+                         the last one is returned. An exception raised
+                         while running on a host is reported as an error
+                         in the result of that host.
+        :type parallel: boolean
+        :param max_workers: maximum number of hosts the command runs on
+                            at the same time when parallel is True.
+                            Defaults to max_workers of the class.
+        :type max_workers: int or None
         :returns: error, output, return code as a dictionary:
-                  ``{'out':...,'err':...,'rc':...}``
+                  ``{'out':...,'err':...,'rc':...}``, or when parallel
+                  is True a dictionary of those keyed by host name
         """
 
-        rshcmd = []
-        sudocmd = []
         platform = self.get_platform()
         _runas_user = None
 
@@ -894,132 +909,175 @@ class DshUtils(object):
             self.logger.error(err_msg)
             return {'out': '', 'err': err_msg, 'rc': 1}
 
+        if parallel:
+            if max_workers is None:
+                max_workers = self.max_workers
+            workers = max(1, min(max_workers, len(hosts)))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = [(hostname, pool.submit(
+                    self._run_cmd_host, hostname, cmd, sudo, stdin, stdout,
+                    stderr, input, cwd, env, runas, logerr, as_script,
+                    wait_on_script, level, port, platform, _user,
+                    _runas_user)) for hostname in hosts]
+                rets = {}
+                for (hostname, f) in futures:
+                    # a failure on one host must not lose the results of
+                    # the others
+                    try:
+                        rets[hostname] = f.result()
+                    except Exception as e:
+                        err_msg = 'error running command on %s: %s' % (
+                            hostname, str(e))
+                        if logerr:
+                            self.logger.error(err_msg)
+                        rets[hostname] = {'out': [], 'err': [err_msg],
+                                          'rc': 1}
+                return rets
+
         ret = {'out': '', 'err': '', 'rc': 0}
 
         for hostname in hosts:
-            if (platform == "shasta") and _runas_user:
-                hostname = _runas_user.host if _runas_user.host else hostname
-                port = _runas_user.port
-            islocal = self.is_localhost(hostname)
-            if islocal is None:
-                # an error occurred processing that name, move on
-                # the error is logged in is_localhost.
-                ret['err'] = 'error getting host by name in run_cmd'
-                ret['rc'] = 1
-                continue
-            if not islocal:
-                if port and platform == "shasta":
-                    if runas is None:
-                        user = _user
-                    else:
-                        user = _runas_user.name
-                    rshcmd = self.rsh_cmd + ['-p', port, user + '@' + hostname]
+            ret = self._run_cmd_host(hostname, cmd, sudo, stdin, stdout,
+                                     stderr, input, cwd, env, runas, logerr,
+                                     as_script, wait_on_script, level, port,
+                                     platform, _user, _runas_user)
+
+        return ret
+
+    def _run_cmd_host(self, hostname, cmd, sudo, stdin, stdout, stderr,
+                      input, cwd, env, runas, logerr, as_script,
+                      wait_on_script, level, port, platform, _user,
+                      _runas_user):
+        """
+        Run a command on a single host for run_cmd and return its
+        error, output and return code as a dictionary
+        """
+        rshcmd = []
+        sudocmd = []
+        if (platform == "shasta") and _runas_user:
+            hostname = _runas_user.host if _runas_user.host else hostname
+            port = _runas_user.port
+        islocal = self.is_localhost(hostname)
+        if islocal is None:
+            # an error occurred processing that name, move on
+            # the error is logged in is_localhost.
+            return {'out': '', 'err': 'error getting host by name in run_cmd',
+                    'rc': 1}
+        if not islocal:
+            if port and platform == "shasta":
+                if runas is None:
+                    user = _user
                 else:
-                    rshcmd = self.rsh_cmd + [hostname]
-            if platform != "shasta":
-                if sudo or ((runas is not None) and (runas != _user)):
-                    sudocmd = copy.copy(self.sudo_cmd)
-                    if runas is not None:
-                        sudocmd += ['-u', runas]
-
-            # Initialize information to return
-            ret = {'out': None, 'err': None, 'rc': None}
-            rc = rshcmd + sudocmd + cmd
-            if as_script:
-                _script = self.create_temp_file()
-                script_body = ['#!/bin/bash']
-                if cwd is not None:
-                    script_body += ['cd "%s"' % (cwd)]
-                    cwd = None
-                if isinstance(cmd, str):
-                    script_body += [cmd]
-                elif isinstance(cmd, list):
-                    script_body += [" ".join(cmd)]
-                with open(_script, 'w') as f:
-                    f.write('\n'.join(script_body))
-                os.chmod(_script, 0o755)
-                if not islocal:
-                    # TODO: get a valid remote temporary file rather than
-                    # assume that the remote host has a similar file
-                    # system layout
-                    self.run_copy(hostname, src=_script, dest=_script,
-                                  runas=runas, level=level)
-                    os.remove(_script)
-                runcmd = rshcmd + sudocmd + [_script]
+                    user = _runas_user.name
+                rshcmd = self.rsh_cmd + ['-p', port, user + '@' + hostname]
             else:
-                runcmd = rc
+                rshcmd = self.rsh_cmd + [hostname]
+        if platform != "shasta":
+            if sudo or ((runas is not None) and (runas != _user)):
+                sudocmd = copy.copy(self.sudo_cmd)
+                if runas is not None:
+                    sudocmd += ['-u', runas]
+
+        # Initialize information to return
+        ret = {'out': None, 'err': None, 'rc': None}
+        rc = rshcmd + sudocmd + cmd
+        if as_script:
+            _script = self.create_temp_file()
+            script_body = ['#!/bin/bash']
+            if cwd is not None:
+                script_body += ['cd "%s"' % (cwd)]
+                cwd = None
+            if isinstance(cmd, str):
+                script_body += [cmd]
+            elif isinstance(cmd, list):
+                script_body += [" ".join(cmd)]
+            with open(_script, 'w') as f:
+                f.write('\n'.join(script_body))
+            os.chmod(_script, 0o755)
+            if not islocal:
+                # TODO: get a valid remote temporary file rather than
+                # assume that the remote host has a similar file
+                # system layout
+                self.run_copy(hostname, src=_script, dest=_script,
+                              runas=runas, level=level)
+                os.remove(_script)
+            runcmd = rshcmd + sudocmd + [_script]
+        else:
+            runcmd = rc
 
-            _msg = hostname.split('.')[0] + ': '
-            _runcmd = ['\'\'' if x == '' else str(x) for x in runcmd]
-            _msg += ' '.join(_runcmd)
-            _msg = [_msg]
-            if as_script:
-                _msg += ['Contents of ' + _script + ':']
-                _msg += ['-' * 40, '\n'.join(script_body), '-' * 40]
-            self.logger.log(level, '\n'.join(_msg))
+        _msg = hostname.split('.')[0] + ': '
+        _runcmd = ['\'\'' if x == '' else str(x) for x in runcmd]
+        _msg += ' '.join(_runcmd)
+        _msg = [_msg]
+        if as_script:
+            _msg += ['Contents of ' + _script + ':']
+            _msg += ['-' * 40, '\n'.join(script_body), '-' * 40]
+        self.logger.log(level, '\n'.join(_msg))
 
-            if input:
-                self.logger.log(level, input)
+        if input:
+            self.logger.log(level, input)
 
+        try:
+            p = Popen(runcmd, bufsize=-1, stdin=stdin, stdout=stdout,
+                      stderr=stderr, cwd=cwd, env=env)
+        except Exception as e:
+            self.logger.error("Error running command " + str(runcmd))
+            if as_script:
+                self.logger.error('Script contents: \n' +
+                                  '\n'.join(script_body))
+            self.logger.debug(str(e))
+            raise
+
+        if as_script and not wait_on_script:
+            o = p.stdout.readline()
+            e = p.stderr.readline()
+            ret['rc'] = 0
+        else:
             try:
-                p = Popen(runcmd, bufsize=-1, stdin=stdin, stdout=stdout,
-                          stderr=stderr, cwd=cwd, env=env)
-            except Exception as e:
-                self.logger.error("Error running command " + str(runcmd))
-                if as_script:
-                    self.logger.error('Script contents: \n' +
-                                      '\n'.join(script_body))
-                self.logger.debug(str(e))
+                (o, e) = p.communicate(input)
+            except TimeOut:
+                self.logger.error("TimeOut Exception, cmd:%s" %
+                                  str(runcmd))
                 raise
+            ret['rc'] = p.returncode
 
-            if as_script and not wait_on_script:
-                o = p.stdout.readline()
-                e = p.stderr.readline()
-                ret['rc'] = 0
+        if as_script:
+            # must pass as_script=False otherwise it will loop infinite
+            if platform == 'shasta' and runas:
+                self.rm(hostname, path=_script, as_script=False,
+                        level=level, runas=runas)
             else:
-                try:
-                    (o, e) = p.communicate(input)
-                except TimeOut:
-                    self.logger.error("TimeOut Exception, cmd:%s" %
-                                      str(runcmd))
-                    raise
-                ret['rc'] = p.returncode
+                self.rm(hostname, path=_script, as_script=False,
+                        level=level)
 
-            if as_script:
-                # must pass as_script=False otherwise it will loop infinite
-                if platform == 'shasta' and runas:
-                    self.rm(hostname, path=_script, as_script=False,
-                            level=level, runas=runas)
-                else:
-                    self.rm(hostname, path=_script, as_script=False,
-                            level=level)
-
-            # handle the case where stdout is not a PIPE
-            if o is not None:
-                ret['out'] = [i.decode("utf-8", 'backslashreplace')
-                              for i in o.splitlines()]
-            else:
-                ret['out'] = []
-            # Some output can be very verbose, for example listing many lines
-            # of a log file, those messages are typically channeled through
-            # at level DEBUG2, since we don't to pollute the output with too
-            # verbose an information, we log at most at level DEBUG
-            if level < logging.DEBUG:
-                self.logger.log(level, 'out: ' + str(ret['out']))
-            else:
-                self.logger.debug('out: ' + str(ret['out']))
-            if e is not None:
-                ret['err'] = [i.decode("utf-8", 'backslashreplace')
-                              for i in e.splitlines()]
-            else:
-                ret['err'] = []
-            if ret['err'] and logerr:
-                self.logger.error("<" + get_method_name(self) + '>err: ' +
-                                  str(ret['err']))
-            else:
-                self.logger.debug("<" + get_method_name(self) + '>err: ' +
-                                  str(ret['err']))
-            self.logger.debug('rc: ' + str(ret['rc']))
+        # handle the case where stdout is not a PIPE
+        if o is not None:
+            ret['out'] = [i.decode("utf-8", 'backslashreplace')
+                          for i in o.splitlines()]
+        else:
+            ret['out'] = []
+        # Some output can be very verbose, for example listing many lines
+        # of a log file, those messages are typically channeled through
+        # at level DEBUG2, since we don't to pollute the output with too
+        # verbose an information, we log at most at level DEBUG
+        if level < logging.DEBUG:
+            self.logger.log(level, 'out: ' + str(ret['out']))
+        else:
+            self.logger.debug('out: ' + str(ret['out']))
+        if e is not None:
+            ret['err'] = [i.decode("utf-8", 'backslashreplace')
+                          for i in e.splitlines()]
+        else:
+            ret['err'] = []
+        # report the errors as coming from run_cmd
+        method_name = self.__class__.__name__ + '.run_cmd'
+        if ret['err'] and logerr:
+            self.logger.error("<" + method_name + '>err: ' +
+                              str(ret['err']))
+        else:
+            self.logger.debug("<" + method_name + '>err: ' +
+                              str(ret['err']))
+        self.logger.debug('rc: ' + str(ret['rc']))
 
         return ret
 
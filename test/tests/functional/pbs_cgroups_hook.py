@@ -39,6 +39,7 @@
 
 
 import glob
+import json
 
 from tests.functional import *
 
@@ -3089,7 +3090,7 @@ if %s e.job.in_ms_mom():
                                     existence=False)
         self.server.log_match(jid1 + ';Exit_status=0')
         # Create a periodic hook that runs more frequently than the
-        # cgroup hook to prepend jid1 to mom_priv/hooks/hook_data/cgroup_jobs
+        # cgroup hook to add jid1 to mom_priv/hooks/hook_data/cgroup_jobs.d
         hookname = 'prependjob'
         hookbody = """
 import pbs
@@ -3134,18 +3135,14 @@ if not pbs_home:
     event.reject()
 if not pbs_mom_home:
     pbs_mom_home = pbs_home
-jobsfile = os.path.join(pbs_mom_home, 'mom_priv', 'hooks',
-                        'hook_data', 'cgroup_jobs')
+jobsdir = os.path.join(pbs_mom_home, 'mom_priv', 'hooks',
+                       'hook_data', 'cgroup_jobs.d')
 try:
-    with open(jobsfile, 'r+') as desc:
-        jobdict = eval(desc.read())
-        if jid_to_prepend not in jobdict:
-            jobdict[jid_to_prepend] = time.time()
-            desc.seek(0)
-            desc.write(str(jobdict))
-            desc.truncate()
+    marker = os.path.join(jobsdir, jid_to_prepend)
+    if not os.path.exists(marker):
+        open(marker, 'w').close()
 except Exception as exc:
-    pbs.logmsg(pbs.EVENT_DEBUG, 'Failed to modify ' + jobsfile)
+    pbs.logmsg(pbs.EVENT_DEBUG, 'Failed to modify ' + jobsdir)
     pbs.logmsg(pbs.EVENT_DEBUG,
                str(traceback.format_exc().strip().splitlines()))
     event.reject()
@@ -3179,7 +3176,7 @@ event.accept()
         command = ['rm', '-rf',
                    os.path.join(self.moms_list[0].pbs_conf['PBS_HOME'],
                                 'mom_priv', 'hooks', 'hook_data',
-                                'cgroup_jobs')]
+                                'cgroup_jobs.d', jid1)]
         self.du.run_cmd(cmd=command, hosts=self.hosts_list[0], sudo=True)
         logmsg = '_exechost_periodic_handler: Failed to update %s' % jid1
         self.moms_list[0].log_match(msg=logmsg, starttime=presubmit,
@@ -4169,6 +4166,389 @@ sleep 300
         self.server.delete(id=jid, wait=True)
         self.assertFalse(self.is_dir(ehjd1, ehost1), "job cpuset dir found")
 
+    def test_cgroup_jobfile_reader(self):
+        """
+        Test that the periodic hook decodes the substate and session id
+        from the .JB file without running printjob
+        """
+        conf = {'freq': 5}
+        self.server.manager(MGR_CMD_SET, HOOK, conf, self.hook_name)
+        self.load_config(self.cfg3 % ('', 'false', '', self.mem, '',
+                                      self.swapctl, ''))
+        a = {'Resource_List.select': '1:ncpus=1:mem=100mb:host=%s' %
+             self.hosts_list[0]}
+        j = Job(TEST_USER, attrs=a)
+        j.create_script(self.sleep15_job)
+        begin = time.time()
+        jid = self.server.submit(j)
+        self.server.expect(JOB, {'job_state': 'R'}, jid)
+        self.server.status(JOB, 'session_id', jid)
+        sid = j.attributes['session_id']
+        msg = "JB file info returned: {'jobid': '%s'.*'substate': 42, " \
+              "'session_id': %s}" % (jid, sid)
+        self.moms_list[0].log_match(msg, regexp=True, starttime=begin)
+        printjob = os.path.join(self.moms_list[0].pbs_conf['PBS_EXEC'],
+                                'bin', 'printjob')
+        self.moms_list[0].log_match("Running: ['%s'" % printjob,
+                                    starttime=begin, max_attempts=1,
+                                    existence=False)
+
+    def test_cgroup_job_locks_parallel(self):
+        """
+        Test that job events only take the node lock shared, so they are
+        not held up by another shared holder, and that jobs starting at
+        the same time are still assigned disjoint cpusets
+        """
+        self.load_config(self.cfg3 % ('', 'false', '', self.mem, '',
+                                      self.swapctl, ''))
+        self.server.expect(NODE, {'state': 'free'},
+                           id=self.nodes_list[0], interval=1)
+        result = self.server.status(NODE, 'resources_available.ncpus',
+                                    id=self.nodes_list[0])
+        ncpus = int(result[0]['resources_available.ncpus'])
+        if ncpus < 4:
+            self.skipTest('Node must have at least four CPUs')
+        # Hold the node lock shared for longer than the jobs need to start,
+        # as a long exechost_periodic event would. Events that wanted the
+        # lock exclusively would wait for it to be released. With -o only
+        # flock itself holds the lock, so killing it releases the lock.
+        lock_file = os.path.join(self.mom.pbs_conf['PBS_HOME'], 'mom_priv',
+                                 'cgroups.lock')
+        holder = 'flock -s -o %s sleep 60' % lock_file
+        self.du.run_cmd(self.hosts_list[0], cmd=[holder], sudo=True,
+                        as_script=True, wait_on_script=False)
+        try:
+            # Submit the jobs with scheduling off so that the execjob_begin
+            # events for all of them compete for the locks at the same time
+            self.server.manager(MGR_CMD_SET, SERVER, {'scheduling': 'False'})
+            jids = []
+            for _ in range(4):
+                a = {'Resource_List.select': '1:ncpus=1:mem=100mb:host=%s' %
+                     self.hosts_list[0]}
+                j = Job(TEST_USER, attrs=a)
+                j.create_script(self.sleep30_job)
+                jids.append(self.server.submit(j))
+            self.server.manager(MGR_CMD_SET, SERVER, {'scheduling': 'True'})
+            for jid in jids:
+                self.server.expect(JOB, {'job_state': 'R'}, jid,
+                                   max_attempts=20, interval=1)
+            # The jobs must not share any CPU
+            assigned = set()
+            for jid in jids:
+                jdir = self.get_cgroup_job_dir('cpuset', jid,
+                                               self.hosts_list[0])
+                self.assertFalse(jdir is None,
+                                 'No job directory for cpuset subsystem')
+                cpus_file = os.path.join(jdir, 'cpuset.cpus')
+                cpus = set()
+                for rng in self.wait_and_read_file(self.hosts_list[0],
+                                                   cpus_file)[0].split(','):
+                    first, _, last = rng.partition('-')
+                    cpus.update(range(int(first), int(last or first) + 1))
+                self.logger.info('%s: cpus %s' % (jid, sorted(cpus)))
+                self.assertTrue(cpus, 'Job %s has no CPUs' % jid)
+                self.assertFalse(cpus & assigned,
+                                 'Job %s shares CPUs with another job' % jid)
+                assigned |= cpus
+        finally:
+            # The brackets keep pkill from matching its own command line
+            pattern = '[' + holder[0] + ']' + holder[1:]
+            self.du.run_cmd(self.hosts_list[0],
+                            cmd=["pkill -P $(pgrep -f '%s'); pkill -f '%s'" %
+                                 (pattern, pattern)],
+                            sudo=True, as_script=True, logerr=False)
+
+    def test_cgroup_jobs_migration(self):
+        """
+        Test that a cgroup_jobs file written by older hooks is converted
+        into marker files in cgroup_jobs.d
+        """
+        self.load_config(self.cfg1 % ('', '', '', '', self.mem, self.swapctl))
+        hook_data = os.path.join(self.mom.pbs_conf['PBS_HOME'], 'mom_priv',
+                                 'hooks', 'hook_data')
+        old_file = os.path.join(hook_data, 'cgroup_jobs')
+        fake_jid = '999999.%s' % self.server.shortname
+        fn = self.du.create_temp_file(hostname=self.hosts_list[0],
+                                      body=str({fake_jid: time.time()}))
+        self.du.run_copy(hosts=self.hosts_list[0], src=fn, dest=old_file,
+                         sudo=True, uid='root', gid='root', mode=0o644)
+        self.du.rm(hostname=self.hosts_list[0], path=fn)
+        begin = time.time()
+        a = {'Resource_List.select': '1:ncpus=1:mem=100mb:host=%s' %
+             self.hosts_list[0]}
+        j = Job(TEST_USER, attrs=a)
+        j.create_script(self.sleep15_job)
+        jid = self.server.submit(j)
+        self.server.expect(JOB, {'job_state': 'R'}, jid)
+        self.moms_list[0].log_match('Migrated 1 jobs from %s' % old_file,
+                                    starttime=begin)
+        self.assertFalse(self.is_file(old_file, self.hosts_list[0]),
+                         'Old cgroup_jobs file was not removed')
+        marker = os.path.join(hook_data, 'cgroup_jobs.d', fake_jid)
+        self.assertTrue(self.is_file(marker, self.hosts_list[0]),
+                        'No marker file for %s' % fake_jid)
+
+    def test_cgroup_teardown_nested(self):
+        """
+        Test that deleting a job kills the tasks in its cgroup and in a
+        nested cgroup, and removes both without stragglers
+        """
+        self.load_config(self.cfg3 % ('', 'false', '', self.mem, '',
+                                      self.swapctl, ''))
+        a = {'Resource_List.select': '1:ncpus=1:mem=300mb:host=%s' %
+             self.hosts_list[0]}
+        j = Job(TEST_USER, attrs=a)
+        j.create_script("""#!/bin/bash
+#PBS -joe
+for i in 1 2 3 4; do sleep 300 & done
+sleep 300
+""")
+        jid = self.server.submit(j)
+        self.server.expect(JOB, {'job_state': 'R'}, jid)
+        jdir = self.get_cgroup_job_dir('cpuset', jid, self.hosts_list[0])
+        self.assertFalse(jdir is None, 'No job directory for cpuset subsystem')
+        # Move one of the job processes into a nested cgroup, as job
+        # launchers that manage their own cgroups do
+        nested = os.path.join(jdir, 'nested')
+        self.du.mkdir(hostname=self.hosts_list[0], path=nested, sudo=True)
+        for filename in ['cpuset.cpus', 'cpuset.mems']:
+            self.du.run_cmd(self.hosts_list[0],
+                            cmd=['cat %s > %s' %
+                                 (os.path.join(jdir, filename),
+                                  os.path.join(nested, filename))],
+                            sudo=True, as_script=True)
+        tasks = self.du.cat(self.hosts_list[0], os.path.join(jdir, 'tasks'),
+                            sudo=True)['out']
+        self.assertTrue(len(tasks) > 1, 'Job processes not found')
+        self.du.run_cmd(self.hosts_list[0],
+                        cmd=['echo %s > %s' %
+                             (tasks[-1], os.path.join(nested, 'tasks'))],
+                        sudo=True, as_script=True)
+        begin = time.time()
+        self.server.delete(id=jid, wait=True)
+        self.assertFalse(self.is_dir(nested, self.hosts_list[0]),
+                         'Nested cgroup was not removed')
+        self.assertFalse(self.is_dir(jdir, self.hosts_list[0]),
+                         'Job cgroup was not removed')
+        self.moms_list[0].log_match('survived', starttime=begin,
+                                    max_attempts=1, existence=False)
+
+    def test_cgroup_online_vnodes_bulk_comments(self):
+        """
+        Test that the periodic hook fetches the comments of all vnodes
+        of the host in one request and brings back online every vnode
+        it had offlined
+        """
+        conf = {'freq': 5}
+        self.server.manager(MGR_CMD_SET, HOOK, conf, self.hook_name)
+        self.load_config(self.cfg3 % ('', 'true', '', self.mem, '',
+                                      self.swapctl, ''))
+        self.mom.restart()
+        self.server.expect(NODE, {'state': 'free'},
+                           id=self.nodes_list[0], interval=1)
+        vnodes = [n['id'] for n in self.server.status(NODE)
+                  if n['Mom'].split('.')[0] ==
+                  self.hosts_list[0].split('.')[0]]
+        self.logger.info('Vnodes on %s: %s' % (self.hosts_list[0], vnodes))
+        # Make the vnodes look as if the hook had offlined them a while ago
+        offline_msg = ('Hook %s: Unable to clean up one or more cgroups' %
+                       self.hook_name)
+        offline_file = os.path.join(self.mom.pbs_conf['PBS_HOME'],
+                                    'mom_priv', 'hooks',
+                                    '%s.offline' % self.hook_name)
+        fn = self.du.create_temp_file(hostname=self.hosts_list[0],
+                                      body=str(time.time() - 3600))
+        self.tempfile.append(fn)
+        self.du.run_copy(hosts=self.hosts_list[0], src=fn,
+                         dest=offline_file, sudo=True,
+                         uid='root', gid='root', mode=0o644)
+        begin = time.time()
+        for vn in vnodes:
+            self.server.manager(MGR_CMD_SET, NODE,
+                                {'state': 'offline', 'comment': offline_msg},
+                                id=vn)
+        for vn in vnodes:
+            self.server.expect(NODE, {'state': 'free'}, id=vn,
+                               offset=5, interval=3)
+        self.moms_list[0].log_match(r'comments for \d+ vnodes fetched '
+                                    'from server', regexp=True,
+                                    starttime=begin)
+        self.assertFalse(self.is_file(offline_file, self.hosts_list[0]),
+                         'Offline file was not removed')
+
+    def test_cgroup_placement_scatter(self):
+        """
+        Test that placement_type scatter spreads the CPUs of a job over
+        the NUMA nodes of the host instead of filling one of them first
+        """
+        def expand(cpulist):
+            cpus = set()
+            for rng in cpulist.strip().split(','):
+                first, _, last = rng.partition('-')
+                cpus.update(range(int(first), int(last or first) + 1))
+            return cpus
+        ret = self.du.run_cmd(self.hosts_list[0],
+                              cmd=['cat /sys/devices/system/node/node*/'
+                                   'cpulist'],
+                              as_script=True)
+        numa_cpus = [expand(line) for line in ret['out'] if line.strip()]
+        if len(numa_cpus) < 2:
+            self.skipTest('Host must have at least two NUMA nodes')
+        cfg = self.cfg3 % ('', 'false', '', self.mem, '', self.swapctl, '')
+        cfg = cfg.replace('"use_hyperthreads"',
+                          '"placement_type"        : "scatter",\n'
+                          '    "use_hyperthreads"')
+        self.load_config(cfg)
+        a = {'Resource_List.select': '1:ncpus=%d:mem=100mb:host=%s' %
+             (len(numa_cpus), self.hosts_list[0])}
+        j = Job(TEST_USER, attrs=a)
+        j.create_script(self.sleep15_job)
+        jid = self.server.submit(j)
+        self.server.expect(JOB, {'job_state': 'R'}, jid)
+        jdir = self.get_cgroup_job_dir('cpuset', jid, self.hosts_list[0])
+        self.assertFalse(jdir is None, 'No job directory for cpuset subsystem')
+        cpus = self.wait_and_read_file(self.hosts_list[0],
+                                       os.path.join(jdir, 'cpuset.cpus'))
+        self.logger.info('cpuset.cpus: %s' % cpus)
+        cpus = expand(cpus[0])
+        for nnid, node_cpus in enumerate(numa_cpus):
+            self.assertTrue(cpus & node_cpus,
+                            'No CPU of NUMA node %d assigned' % nnid)
+
+    def test_cgroup_usage_sampler(self):
+        """
+        Test that the usage sampler keeps the memory peak of a job cgroup
+        across samples and reports its CPU and I/O usage. A fake cgroup
+        tree is used, so no job is needed.
+        """
+        sampler = os.path.join(self.server.pbs_conf['PBS_EXEC'],
+                               'unsupported', 'pbs_cgroups_sampler.py')
+        if not os.path.isfile(sampler):
+            self.skipTest('%s not found' % sampler)
+        root = self.du.create_temp_dir()
+        self.tempfile.append(root)
+        jobid = '123.%s' % self.server.shortname
+        jobdirs = {}
+        for subsys in ('memory', 'cpuacct', 'blkio'):
+            jobdirs[subsys] = os.path.join(root, subsys, 'pbs_jobs.service',
+                                           'jobid', jobid)
+            os.makedirs(jobdirs[subsys])
+
+        def write(subsys, filename, value):
+            with open(os.path.join(jobdirs[subsys], filename), 'w') as fd:
+                fd.write(value)
+        ring = os.path.join(root, 'samples')
+        cmd = ['python3', sampler, '-r', root, '-f', ring, '-i', '0.1',
+               '-n', '2', '-s', '64']
+        write('memory', 'memory.usage_in_bytes', '4194304\n')
+        write('memory', 'memory.failcnt', '0\n')
+        write('cpuacct', 'cpuacct.usage', '2000000000\n')
+        write('blkio', 'blkio.throttle.io_service_bytes',
+              '8:0 Read 100\n8:0 Write 200\nTotal 300\n')
+        ret = self.du.run_cmd(cmd=cmd)
+        self.assertEqual(ret['rc'], 0, 'Sampler failed: %s' % ret['err'])
+        # The usage dropped since the first run, but the peak remains
+        write('memory', 'memory.usage_in_bytes', '1048576\n')
+        write('cpuacct', 'cpuacct.usage', '3000000000\n')
+        ret = self.du.run_cmd(cmd=cmd)
+        self.assertEqual(ret['rc'], 0, 'Sampler failed: %s' % ret['err'])
+        ret = self.du.run_cmd(cmd=['python3', sampler, '--dump', '-f', ring])
+        self.assertEqual(ret['rc'], 0, 'Dump failed: %s' % ret['err'])
+        usage = json.loads('\n'.join(ret['out']))
+        self.logger.info('Sampled usage: %s' % usage)
+        self.assertIn(jobid, usage)
+        self.assertEqual(usage[jobid]['mem'], 4194304)
+        self.assertEqual(usage[jobid]['cput'], 3000000000)
+        self.assertEqual(usage[jobid]['io_bytes'], 300)
+        self.assertEqual(usage[jobid]['mem_failcnt'], 0)
+
+    def test_cgroup_orphan_index(self):
+        """
+        Test that exechost_periodic removes the cgroup of a job that is
+        not on the node and keeps track of it in the orphan index
+        """
+        conf = {'freq': 5}
+        self.server.manager(MGR_CMD_SET, HOOK, conf, self.hook_name)
+        # Scan the cgroup hierarchies on every periodic event
+        cfg = self.cfg3 % ('', 'false', '', self.mem, '', self.swapctl, '')
+        cfg = cfg.replace('"use_hyperthreads"',
+                          '"orphan_rescan_interval" : 0,\n'
+                          '    "use_hyperthreads"')
+        self.load_config(cfg)
+        jobid = '999999.%s' % self.server.shortname
+        orphan = os.path.join(self.paths['memory'], 'pbs_jobs.service',
+                              'jobid', jobid)
+        begin = time.time()
+        self.du.mkdir(hostname=self.hosts_list[0], path=orphan, sudo=True)
+        self.assertTrue(self.is_dir(orphan, self.hosts_list[0]),
+                        'Failed to create %s' % orphan)
+        self.moms_list[0].log_match('Found orphan %s' % jobid,
+                                    starttime=begin)
+        self.moms_list[0].log_match('Removing orphaned cgroup: %s' % orphan,
+                                    starttime=begin)
+        self.assertFalse(self.is_dir(orphan, self.hosts_list[0]),
+                         'Orphaned cgroup %s not removed' % orphan)
+        index_file = os.path.join(self.moms_list[0].pbs_conf['PBS_HOME'],
+                                  'mom_priv', 'hooks', 'hook_data',
+                                  'orphan_index')
+        self.assertTrue(self.is_file(index_file, self.hosts_list[0]),
+                        'Orphan index file not found')
+
+    def test_cgroup_config_cache(self):
+        """
+        Test that exechost_startup reports an invalid hook configuration
+        and that job events take a valid configuration from the cache
+        """
+        cfg = self.cfg3 % ('', 'false', '', self.mem, '', self.swapctl, '')
+        bad_cfg = cfg.replace('"use_hyperthreads"',
+                              '"placement_type"        : "bogus",\n'
+                              '    "use_hyperthreads"')
+        begin = time.time()
+        self.load_config(bad_cfg)
+        self.moms_list[0].log_match('placement_type must be one of',
+                                    starttime=begin)
+        self.moms_list[0].log_match('Invalid hook configuration',
+                                    starttime=begin)
+        begin = time.time()
+        self.load_config(cfg)
+        cache_file = os.path.join(self.moms_list[0].pbs_conf['PBS_HOME'],
+                                  'mom_priv', 'hooks', 'hook_data',
+                                  'config_cache')
+        self.assertTrue(self.is_file(cache_file, self.hosts_list[0]),
+                        'Config cache file not found')
+        a = {'Resource_List.select': '1:ncpus=1:mem=100mb:host=%s' %
+             self.hosts_list[0]}
+        j = Job(TEST_USER, attrs=a)
+        j.create_script(self.sleep15_job)
+        jid = self.server.submit(j)
+        self.server.expect(JOB, {'job_state': 'R'}, jid)
+        self.moms_list[0].log_match('Loaded hook configuration from %s' %
+                                    cache_file, starttime=begin)
+
+    def test_cgroup_topology_cache(self):
+        """
+        Test that exechost_startup saves the node topology and that
+        job events load it from the cache instead of rediscovering it
+        """
+        self.load_config(self.cfg1 % ('', '', '', '', self.mem, self.swapctl))
+        cache_file = os.path.join(self.moms_list[0].pbs_conf['PBS_HOME'],
+                                  'mom_priv', 'hooks', 'hook_data',
+                                  'topology_cache')
+        self.assertTrue(self.is_file(cache_file, self.hosts_list[0]),
+                        'Topology cache file not found')
+        begin = time.time()
+        a = {'Resource_List.select': '1:ncpus=1:mem=100mb:host=%s' %
+             self.hosts_list[0]}
+        j = Job(TEST_USER, attrs=a)
+        j.create_script(self.sleep15_job)
+        jid = self.server.submit(j)
+        self.server.expect(JOB, {'job_state': 'R'}, jid)
+        self.moms_list[0].log_match('Loaded node topology from %s' %
+                                    cache_file, starttime=begin)
+        self.moms_list[0].log_match('_discover_cpuinfo: Method called',
+                                    starttime=begin, max_attempts=1,
+                                    existence=False)
+
     def tearDown(self):
         TestFunctional.tearDown(self)
         mom_checks = True
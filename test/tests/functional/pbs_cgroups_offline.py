@@ -0,0 +1,370 @@
+# coding: utf-8
+
+# Copyright (C) 1994-2021 Altair Engineering, Inc.
+# For more information, contact Altair at www.altair.com.
+#
+# This file is part of both the OpenPBS software ("OpenPBS")
+# and the PBS Professional ("PBS Pro") software.
+#
+# Open Source License Information:
+#
+# OpenPBS is free software. You can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# OpenPBS is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Commercial License Information:
+#
+# PBS Pro is commercially licensed software that shares a common core with
+# the OpenPBS software.  For a copy of the commercial license terms and
+# conditions, go to: (http://www.pbspro.com/agreement.html) or contact the
+# Altair Legal Department.
+#
+# Altair's dual-license business model allows companies, individuals, and
+# organizations to create proprietary derivative works of OpenPBS and
+# distribute them - whether embedded or bundled with other software -
+# under a commercial license agreement.
+#
+# Use of Altair's trademarks, including but not limited to "PBS™",
+# "OpenPBS®", "PBS Professional®", and "PBS Pro™" and Altair's logos is
+# subject to Altair's trademark licensing policies.
+
+
+import json
+
+from tests.functional import *
+from ptl.lib import pbs_v1_mock
+
+
+class TestCgroupsOffline(TestFunctional):
+    """
+    Tests of the cgroups hook classes, loaded in the test process on top
+    of a mock of the hook runtime and run against fake sysfs, procfs and
+    /dev trees, so that they do not depend on the hardware or cgroup
+    setup of the test hosts
+    """
+
+    def setUp(self):
+        TestFunctional.setUp(self)
+        pbs_dir = os.path.join(self.server.pbs_conf['PBS_EXEC'], 'lib',
+                               'python', 'altair')
+        hook_file = os.path.join(pbs_dir, 'pbs_hooks', 'pbs_cgroups.PY')
+        self.hook = pbs_v1_mock.load_hook(hook_file, pbs_dir)
+        self.pbs = sys.modules['pbs']
+        self.set_event(self.pbs.EXECHOST_PERIODIC)
+        self.root = self.du.create_temp_dir()
+        self.saved_config_file = os.environ.get('PBS_HOOK_CONFIG_FILE')
+        self.saved_ifl = {}
+
+    def tearDown(self):
+        for (name, func) in self.saved_ifl.items():
+            setattr(self.pbs.v1._svr_types, name, func)
+        self.pbs.v1._svr_types.invalidate_stat_cache()
+        self.pbs.v1._svr_types._server_conns.close_all()
+        if self.saved_config_file is None:
+            os.environ.pop('PBS_HOOK_CONFIG_FILE', None)
+        else:
+            os.environ['PBS_HOOK_CONFIG_FILE'] = self.saved_config_file
+        pbs_v1_mock.set_event(None)
+        self.du.rm(path=self.root, recursive=True, force=True)
+        TestFunctional.tearDown(self)
+
+    def set_event(self, event_type):
+        """
+        Make pbs.event() return an event of type event_type for the
+        cgroups hook
+        """
+        event = self.pbs.v1._svr_types._event(event_type, 'root',
+                                              'localhost')
+        event.hook_name = 'pbs_cgroups'
+        pbs_v1_mock.set_event(event)
+        return event
+
+    def write(self, path, body):
+        """
+        Write body to path, relative to the fake tree
+        """
+        path = os.path.join(self.root, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as desc:
+            desc.write(body)
+        return path
+
+    def load_config(self, cfg=None):
+        """
+        Return the hook configuration parsed from cfg, a dictionary of
+        settings to change from the defaults
+        """
+        settings = {'nvidia-smi': os.path.join(self.root, 'nvidia-smi'),
+                    'topology_cache_file': os.path.join(self.root,
+                                                        'topology_cache')}
+        settings.update(cfg or {})
+        path = self.write('pbs_cgroups.json', json.dumps(settings))
+        os.environ['PBS_HOOK_CONFIG_FILE'] = path
+        return self.hook.CgroupUtils.parse_config_file()
+
+    def fake_topology(self, sockets=2, cores=4, mem_kb=8388608):
+        """
+        Populate the fake tree with a host of 'sockets' NUMA nodes of
+        'cores' CPUs and 'mem_kb' kB of memory each, and one PCI device
+        on the last NUMA node
+        """
+        ncpus = sockets * cores
+        cpuinfo = []
+        for num in range(sockets):
+            first = num * cores
+            self.write(os.path.join('sys', 'devices', 'system', 'node',
+                                    'node%d' % num, 'cpulist'),
+                       '%d-%d\n' % (first, first + cores - 1))
+            self.write(os.path.join('sys', 'devices', 'system', 'node',
+                                    'node%d' % num, 'meminfo'),
+                       'Node %d MemTotal: %d kB\n'
+                       'Node %d HugePages_Total: 0\n'
+                       % (num, mem_kb, num))
+            for core in range(cores):
+                cpuinfo.append('processor\t: %d\n'
+                               'vendor_id\t: GenuineIntel\n'
+                               'physical id\t: %d\n'
+                               'core id\t\t: %d\n'
+                               'flags\t\t: fpu\n\n'
+                               % (first + core, num, core))
+        self.write(os.path.join('sys', 'devices', 'system', 'cpu',
+                                'online'), '0-%d\n' % (ncpus - 1))
+        self.write(os.path.join('sys', 'bus', 'pci', 'devices',
+                                '0000:00:01.0', 'numa_node'),
+                   '%d\n' % (sockets - 1))
+        self.write(os.path.join('proc', 'cpuinfo'), ''.join(cpuinfo))
+        self.write(os.path.join('proc', 'meminfo'),
+                   'MemTotal: %d kB\n'
+                   'SwapTotal: 0 kB\n'
+                   'HugePages_Total: 0\n'
+                   'HugePages_Rsvd: 0\n'
+                   'Hugepagesize: 2048 kB\n' % (sockets * mem_kb))
+        self.write(os.path.join('proc', 'sys', 'kernel', 'random',
+                                'boot_id'), 'fake-boot-id\n')
+        if not os.path.isdir(os.path.join(self.root, 'dev')):
+            os.mkdir(os.path.join(self.root, 'dev'))
+
+    def node_utils(self, cfg, **kwargs):
+        """
+        Return the NodeUtils of the fake tree
+        """
+        return self.hook.NodeUtils(cfg, hostname='fakehost',
+                                   sysfs=os.path.join(self.root, 'sys'),
+                                   procfs=os.path.join(self.root, 'proc'),
+                                   devfs=os.path.join(self.root, 'dev'),
+                                   **kwargs)
+
+    def fake_server_vnodes(self, comments):
+        """
+        Make the server connection and vnode status calls of the hook
+        runtime answer from comments, a dictionary of the comment of each
+        vnode of a fake server, and return the list of (name, attribs)
+        of the vnode status requests made
+        """
+        svr_types = self.pbs.v1._svr_types
+        requests = []
+
+        def status(name, attribs, value, nxt):
+            return type('batch_status', (object,),
+                        {'name': name, 'attribs': attribs,
+                         'value': value, 'resource': None,
+                         'text': None, 'next': nxt})()
+
+        def pbs_statvnode(con, name, attrl, extend):
+            wanted = []
+            while attrl:
+                wanted.append(attrl.name)
+                attrl = attrl.next
+            requests.append((name, wanted))
+            head = None
+            for vnode in sorted(comments, reverse=True):
+                if name and vnode != name:
+                    continue
+                attribs = status('comment', None, comments[vnode], None)
+                head = status(vnode, attribs, None, head)
+            return head
+
+        fakes = {'pbs_connect': lambda server: 1,
+                 'pbs_disconnect': lambda con: 0,
+                 'pbs_statvnode': pbs_statvnode}
+        for (name, func) in fakes.items():
+            self.saved_ifl.setdefault(name, getattr(svr_types, name))
+            setattr(svr_types, name, func)
+        return requests
+
+    def test_stat_vnode_comments(self):
+        """
+        Test that the comments of the vnodes of a host are requested vnode
+        by vnode when the host has few vnodes, and with a single status
+        of the comment of every vnode otherwise
+        """
+        comments = dict(('fakehost[%d]' % i, 'comment %d' % i)
+                        for i in range(8))
+        comments['otherhost'] = 'other'
+        requests = self.fake_server_vnodes(comments)
+        few = ['fakehost[0]', 'fakehost[1]']
+        self.assertEqual(self.hook.stat_vnode_comments(few),
+                         {'fakehost[0]': 'comment 0',
+                          'fakehost[1]': 'comment 1'})
+        self.assertEqual(requests, [('fakehost[0]', ['comment']),
+                                    ('fakehost[1]', ['comment'])])
+
+        del requests[:]
+        self.pbs.v1._svr_types.invalidate_stat_cache()
+        many = ['fakehost[%d]' % i for i in range(8)]
+        result = self.hook.stat_vnode_comments(many)
+        self.assertEqual(result, dict((vn, comments[vn]) for vn in many))
+        self.assertEqual(requests, [(None, ['comment'])])
+
+        # a vnode unknown to the server is an error on both paths
+        for vnodes in (['nohost'], many + ['nohost']):
+            self.pbs.v1._svr_types.invalidate_stat_cache()
+            with self.assertRaises(ValueError):
+                self.hook.stat_vnode_comments(vnodes)
+
+    def test_node_discovery_fake_tree(self):
+        """
+        Test that NodeUtils discovers the CPUs, memory, NUMA nodes and
+        devices from the sysfs, procfs and /dev roots it is given, that
+        the topology it saves is reused while the tree is unchanged, and
+        that it is discovered again once the tree changes
+        """
+        self.fake_topology(sockets=2, cores=4)
+        cfg = self.load_config()
+        node = self.node_utils(cfg)
+        self.assertEqual(sorted(node.numa_nodes), [0, 1])
+        self.assertEqual(node.numa_nodes[0]['cpus'], [0, 1, 2, 3])
+        self.assertEqual(node.numa_nodes[1]['cpus'], [4, 5, 6, 7])
+        self.assertEqual(node.cpuinfo['logical_cpus'], 8)
+        self.assertEqual(node.meminfo['MemTotal'],
+                         self.hook.convert_size('16777216kB', 'kb'))
+        self.assertEqual(
+            node.devices['devices']['0000:00:01.0']['numa_node'], 1)
+        self.assertTrue(os.path.isfile(cfg['topology_cache_file']))
+        with open(cfg['topology_cache_file'], 'r') as desc:
+            cached = json.load(desc)
+        self.assertEqual(cached['signature']['boot_id'], 'fake-boot-id')
+
+        # a file outside of the cache signature changes: the cached
+        # topology is still trusted
+        self.write(os.path.join('proc', 'cpuinfo'), 'garbage\n')
+        node = self.node_utils(cfg)
+        self.assertEqual(node.cpuinfo['logical_cpus'], 8)
+
+        # a NUMA node is added: the topology is discovered again
+        self.fake_topology(sockets=3, cores=4)
+        node = self.node_utils(cfg)
+        self.assertEqual(sorted(node.numa_nodes), [0, 1, 2])
+        self.assertEqual(node.cpuinfo['logical_cpus'], 12)
+        self.assertEqual(
+            node.devices['devices']['0000:00:01.0']['numa_node'], 2)
+
+    def test_placement_synthetic_topology(self):
+        """
+        Test the CPUs and NUMA nodes that PlacementEngine and assign_job()
+        give jobs on a synthetic host of three NUMA nodes, and that with
+        scatter placement cpuset.mems only holds the NUMA nodes the CPUs
+        and memory of the job come from
+        """
+        self.fake_topology(sockets=3, cores=4, mem_kb=1048576)
+        cfg = self.load_config({'use_hyperthreads': False})
+        node = self.node_utils(cfg)
+        engine = self.hook.PlacementEngine(node, use_hyperthreads=False)
+        self.assertEqual(engine.numa_ids, [0, 1, 2])
+        self.assertEqual(engine.select_cpus([0, 1], 3), [0, 1, 2])
+        self.assertEqual(engine.select_cpus([0, 1], 3, scatter=True),
+                         [0, 4, 1])
+        self.assertIsNone(engine.select_cpus([0], 5))
+        self.assertEqual(engine.numa_nodes_of([0, 1, 2], cpus=[1, 9]),
+                         [0, 2])
+        engine.reserve([0, 1, 2], [0], [], 512 * 1024 * 1024)
+        self.assertEqual(engine.select_cpus([0], 1), [3])
+        self.assertEqual(engine.free_memory_on([0]), 512 * 1024 * 1024)
+
+        cgroup = self.hook.CgroupUtils.__new__(self.hook.CgroupUtils)
+        cgroup.cfg = cfg
+        cgroup.assigned_resources = {}
+        cfg['placement_type'] = 'scatter'
+        engine = self.hook.PlacementEngine(node, use_hyperthreads=False)
+        assigned = cgroup.assign_job({'ncpus': 2, 'mem': '100mb'}, engine,
+                                     node)
+        self.assertEqual(sorted(assigned['cpuset.cpus']), [0, 4])
+        self.assertEqual(assigned['cpuset.mems'], [0, 1])
+        # more memory than the NUMA nodes of the CPUs have free
+        assigned = cgroup.assign_job({'ncpus': 2, 'mem': '2500mb'}, engine,
+                                     node)
+        self.assertEqual(assigned['cpuset.mems'], [0, 1, 2])
+        assigned = cgroup.assign_job({'ncpus': 2, 'mem': '4gb'}, engine,
+                                     node)
+        self.assertEqual(assigned, {})
+
+        # job_balanced starts with the NUMA node that has the fewest jobs
+        cfg['placement_type'] = 'job_balanced'
+        cgroup.assigned_resources = {
+            '1.svr': {'cpuset': {'cpus': [0, 4], 'mems': [0, 1]}}}
+        engine = self.hook.PlacementEngine(node, use_hyperthreads=False)
+        engine.reserve([0, 4], [0, 1], [], 0)
+        assigned = cgroup.assign_job({'ncpus': 1, 'mem': '100mb'}, engine,
+                                     node)
+        self.assertEqual(assigned['cpuset.cpus'], [8])
+        self.assertEqual(assigned['cpuset.mems'], [2])
+
+    def test_usage_sampler_buffer(self):
+        """
+        Test that UsageSampleReader reads the buffer written by the
+        pbs_cgroups_sampler service and aggregates it as the service
+        itself does, and that io_bytes is only reported when the
+        configuration enables it
+        """
+        sampler = os.path.join(self.server.pbs_conf['PBS_EXEC'],
+                               'unsupported', 'pbs_cgroups_sampler.py')
+        if not os.path.isfile(sampler):
+            self.skipTest('%s not found' % sampler)
+        jobid = '123.fakeserver'
+        jobdir = os.path.join('cgroup', '%s', 'pbs_jobs.service', 'jobid',
+                              jobid, '%s')
+        ring = os.path.join(self.root, 'samples')
+        cmd = ['python3', sampler, '-r', os.path.join(self.root, 'cgroup'),
+               '-f', ring, '-i', '0.1', '-n', '2', '-s', '64']
+        self.write(jobdir % ('memory', 'memory.usage_in_bytes'), '4194304\n')
+        self.write(jobdir % ('memory', 'memory.failcnt'), '0\n')
+        self.write(jobdir % ('cpuacct', 'cpuacct.usage'), '2000000000\n')
+        self.write(jobdir % ('blkio', 'blkio.throttle.io_service_bytes'),
+                   '8:0 Read 100\n8:0 Write 200\nTotal 300\n')
+        ret = self.du.run_cmd(cmd=cmd)
+        self.assertEqual(ret['rc'], 0, 'Sampler failed: %s' % ret['err'])
+        # the usage drops, the peak must remain
+        self.write(jobdir % ('memory', 'memory.usage_in_bytes'), '1048576\n')
+        self.write(jobdir % ('cpuacct', 'cpuacct.usage'), '3000000000\n')
+        ret = self.du.run_cmd(cmd=cmd)
+        self.assertEqual(ret['rc'], 0, 'Sampler failed: %s' % ret['err'])
+        ret = self.du.run_cmd(cmd=['python3', sampler, '--dump', '-f', ring])
+        self.assertEqual(ret['rc'], 0, 'Dump failed: %s' % ret['err'])
+        dumped = json.loads('\n'.join(ret['out']))
+
+        usage = self.hook.UsageSampleReader(ring).collect([jobid, '1.other'])
+        self.assertEqual(usage, dumped)
+        self.assertEqual(usage[jobid]['mem'], 4194304)
+        self.assertEqual(usage[jobid]['cput'], 3000000000)
+        self.assertEqual(usage[jobid]['io_bytes'], 300)
+
+        cgroup = self.hook.CgroupUtils.__new__(self.hook.CgroupUtils)
+        cgroup.cgroup_version = 1
+        cgroup.subsystems = ['memory']
+        for (enabled, reported) in ((False, False), (True, True)):
+            cgroup.cfg = self.load_config({'report_io_bytes': enabled})
+            resc_used = {}
+            cgroup.update_job_usage(jobid, resc_used, force=True,
+                                    usage=usage[jobid])
+            self.assertEqual(str(resc_used['mem']), '4096kb')
+            self.assertEqual('io_bytes' in resc_used, reported)
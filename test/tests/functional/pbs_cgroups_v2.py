@@ -0,0 +1,355 @@
+# coding: utf-8
+
+# Copyright (C) 1994-2021 Altair Engineering, Inc.
+# For more information, contact Altair at www.altair.com.
+#
+# This file is part of both the OpenPBS software ("OpenPBS")
+# and the PBS Professional ("PBS Pro") software.
+#
+# Open Source License Information:
+#
+# OpenPBS is free software. You can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# OpenPBS is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Commercial License Information:
+#
+# PBS Pro is commercially licensed software that shares a common core with
+# the OpenPBS software.  For a copy of the commercial license terms and
+# conditions, go to: (http://www.pbspro.com/agreement.html) or contact the
+# Altair Legal Department.
+#
+# Altair's dual-license business model allows companies, individuals, and
+# organizations to create proprietary derivative works of OpenPBS and
+# distribute them - whether embedded or bundled with other software -
+# under a commercial license agreement.
+#
+# Use of Altair's trademarks, including but not limited to "PBS™",
+# "OpenPBS®", "PBS Professional®", and "PBS Pro™" and Altair's logos is
+# subject to Altair's trademark licensing policies.
+
+
+import json
+
+from tests.functional import *
+from ptl.lib import pbs_v1_mock
+
+
+class TestCgroupsV2(TestFunctional):
+    """
+    Test the cgroups hook on hosts that only mount the cgroup v2
+    unified hierarchy
+    """
+
+    cfg = """{
+    "cgroup_prefix"         : "pbs_jobs",
+    "exclude_hosts"         : [],
+    "exclude_vntypes"       : [],
+    "run_only_on_hosts"     : [],
+    "periodic_resc_update"  : true,
+    "vnode_per_numa_node"   : false,
+    "online_offlined_nodes" : true,
+    "use_hyperthreads"      : false,
+    "report_pressure"       : true,
+    "cgroup" : {
+        "cpuacct" : {
+            "enabled"         : true
+        },
+        "cpuset" : {
+            "enabled"         : true
+        },
+        "memory" : {
+            "enabled"         : true,
+            "default"         : "96MB",
+            "reserve_amount"  : "64MB"
+        },
+        "pids" : {
+            "enabled"         : true
+        }
+    }
+}"""
+
+    sleep_job = """#!/bin/bash
+#PBS -joe
+sleep 60
+"""
+
+    def setUp(self):
+        TestFunctional.setUp(self)
+        self.unified = self.get_unified_mount(self.mom.shortname)
+        if not self.unified:
+            self.skipTest('cgroup v2 unified hierarchy not mounted alone')
+        # Only remove the resources created here at the end of the test
+        self.created = []
+        for rsc in ['cpu_pressure', 'mem_pressure', 'io_pressure']:
+            try:
+                self.server.manager(MGR_CMD_CREATE, RSC, {'type': 'float'},
+                                    id=rsc, runas=ROOT_USER)
+                self.created.append(rsc)
+            except PbsManagerError:
+                pass
+        self.hook_name = 'pbs_cgroups'
+        hook_file = os.path.join(self.server.pbs_conf['PBS_EXEC'], 'lib',
+                                 'python', 'altair', 'pbs_hooks',
+                                 'pbs_cgroups.PY')
+        with open(hook_file, 'r') as fd:
+            script = fd.read()
+        events = ['execjob_begin', 'execjob_launch', 'execjob_attach',
+                  'execjob_epilogue', 'execjob_end', 'exechost_startup',
+                  'exechost_periodic']
+        a = {'enabled': 'True', 'freq': '5', 'alarm': 30, 'event': events}
+        self.server.create_import_hook(self.hook_name, a, script,
+                                       overwrite=True)
+        fn = self.du.create_temp_file(body=self.cfg)
+        a = {'content-type': 'application/x-config',
+             'content-encoding': 'default',
+             'input-file': fn}
+        self.server.manager(MGR_CMD_IMPORT, HOOK, a, self.hook_name)
+        os.remove(fn)
+        self.mom.log_match('pbs_cgroups.CF;copy hook-related '
+                           'file request received',
+                           starttime=self.server.ctime)
+        # A HUP of mom runs exechost_startup with the new configuration
+        self.mom.signal('-HUP')
+        self.server.expect(NODE, {'state': 'free'}, id=self.mom.shortname)
+
+    def tearDown(self):
+        self.server.cleanup_jobs()
+        # Restore the default configuration and disable the hook
+        config_file = os.path.join(self.server.pbs_conf['PBS_EXEC'], 'lib',
+                                   'python', 'altair', 'pbs_hooks',
+                                   'pbs_cgroups.CF')
+        a = {'content-type': 'application/x-config',
+             'content-encoding': 'default',
+             'input-file': config_file}
+        self.server.manager(MGR_CMD_IMPORT, HOOK, a, self.hook_name)
+        self.server.manager(MGR_CMD_SET, HOOK, {'enabled': 'False'},
+                            self.hook_name)
+        for rsc in self.created:
+            self.server.manager(MGR_CMD_DELETE, RSC, id=rsc,
+                                runas=ROOT_USER)
+        TestFunctional.tearDown(self)
+
+    def get_unified_mount(self, host):
+        """
+        Return the cgroup2 mount point if no cgroup v1 controllers are
+        mounted on host, otherwise None
+        """
+        unified = None
+        fd = self.du.cat(host, '/proc/mounts')
+        for line in fd['out']:
+            entries = line.split()
+            if entries[2] == 'cgroup':
+                return None
+            if entries[2] == 'cgroup2':
+                unified = entries[1]
+        return unified
+
+    def job_dir(self, jid):
+        """
+        Return the cgroup v2 directory of a job
+        """
+        return os.path.join(self.unified, 'pbs_jobs.service', 'jobid', jid)
+
+    def test_cgroup_v2_job_limits(self):
+        """
+        Test that a job gets a cgroup v2 directory with its memory limit,
+        cpuset and processes
+        """
+        a = {'Resource_List.select': '1:ncpus=1:mem=100mb:host=%s' %
+             self.mom.shortname}
+        j = Job(TEST_USER, attrs=a)
+        j.create_script(self.sleep_job)
+        jid = self.server.submit(j)
+        self.server.expect(JOB, {'job_state': 'R'}, jid)
+        jdir = self.job_dir(jid)
+        self.assertTrue(self.du.isdir(self.mom.shortname, jdir, sudo=True),
+                        'Job cgroup %s not found' % jdir)
+        ret = self.du.cat(self.mom.shortname,
+                          os.path.join(jdir, 'memory.max'), sudo=True)
+        self.assertEqual(ret['out'][0], str(100 * 1024 * 1024))
+        ret = self.du.cat(self.mom.shortname,
+                          os.path.join(jdir, 'cpuset.cpus'), sudo=True)
+        self.assertTrue(ret['out'] and ret['out'][0],
+                        'Empty cpuset.cpus for %s' % jid)
+        ret = self.du.cat(self.mom.shortname,
+                          os.path.join(jdir, 'cgroup.procs'), sudo=True)
+        self.assertTrue(ret['out'], 'No processes in %s' % jdir)
+        self.server.delete(jid, wait=True)
+        self.assertFalse(self.du.isdir(self.mom.shortname, jdir, sudo=True),
+                         'Job cgroup %s not removed' % jdir)
+
+    def test_cgroup_v2_pressure_usage(self):
+        """
+        Test that the periodic hook reports memory.peak and the pressure
+        stall information in resources_used
+        """
+        a = {'Resource_List.select': '1:ncpus=1:mem=100mb:host=%s' %
+             self.mom.shortname}
+        j = Job(TEST_USER, attrs=a)
+        j.create_script(self.sleep_job)
+        jid = self.server.submit(j)
+        self.server.expect(JOB, {'job_state': 'R'}, jid)
+        for rsc in ['mem', 'cput', 'cpu_pressure', 'mem_pressure',
+                    'io_pressure']:
+            self.server.expect(JOB, 'resources_used.%s' % rsc, op=SET,
+                               id=jid, max_attempts=30, interval=2)
+
+
+class TestCgroupsV2Offline(TestFunctional):
+    """
+    Test the cgroup v2 support of the cgroups hook on any host, with the
+    hook classes loaded on top of a mock of the hook runtime and run
+    against a fake cgroup2 unified hierarchy
+    """
+
+    def setUp(self):
+        TestFunctional.setUp(self)
+        pbs_dir = os.path.join(self.server.pbs_conf['PBS_EXEC'], 'lib',
+                               'python', 'altair')
+        hook_file = os.path.join(pbs_dir, 'pbs_hooks', 'pbs_cgroups.PY')
+        self.hook = pbs_v1_mock.load_hook(hook_file, pbs_dir)
+        self.pbs = sys.modules['pbs']
+        event = self.pbs.v1._svr_types._event(self.pbs.EXECHOST_PERIODIC,
+                                              'root', 'localhost')
+        event.hook_name = 'pbs_cgroups'
+        pbs_v1_mock.set_event(event)
+        self.root = self.du.create_temp_dir()
+        self.saved_config_file = os.environ.get('PBS_HOOK_CONFIG_FILE')
+        settings = {'nvidia-smi': os.path.join(self.root, 'nvidia-smi'),
+                    'report_pressure': True}
+        path = self.write('pbs_cgroups.json', json.dumps(settings))
+        os.environ['PBS_HOOK_CONFIG_FILE'] = path
+        self.cfg = self.hook.CgroupUtils.parse_config_file()
+
+    def tearDown(self):
+        if self.saved_config_file is None:
+            os.environ.pop('PBS_HOOK_CONFIG_FILE', None)
+        else:
+            os.environ['PBS_HOOK_CONFIG_FILE'] = self.saved_config_file
+        pbs_v1_mock.set_event(None)
+        self.du.rm(path=self.root, recursive=True, force=True)
+        TestFunctional.tearDown(self)
+
+    def write(self, path, body):
+        """
+        Write body to path, relative to the fake tree
+        """
+        path = os.path.join(self.root, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as desc:
+            desc.write(body)
+        return path
+
+    def cgroup_utils(self, controllers):
+        """
+        Return a CgroupUtils for a fake unified hierarchy exposing
+        controllers, without the node discovery done by its constructor
+        """
+        self.write(os.path.join('cgroup', 'cgroup.controllers'),
+                   ' '.join(controllers) + '\n')
+        cgroup = self.hook.CgroupUtils.__new__(self.hook.CgroupUtils)
+        cgroup.cfg = self.cfg
+        cgroup.paths = cgroup._get_paths_v2(os.path.join(self.root,
+                                                         'cgroup'))
+        cgroup.tasks_file = 'cgroup.procs'
+        cgroup.subsystems = ['cpuacct', 'hugetlb', 'memory', 'memsw']
+        return cgroup
+
+    def fake_job(self, jid, mem_peak, hpmem, cpu_usec, mem_max=0):
+        """
+        Populate the fake cgroup of job jid
+        """
+        jdir = os.path.join('cgroup', 'pbs_jobs.service', 'jobid', jid)
+        files = {'memory.peak': '%d\n' % mem_peak,
+                 'memory.events': 'low 0\nhigh 0\nmax %d\noom 0\n'
+                                  'oom_kill 0\n' % mem_max,
+                 'memory.swap.peak': '%d\n' % (mem_peak // 2),
+                 'memory.swap.events': 'high 0\nmax 0\nfail 0\n',
+                 'hugetlb.2MB.current': '%d\n' % hpmem,
+                 'hugetlb.2MB.events': 'max 0\n',
+                 'cpu.stat': 'usage_usec %d\nuser_usec %d\n'
+                             'system_usec 0\n' % (cpu_usec, cpu_usec),
+                 'cpu.pressure': 'some avg10=0.00 avg60=0.00 '
+                                 'avg300=0.00 total=1500000\n'
+                                 'full avg10=0.00 avg60=0.00 '
+                                 'avg300=0.00 total=0\n',
+                 'memory.pressure': 'some avg10=0.00 avg60=0.00 '
+                                    'avg300=0.00 total=250000\n'
+                                    'full avg10=0.00 avg60=0.00 '
+                                    'avg300=0.00 total=0\n'}
+        for name, body in files.items():
+            self.write(os.path.join(jdir, name), body)
+
+    def test_cgroup_v2_paths(self):
+        """
+        Test that the v2 paths only cover the controllers enabled in the
+        unified hierarchy and that the v1 file names are translated
+        """
+        cgroup = self.cgroup_utils(['cpuset', 'cpu', 'memory', 'pids'])
+        self.assertNotIn('hugetlb', cgroup.paths)
+        self.assertNotIn('blkio', cgroup.paths)
+        jdir = os.path.join(self.root, 'cgroup', 'pbs_jobs.service',
+                            'jobid', '1.svr')
+        self.assertEqual(cgroup._cgroup_path('memory', 'limit_in_bytes',
+                                             '1.svr'),
+                         os.path.join(jdir, 'memory.max'))
+        self.assertEqual(cgroup._cgroup_path('memsw', 'limit_in_bytes',
+                                             '1.svr'),
+                         os.path.join(jdir, 'memory.swap.max'))
+        self.assertEqual(cgroup._cgroup_path('cpuacct', 'usage', '1.svr'),
+                         os.path.join(jdir, 'cpu.stat'))
+        self.assertEqual(cgroup._cgroup_path('cpuset', 'tasks', '1.svr'),
+                         os.path.join(jdir, 'cgroup.procs'))
+        self.assertIsNone(cgroup._cgroup_path('hugetlb', 'limit_in_bytes',
+                                              '1.svr'))
+
+    def test_cgroup_v2_usage(self):
+        """
+        Test that the usage of jobs is read from the v2 files, with the
+        pressure stall information, and that the hugetlb usage reported
+        is the largest value seen since v2 only has the current usage
+        """
+        cgroup = self.cgroup_utils(['cpuset', 'cpu', 'memory', 'hugetlb',
+                                    'pids'])
+        self.fake_job('1.svr', 64 * 1024 * 1024, 8 * 1024 * 1024, 2500000)
+        self.fake_job('2.svr', 32 * 1024 * 1024, 0, 1000000, mem_max=3)
+        collector = self.hook.UsageCollector(cgroup.subsystems,
+                                             cgroup.paths, 2, True)
+        usage = collector.collect(['1.svr', '2.svr', '3.svr'])
+        self.assertEqual(usage['3.svr'], {})
+        self.assertEqual(usage['1.svr']['mem'], 64 * 1024 * 1024)
+        self.assertEqual(usage['1.svr']['vmem'], 96 * 1024 * 1024)
+        self.assertEqual(usage['1.svr']['hpmem'], 8 * 1024 * 1024)
+        self.assertEqual(usage['1.svr']['cput'], 2500000000)
+        self.assertEqual(usage['1.svr']['mem_failcnt'], 0)
+        self.assertEqual(usage['2.svr']['mem_failcnt'], 3)
+        self.assertEqual(usage['1.svr']['cpu_pressure'], 1.5)
+        self.assertEqual(usage['1.svr']['mem_pressure'], 0.25)
+        self.assertNotIn('io_pressure', usage['1.svr'])
+
+        resc_used = {}
+        cgroup.update_job_usage('1.svr', resc_used, force=True,
+                                usage=usage['1.svr'])
+        self.assertEqual(str(resc_used['mem']), '65536kb')
+        self.assertEqual(str(resc_used['vmem']), '98304kb')
+        self.assertEqual(str(resc_used['hpmem']), '8192kb')
+        self.assertEqual(float(resc_used['cpu_pressure']), 1.5)
+        # the hugepages were freed since the last update
+        self.write(os.path.join('cgroup', 'pbs_jobs.service', 'jobid',
+                                '1.svr', 'hugetlb.2MB.current'), '0\n')
+        usage = collector.collect(['1.svr'])
+        self.assertEqual(usage['1.svr']['hpmem'], 0)
+        cgroup.update_job_usage('1.svr', resc_used, force=True,
+                                usage=usage['1.svr'])
+        self.assertEqual(str(resc_used['hpmem']), '8192kb')
@@ -0,0 +1,271 @@
+# coding: utf-8
+
+# Copyright (C) 1994-2021 Altair Engineering, Inc.
+# For more information, contact Altair at www.altair.com.
+#
+# This file is part of both the OpenPBS software ("OpenPBS")
+# and the PBS Professional ("PBS Pro") software.
+#
+# Open Source License Information:
+#
+# OpenPBS is free software. You can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# OpenPBS is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Commercial License Information:
+#
+# PBS Pro is commercially licensed software that shares a common core with
+# the OpenPBS software.  For a copy of the commercial license terms and
+# conditions, go to: (http://www.pbspro.com/agreement.html) or contact the
+# Altair Legal Department.
+#
+# Altair's dual-license business model allows companies, individuals, and
+# organizations to create proprietary derivative works of OpenPBS and
+# distribute them - whether embedded or bundled with other software -
+# under a commercial license agreement.
+#
+# Use of Altair's trademarks, including but not limited to "PBS™",
+# "OpenPBS®", "PBS Professional®", and "PBS Pro™" and Altair's logos is
+# subject to Altair's trademark licensing policies.
+
+
+from tests.functional import *
+
+
+class TestPowerState(TestFunctional):
+    """
+    Test the state the PBS_power hook keeps between runs of its periodic
+    event and the power on planner built on it, using mocked vnode and
+    reservation lists
+    """
+
+    # Common part of the hook bodies: three mocked vnodes, one of them
+    # with a confirmed reservation, and a function that goes over them
+    # the way the periodic event does, returning the ones to evaluate.
+    hook_head = """
+import os
+import pbs
+from pbs.v1._pmi_utils import _power_view, _PowerState
+
+
+class Vnode:
+    def __init__(self, name, resv=None):
+        self.name = name
+        self.state = pbs.ND_FREE
+        self.resv = resv
+        self.last_used_time = 1000
+        self.last_state_change_time = 1000
+        self.poweroff_eligible = True
+        self.resources_available = {"host": name, "PBScraynid": "1"}
+
+
+class Resv:
+    def __init__(self, start):
+        self.reserve_state = pbs.RESV_STATE_CONFIRMED
+        self.reserve_start = start
+
+
+path = "STATE_FILE"
+vnodes = {"vn1": Vnode("vn1"), "vn2": Vnode("vn2"),
+          "vn3": Vnode("vn3", resv="R1.svr")}
+resvs = {"R1.svr": Resv(100000)}
+
+
+def run(state, time_now, recheck):
+    changed = []
+    for name in sorted(vnodes):
+        vnode = vnodes[name]
+        view = _power_view(vnode, resvs)
+        if state.observe(name, vnode.resources_available["host"], view,
+                         time_now):
+            changed.append(name)
+            state.evaluated(name, view, recheck)
+    state.prune()
+    return changed
+
+
+def report(tag, value):
+    pbs.logmsg(pbs.LOG_DEBUG, "power_state %s: %s" % (tag, value))
+"""
+
+    def setUp(self):
+        TestFunctional.setUp(self)
+        a = {'log_events': 2047}
+        self.server.manager(MGR_CMD_SET, SERVER, a)
+        self.state_file = os.path.join(self.server.pbs_conf['PBS_HOME'],
+                                       'server_priv', 'hooks', 'tmp',
+                                       'pbs_power_state_test')
+
+    def run_hook(self, body):
+        """
+        Run body after the common hook head in a queuejob hook
+        """
+        hook_body = self.hook_head.replace('STATE_FILE', self.state_file)
+        hook_body += body + "\npbs.event().accept()\n"
+        a = {'event': 'queuejob', 'enabled': 'True'}
+        self.server.create_import_hook('power_state', a, hook_body)
+        self.server.submit(Job(TEST_USER))
+
+    def test_changed_vnodes(self):
+        """
+        Only the vnodes that changed since they were last evaluated, or
+        whose recheck time is reached, are evaluated again
+        """
+        body = """
+state = _PowerState(path)
+report("first", run(state, 2000, 5000))
+report("unchanged", run(state, 2010, 5000))
+vnodes["vn2"].last_used_time = 2015
+resvs["R1.svr"].reserve_state = pbs.RESV_STATE_RUNNING
+report("changed", run(state, 2020, 5000))
+report("recheck", run(state, 5000, 9000))
+"""
+        self.run_hook(body)
+        self.server.log_match(
+            "power_state first: ['vn1', 'vn2', 'vn3']")
+        self.server.log_match("power_state unchanged: []")
+        self.server.log_match("power_state changed: ['vn2', 'vn3']")
+        self.server.log_match(
+            "power_state recheck: ['vn1', 'vn2', 'vn3']")
+
+    def test_state_survives_restart(self):
+        """
+        Pending transitions and what was evaluated are read back from
+        the state file, and vnodes that went away are forgotten
+        """
+        body = """
+state = _PowerState(path)
+run(state, 2000, 5000)
+state.start(["vn1"], "on", 2000)
+state.save()
+del vnodes["vn2"]
+state = _PowerState(path)
+report("booting", state.pending_hosts("on"))
+report("reloaded", run(state, 2010, 5000))
+state.finish(["vn1"], "on", 2020)
+state.save()
+state = _PowerState(path)
+report("booted", state.pending_hosts("on"))
+report("kept", sorted(state.vnodes))
+"""
+        self.run_hook(body)
+        self.server.log_match("power_state booting: ['vn1']")
+        self.server.log_match("power_state reloaded: []")
+        self.server.log_match("power_state booted: []")
+        self.server.log_match("power_state kept: ['vn1', 'vn3']")
+
+    def test_config_change(self):
+        """
+        The hook config is only read again when its file changes, and
+        then every vnode is evaluated again
+        """
+        body = """
+cfg = path + ".CF"
+with open(cfg, "w") as fp:
+    fp.write('{"max_concurrent_nodes": 10}')
+os.utime(cfg, (1000, 1000))
+state = _PowerState(path)
+state.read_config(cfg)
+run(state, 2000, 5000)
+with open(cfg, "w") as fp:
+    fp.write('{"max_concurrent_nodes": 20}')
+os.utime(cfg, (1000, 1000))
+report("cached", state.read_config(cfg)["max_concurrent_nodes"])
+report("same config", run(state, 2010, 5000))
+os.utime(cfg, (2000, 2000))
+report("reread", state.read_config(cfg)["max_concurrent_nodes"])
+report("new config", run(state, 2020, 5000))
+"""
+        self.run_hook(body)
+        self.server.log_match("power_state cached: 10")
+        self.server.log_match("power_state same config: []")
+        self.server.log_match("power_state reread: 20")
+        self.server.log_match(
+            "power_state new config: ['vn1', 'vn2', 'vn3']")
+
+    def test_power_on_planner(self):
+        """
+        Hosts are powered on early enough to be up when they are needed,
+        using their recorded boot durations, on a simulated clock and
+        with a fake capmc
+        """
+        body = """
+from pbs.v1._pmi_utils import _PowerPlanner
+
+clock = [0]
+
+
+class FakeCapmc:
+    # Hosts report ready once their boot time has passed on the clock
+    def __init__(self, boot):
+        self.boot = boot
+        self.on = {}
+
+    def power_on(self, hosts):
+        for host in hosts:
+            self.on[host] = clock[0]
+
+    def power_status(self, hosts):
+        return {host for host in hosts
+                if clock[0] - self.on[host] >= self.boot[host]}
+
+
+def periodic(state, capmc, neededby, until, freq=300):
+    powered_on = {}
+    ready = {}
+    while clock[0] <= until:
+        for host in vnodes:
+            state.observe(host, host, [], clock[0])
+        done = capmc.power_status(state.pending_hosts("on"))
+        state.finish(done, "on", clock[0])
+        for host in done:
+            ready[host] = clock[0]
+        planner = _PowerPlanner(state, clock[0], freq)
+        todo = [host for host in sorted(neededby) if host not in powered_on
+                and planner.power_on_now(host, neededby[host])]
+        capmc.power_on(todo)
+        state.start(todo, "on", clock[0])
+        for host in todo:
+            powered_on[host] = clock[0]
+        clock[0] += freq
+    return (sorted(powered_on.items()), sorted(ready.items()))
+
+
+capmc = FakeCapmc({"vn1": 1200, "vn2": 400, "vn3": 700})
+state = _PowerState(path)
+report("unmeasured", periodic(state, capmc, {"vn1": 5000}, 5100))
+state.save()
+state = _PowerState(path)
+report("boots", sorted(state.boots.items()))
+clock[0] = 6000
+need = {"vn1": 12000, "vn2": 12000, "vn3": 12000}
+report("measured", periodic(state, capmc, need, 12000))
+report("boots after", sorted(state.boots.items()))
+"""
+        self.run_hook(body)
+        # Without a recorded boot the default of 900 seconds is too short
+        self.server.log_match(
+            "power_state unmeasured: ([('vn1', 3900)], [('vn1', 5100)])")
+        self.server.log_match("power_state boots: [('vn1', [1200])]")
+        self.server.log_match(
+            "power_state measured: ([('vn1', 10800), ('vn2', 11100), "
+            "('vn3', 11100)], [('vn1', 12000), ('vn2', 11700), "
+            "('vn3', 12000)])")
+        self.server.log_match(
+            "power_state boots after: [('vn1', [1200, 1200]), "
+            "('vn2', [600]), ('vn3', [900])]")
+
+    def tearDown(self):
+        for f in ('', '.tmp', '.CF'):
+            self.du.rm(self.server.hostname, path=self.state_file + f,
+                       sudo=True, force=True)
+        TestFunctional.tearDown(self)
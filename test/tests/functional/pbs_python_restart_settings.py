@@ -429,3 +429,44 @@ pbs.event().accept()
         msg = "Restarting Python interpreter to reduce mem usage"
         self.server.log_match(msg, starttime=stime, max_attempts=8,
                               existence=False)
+
+    def test_objects_released(self):
+        """
+        Test that vnode objects looked up and dropped by a hook are
+        freed by the interpreter, instead of being kept alive by the
+        descriptors holding their attribute values
+        """
+        hook_body = """
+import gc
+import weakref
+import pbs
+
+localnode = pbs.get_local_nodename()
+refs = []
+for _ in range(1000):
+    vn = pbs.server().vnode(localnode)
+    vn.state
+    vn.comment
+    vn.resources_available
+    refs.append(weakref.ref(vn))
+vn = None
+gc.collect()
+released = len([r for r in refs if r() is None])
+pbs.logmsg(pbs.LOG_DEBUG, "released %d of %d objects"
+           % (released, len(refs)))
+pbs.event().accept()
+"""
+        a = {'event': "queuejob", 'enabled': "True"}
+        self.server.create_import_hook("test", a, hook_body, overwrite=True)
+        self.server.manager(MGR_CMD_SET, SERVER, {"log_events": 2047})
+        stime = time.time()
+        for x in range(3):
+            j = Job()
+            j.set_sleep_time(1)
+            self.server.submit(j)
+        # every run of the hook in the same interpreter must free all of
+        # the objects it created
+        lines = self.server.log_match("released 1000 of 1000 objects",
+                                      starttime=stime, allmatch=True,
+                                      n='ALL', max_attempts=5)
+        self.assertEqual(len(lines), 3)
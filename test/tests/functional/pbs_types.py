@@ -69,3 +69,72 @@ pbs.logmsg(pbs.EVENT_DEBUG, 'd=%s, e=%s, f=%s' % (d, e, f))
         self.server.submit(j)
         self.server.log_match("a=1000b, b=1000b, c=1000b")
         self.server.log_match("d=1mb, e=1mb, f=1mb")
+
+    def test_resource_parsers_round_trip(self):
+        """
+        Test that select and exec_vnode specs generated at random survive
+        a parse and format round trip, that parsing is memoized, and that
+        pbs.select.increment_chunks() still gives the documented results
+        """
+        hook_content = ("""
+import random
+import pbs
+from pbs.v1._base_types import (_parse_select, _format_select,
+                                _parse_exec_vnode, _format_exec_vnode)
+
+rnd = random.Random(4242)
+rescs = ['ncpus', 'mem', 'ngpus', 'host', 'vmem']
+vals = ['1', '2', '16', '1gb', '512mb', 'node_a', '3kb']
+
+
+def rand_items():
+    return ['%s=%s' % (rnd.choice(rescs), rnd.choice(vals))
+            for _ in range(rnd.randint(1, 4))]
+
+
+failed = 0
+for n in range(500):
+    chunks = []
+    for c in range(rnd.randint(1, 4)):
+        items = rand_items()
+        if rnd.random() < 0.7:
+            items.insert(0, str(rnd.randint(0, 64)))
+        chunks.append(':'.join(items))
+    spec = '+'.join(chunks)
+    parsed = _parse_select(spec)
+    if _format_select(parsed) != spec or _parse_select(spec) is not parsed:
+        pbs.logmsg(pbs.EVENT_DEBUG, 'select round trip failed: %s' % spec)
+        failed += 1
+
+    groups = []
+    for g in range(rnd.randint(1, 4)):
+        vnodes = ['vn%d:%s' % (rnd.randint(0, 99), ':'.join(rand_items()))
+                  for _ in range(rnd.randint(1, 3))]
+        groups.append('(%s)' % '+'.join(vnodes))
+    spec = '+'.join(groups)
+    parsed = _parse_exec_vnode(spec)
+    if _format_exec_vnode(parsed) != spec or \\
+            _parse_exec_vnode(spec) is not parsed:
+        pbs.logmsg(pbs.EVENT_DEBUG, 'exec_vnode round trip failed: %s' % spec)
+        failed += 1
+pbs.logmsg(pbs.EVENT_DEBUG, 'parser round trip failures=%d' % failed)
+
+sel = pbs.select('ncpus=3:mem=1gb+1:ncpus=2:mem=2gb+2:ncpus=1:mem=3gb')
+pbs.logmsg(pbs.EVENT_DEBUG, 'inc1=%s' % sel.increment_chunks(2))
+pbs.logmsg(pbs.EVENT_DEBUG, 'inc2=%s' % sel.increment_chunks('23.5%'))
+pbs.logmsg(pbs.EVENT_DEBUG,
+           'inc3=%s' % sel.increment_chunks({0: 0, 1: 4, 2: '50%'}))
+""")
+        hook_name = 'parsers'
+        hook_attr = {'enabled': 'true', 'event': 'queuejob'}
+        self.server.create_import_hook(hook_name, hook_attr, hook_content)
+
+        j = Job(TEST_USER)
+        self.server.submit(j)
+        self.server.log_match("parser round trip failures=0")
+        self.server.log_match(
+            "inc1=1:ncpus=3:mem=1gb+3:ncpus=2:mem=2gb+4:ncpus=1:mem=3gb")
+        self.server.log_match(
+            "inc2=1:ncpus=3:mem=1gb+2:ncpus=2:mem=2gb+3:ncpus=1:mem=3gb")
+        self.server.log_match(
+            "inc3=1:ncpus=3:mem=1gb+5:ncpus=2:mem=2gb+3:ncpus=1:mem=3gb")
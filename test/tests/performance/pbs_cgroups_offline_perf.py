@@ -0,0 +1,206 @@
+# coding: utf-8
+
+# Copyright (C) 1994-2021 Altair Engineering, Inc.
+# For more information, contact Altair at www.altair.com.
+#
+# This file is part of both the OpenPBS software ("OpenPBS")
+# and the PBS Professional ("PBS Pro") software.
+#
+# Open Source License Information:
+#
+# OpenPBS is free software. You can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# OpenPBS is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Commercial License Information:
+#
+# PBS Pro is commercially licensed software that shares a common core with
+# the OpenPBS software.  For a copy of the commercial license terms and
+# conditions, go to: (http://www.pbspro.com/agreement.html) or contact the
+# Altair Legal Department.
+#
+# Altair's dual-license business model allows companies, individuals, and
+# organizations to create proprietary derivative works of OpenPBS and
+# distribute them - whether embedded or bundled with other software -
+# under a commercial license agreement.
+#
+# Use of Altair's trademarks, including but not limited to "PBS™",
+# "OpenPBS®", "PBS Professional®", and "PBS Pro™" and Altair's logos is
+# subject to Altair's trademark licensing policies.
+
+
+from tests.performance import *
+from ptl.lib import pbs_v1_mock
+
+
+class TestCgroupsOfflinePerf(TestPerformance):
+    """
+    Performance of the cgroups hook classes, loaded in the test process
+    on top of a mock of the hook runtime and run against synthetic
+    cgroup trees, so that many more jobs can be measured than the test
+    hosts could run
+    """
+
+    def setUp(self):
+        TestPerformance.setUp(self)
+        pbs_dir = os.path.join(self.server.pbs_conf['PBS_EXEC'], 'lib',
+                               'python', 'altair')
+        hook_file = os.path.join(pbs_dir, 'pbs_hooks', 'pbs_cgroups.PY')
+        self.hook = pbs_v1_mock.load_hook(hook_file, pbs_dir)
+        self.pbs = sys.modules['pbs']
+        event = self.pbs.v1._svr_types._event(self.pbs.EXECHOST_PERIODIC,
+                                              'root', 'localhost')
+        event.hook_name = 'pbs_cgroups'
+        pbs_v1_mock.set_event(event)
+        self.root = self.du.create_temp_dir()
+        self.saved_mask = pbs_v1_mock.log_event_mask
+
+    def tearDown(self):
+        pbs_v1_mock.log_event_mask = self.saved_mask
+        pbs_v1_mock.set_event(None)
+        self.du.rm(path=self.root, recursive=True, force=True)
+        TestPerformance.tearDown(self)
+
+    def fake_v1_tree(self, root, njobs):
+        """
+        Create the cgroup v1 job directories of njobs jobs under the
+        memory, hugetlb and cpuacct hierarchies of a synthetic tree in
+        root and return (paths, jobids), paths being the cgroup file prefix of
+        each subsystem as CgroupUtils sets it up
+        """
+        files = {'memory': {'memory.max_usage_in_bytes': 1048576,
+                            'memory.failcnt': 0,
+                            'memory.memsw.max_usage_in_bytes': 2097152,
+                            'memory.memsw.failcnt': 0},
+                 'hugetlb': {'hugetlb.2MB.max_usage_in_bytes': 4194304,
+                             'hugetlb.2MB.failcnt': 0},
+                 'cpuacct': {'cpuacct.usage': 1000000000}}
+        paths = {}
+        jobids = ['%d.fakeserver' % i for i in range(njobs)]
+        for (hierarchy, cgfiles) in files.items():
+            jobdir = os.path.join(root, hierarchy, 'pbs_jobs.service',
+                                  'jobid')
+            for jobid in jobids:
+                os.makedirs(os.path.join(jobdir, jobid))
+                for (cgfile, value) in cgfiles.items():
+                    with open(os.path.join(jobdir, jobid, cgfile),
+                              'w') as desc:
+                        desc.write('%d\n' % value)
+        for subsys in ('memory', 'memsw', 'hugetlb', 'cpuacct'):
+            hierarchy = 'memory' if subsys == 'memsw' else subsys
+            prefix = {'memsw': 'memory.memsw.',
+                      'hugetlb': 'hugetlb.2MB.'}.get(subsys, subsys + '.')
+            paths[subsys] = os.path.join(root, hierarchy,
+                                         'pbs_jobs.service', 'jobid', prefix)
+        return (paths, jobids)
+
+    def read_per_job(self, paths, jobids):
+        """
+        Read the usage files of each job on its own with the file API,
+        as the hook did before the usage of all the jobs was collected
+        in one pass
+        """
+        files = self.hook.UsageCollector.FILES
+        usage = {}
+        for jobid in jobids:
+            usage[jobid] = {}
+            for (subsys, path) in paths.items():
+                (subdir, prefix) = os.path.split(path)
+                for (cgfile, key, parser) in files[subsys]:
+                    with open(os.path.join(subdir, jobid, prefix + cgfile),
+                              'r') as desc:
+                        usage[jobid][key] = int(desc.read().strip())
+        return usage
+
+    @timeout(1800)
+    def test_usage_collector_many_jobs(self):
+        """
+        Collect the usage of 1000 and 5000 jobs from a synthetic cgroup v1
+        tree, in one pass with UsageCollector and job by job, and report
+        both times
+        """
+        subsystems = ['cpuacct', 'hugetlb', 'memory', 'memsw']
+        for njobs in (1000, 5000):
+            root = os.path.join(self.root, str(njobs))
+            (paths, jobids) = self.fake_v1_tree(root, njobs)
+            collector = self.hook.UsageCollector(subsystems, paths)
+            # the first pass warms the dentry cache for both methods
+            usage = collector.collect(jobids)
+            self.assertEqual(usage, self.read_per_job(paths, jobids))
+            self.assertEqual(usage[jobids[-1]],
+                             {'mem': 1048576, 'mem_failcnt': 0,
+                              'vmem': 2097152, 'vmem_failcnt': 0,
+                              'hpmem': 4194304, 'hpmem_failcnt': 0,
+                              'cput': 1000000000})
+            times = {'collector': [], 'per_job': []}
+            for _ in range(3):
+                start = time.time()
+                collector.collect(jobids)
+                times['collector'].append((time.time() - start) * 1000)
+                start = time.time()
+                self.read_per_job(paths, jobids)
+                times['per_job'].append((time.time() - start) * 1000)
+            self.logger.info('%d jobs: collector %.1f ms, per job %.1f ms',
+                             njobs, min(times['collector']),
+                             min(times['per_job']))
+            self.perf_test_result(times['collector'],
+                                  'usage_collector_%d_jobs' % njobs, 'ms')
+            self.perf_test_result(times['per_job'],
+                                  'usage_per_job_%d_jobs' % njobs, 'ms')
+            self.assertLess(min(times['collector']), min(times['per_job']))
+
+    def set_log_event_mask(self, mask):
+        """
+        Make the hook log the event classes in mask, as the $logevent
+        setting of a MoM would
+        """
+        pbs_v1_mock.log_event_mask = mask
+        self.hook.log.recorded.clear()
+
+    @timeout(1800)
+    def test_update_job_usage_logging(self):
+        """
+        Update the resources_used of 2000 jobs from their collected usage,
+        as the periodic event does, with every log event class recorded,
+        with the debug classes masked and with the job class masked as
+        well, and report the three times
+        """
+        njobs = 2000
+        (paths, jobids) = self.fake_v1_tree(self.root, njobs)
+        cgroup = self.hook.CgroupUtils.__new__(self.hook.CgroupUtils)
+        cgroup.cgroup_version = 1
+        cgroup.subsystems = ['cpuacct', 'hugetlb', 'memory', 'memsw']
+        collected = self.hook.UsageCollector(cgroup.subsystems,
+                                             paths).collect(jobids)
+        debug = (self.pbs.EVENT_DEBUG | self.pbs.EVENT_DEBUG2 |
+                 self.pbs.EVENT_DEBUG3 | self.pbs.EVENT_DEBUG4)
+        masks = {'all': 0xffff,
+                 'debug_off': 0x1ff & ~debug,
+                 'job_off': 0x1ff & ~debug & ~self.pbs.EVENT_JOB}
+        times = {}
+        for (name, mask) in masks.items():
+            self.set_log_event_mask(mask)
+            times[name] = []
+            for _ in range(5):
+                start = time.time()
+                for jobid in jobids:
+                    resc_used = {'walltime': 100, 'cput': 50}
+                    cgroup.update_job_usage(jobid, resc_used, force=True,
+                                            usage=collected[jobid])
+                times[name].append((time.time() - start) * 1000)
+            self.assertEqual(str(resc_used['mem']), '1024kb')
+            self.logger.info('%d jobs, %s logged: %.1f ms', njobs, name,
+                             min(times[name]))
+            self.perf_test_result(times[name],
+                                  'update_job_usage_%d_jobs_%s' %
+                                  (njobs, name), 'ms')
+        self.assertLess(min(times['job_off']), min(times['all']))
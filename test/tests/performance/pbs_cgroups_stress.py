@@ -280,3 +280,35 @@ class TestCgroupsStress(TestPerformance):
         # Check the logs one last time to ensure it passed
         self.mom.log_match(msg="IOError", starttime=now,
                            existence=False, max_attempts=10, n="ALL")
+
+    @timeout(1200)
+    def test_cgroups_launch_many_processes(self):
+        """
+        Measure how long instant jobs take to run on a node with a large
+        process table, which the hook scans to attach job processes to
+        their cgroups in execjob_launch.
+        """
+        nprocs = 5000
+        marker = 'sleep 7531'
+        self.du.run_cmd(self.mom.shortname,
+                        cmd=['for i in $(seq %d); do setsid %s '
+                             '>/dev/null 2>&1 & done' % (nprocs, marker)],
+                        as_script=True)
+        try:
+            attr = {'job_history_enable': 'true'}
+            self.server.manager(MGR_CMD_SET, SERVER, attr)
+            self.load_config(self.cfg0 % self.swapctl)
+            j = Job(TEST_USER, attrs={ATTR_J: '0-99'})
+            j.create_script(self.true_script)
+            start = time.time()
+            jid = self.server.submit(j)
+            self.server.expect(JOB, {'job_state': 'F'}, id=jid, extend='x',
+                               interval=1, max_attempts=600)
+            elapsed = time.time() - start
+        finally:
+            self.du.run_cmd(self.mom.shortname,
+                            cmd=['pkill', '-f', marker])
+        self.logger.info('100 jobs with %d processes on the node took '
+                         '%.2f seconds' % (nprocs, elapsed))
+        self.perf_test_result(elapsed, 'jobs_with_%d_processes' % nprocs,
+                              'sec')
@@ -0,0 +1,261 @@
+# coding: utf-8
+
+# Copyright (C) 1994-2021 Altair Engineering, Inc.
+# For more information, contact Altair at www.altair.com.
+#
+# This file is part of both the OpenPBS software ("OpenPBS")
+# and the PBS Professional ("PBS Pro") software.
+#
+# Open Source License Information:
+#
+# OpenPBS is free software. You can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# OpenPBS is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Commercial License Information:
+#
+# PBS Pro is commercially licensed software that shares a common core with
+# the OpenPBS software.  For a copy of the commercial license terms and
+# conditions, go to: (http://www.pbspro.com/agreement.html) or contact the
+# Altair Legal Department.
+#
+# Altair's dual-license business model allows companies, individuals, and
+# organizations to create proprietary derivative works of OpenPBS and
+# distribute them - whether embedded or bundled with other software -
+# under a commercial license agreement.
+#
+# Use of Altair's trademarks, including but not limited to "PBS™",
+# "OpenPBS®", "PBS Professional®", and "PBS Pro™" and Altair's logos is
+# subject to Altair's trademark licensing policies.
+
+import re
+
+from tests.performance import *
+
+
+class TestHookStatobjPerf(TestPerformance):
+    """
+    Performance of server object lookups made by pbs_python hooks
+    """
+
+    hook_body = """
+import time
+import pbs
+
+node = pbs.get_local_nodename()
+count = %d
+
+# what every lookup cost before connections were pooled
+start = time.time()
+for _ in range(count):
+    pbs.invalidate_stat_cache()
+    pbs.v1._svr_types._server_conns.close_all()
+    pbs.server().vnode(node)
+connect = time.time() - start
+
+start = time.time()
+for _ in range(count):
+    pbs.invalidate_stat_cache()
+    pbs.server().vnode(node)
+pooled = time.time() - start
+
+# an unknown vnode must not make the pooled connection be reopened
+start = time.time()
+for _ in range(count):
+    pbs.invalidate_stat_cache()
+    pbs.server().vnode(node + "-nonexistent")
+missing = time.time() - start
+
+start = time.time()
+for _ in range(count):
+    pbs.server().vnode(node)
+cached = time.time() - start
+
+pbs.logmsg(pbs.LOG_DEBUG,
+           "statobj_perf connect=%%f pooled=%%f missing=%%f cached=%%f"
+           %% (connect, pooled, missing, cached))
+pbs.event().accept()
+"""
+
+    @timeout(600)
+    def test_vnode_lookups(self):
+        """
+        Look up the local vnode 1000 times from an exechost_periodic hook:
+        - with the stat cache invalidated and the server connection closed
+          before every lookup, so each one connects as before pooling;
+        - with the stat cache invalidated before every lookup, so each
+          one goes to the server over the pooled loopback connection;
+        - the same for a vnode that does not exist;
+        - letting the cache answer.
+        Report the four times.
+        """
+        count = 1000
+        a = {'event': 'exechost_periodic', 'enabled': 'True', 'freq': 10}
+        start = time.time()
+        self.server.create_import_hook('statobj_perf', a,
+                                       self.hook_body % count)
+        (_, msg) = self.mom.log_match('statobj_perf connect=',
+                                      starttime=start, max_attempts=60,
+                                      interval=2)
+        m = re.search(r'connect=(\S+) pooled=(\S+) missing=(\S+) '
+                      r'cached=(\S+)', msg)
+        self.assertTrue(m, 'hook did not report its timings')
+        (connect, pooled, missing, cached) = map(float, m.groups())
+        self.logger.info('%d vnode lookups: connect %f sec, pooled %f sec, '
+                         'missing %f sec, cached %f sec',
+                         count, connect, pooled, missing, cached)
+        self.perf_test_result(connect, "vnode_lookups_connect", "sec")
+        self.perf_test_result(pooled, "vnode_lookups_pooled", "sec")
+        self.perf_test_result(missing, "vnode_lookups_missing", "sec")
+        self.perf_test_result(cached, "vnode_lookups_cached", "sec")
+        self.assertLess(pooled, connect)
+        self.assertLess(missing, connect)
+        self.assertLess(cached, pooled)
+
+    filter_hook_body = """
+import time
+import pbs
+
+node = pbs.get_local_nodename()
+count = %d
+wanted = ["state", "comment"]
+
+
+def nattrs(vn):
+    return len([n for n in vn.attributes if getattr(vn, n) is not None])
+
+
+start = time.time()
+for _ in range(count):
+    pbs.invalidate_stat_cache()
+    vn = pbs.server().vnode(node)
+full = time.time() - start
+full_attrs = nattrs(vn)
+
+start = time.time()
+for _ in range(count):
+    pbs.invalidate_stat_cache()
+    vn = pbs.server().vnode(node, attribs=wanted)
+filtered = time.time() - start
+filtered_attrs = nattrs(vn)
+
+pbs.logmsg(pbs.LOG_DEBUG,
+           "statobj_filter full=%%f/%%d filtered=%%f/%%d"
+           %% (full, full_attrs, filtered, filtered_attrs))
+pbs.event().accept()
+"""
+
+    @timeout(600)
+    def test_vnode_lookups_filtered(self):
+        """
+        Look up the local vnode 1000 times from an exechost_periodic hook,
+        once fetching every attribute and once only 'state' and 'comment',
+        and report the time taken and the number of attributes decoded.
+        """
+        count = 1000
+        a = {'event': 'exechost_periodic', 'enabled': 'True', 'freq': 10}
+        start = time.time()
+        self.server.create_import_hook('statobj_filter', a,
+                                       self.filter_hook_body % count)
+        (_, msg) = self.mom.log_match('statobj_filter full=',
+                                      starttime=start, max_attempts=60,
+                                      interval=2)
+        m = re.search(r'full=(\S+)/(\d+) filtered=(\S+)/(\d+)', msg)
+        self.assertTrue(m, 'hook did not report its timings')
+        full = float(m.group(1))
+        full_attrs = int(m.group(2))
+        filtered = float(m.group(3))
+        filtered_attrs = int(m.group(4))
+        self.logger.info('%d vnode lookups: all attributes (%d) %f sec, '
+                         'filtered (%d) %f sec', count, full_attrs, full,
+                         filtered_attrs, filtered)
+        self.perf_test_result(full, "vnode_lookups_all_attribs", "sec")
+        self.perf_test_result(filtered, "vnode_lookups_filtered", "sec")
+        self.perf_test_result(full_attrs, "vnode_attribs_all", "count")
+        self.perf_test_result(filtered_attrs, "vnode_attribs_filtered",
+                              "count")
+        self.assertLessEqual(filtered_attrs, 2)
+        self.assertLess(filtered_attrs, full_attrs)
+
+    iter_hook_body = """
+import resource
+import time
+import pbs
+
+start = time.time()
+count = 0
+%s
+elapsed = time.time() - start
+maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+pbs.logmsg(pbs.LOG_DEBUG, "statobj_iter count=%%d time=%%f maxrss=%%d"
+           %% (count, elapsed, maxrss))
+pbs.event().accept()
+"""
+
+    python_filter_loop = """
+for vn in pbs.server().vnodes():
+    if vn.state & pbs.ND_OFFLINE:
+        count += 1
+"""
+
+    criteria_loop = """
+for vn in pbs.server().vnodes(criteria={"state": "offline"}):
+    count += 1
+"""
+
+    def run_iter_hook(self, hook_name, loop):
+        """
+        Run the vnode iteration 'loop' in an exechost_periodic hook and
+        return the (count, time, maxrss) it reports.
+        """
+        a = {'event': 'exechost_periodic', 'enabled': 'True', 'freq': 10}
+        start = time.time()
+        self.server.create_import_hook(hook_name, a,
+                                       self.iter_hook_body % loop)
+        (_, msg) = self.mom.log_match('statobj_iter count=',
+                                      starttime=start, max_attempts=60,
+                                      interval=2)
+        self.server.manager(MGR_CMD_DELETE, HOOK, id=hook_name)
+        m = re.search(r'count=(\d+) time=(\S+) maxrss=(\d+)', msg)
+        self.assertTrue(m, 'hook did not report its timings')
+        return (int(m.group(1)), float(m.group(2)), int(m.group(3)))
+
+    @timeout(3600)
+    def test_vnode_iter_criteria(self):
+        """
+        Create 5000 vnodes, take every tenth one offline, then count the
+        offline vnodes from a hook, first testing the state of every vnode
+        in Python and then passing the state as iterator criteria, and
+        report the time taken and the peak memory of each run.
+        """
+        num = 5000
+        self.mom.create_vnodes({'resources_available.ncpus': 1}, num,
+                               sharednode=False, expect=False)
+        self.server.expect(NODE, {'state=free': (GE, num)})
+        for i in range(0, num, 10):
+            self.server.manager(MGR_CMD_SET, NODE, {'state': 'offline'},
+                                id='%s[%d]' % (self.mom.shortname, i))
+
+        (count1, time1, rss1) = self.run_iter_hook('statobj_iter_py',
+                                                   self.python_filter_loop)
+        (count2, time2, rss2) = self.run_iter_hook('statobj_iter_crit',
+                                                   self.criteria_loop)
+        self.logger.info('python filter: %d vnodes in %f sec, maxrss %d KB',
+                         count1, time1, rss1)
+        self.logger.info('iter criteria: %d vnodes in %f sec, maxrss %d KB',
+                         count2, time2, rss2)
+        self.perf_test_result(time1, "vnode_iter_python_filter", "sec")
+        self.perf_test_result(time2, "vnode_iter_criteria", "sec")
+        self.perf_test_result(rss1, "vnode_iter_python_filter_maxrss", "KB")
+        self.perf_test_result(rss2, "vnode_iter_criteria_maxrss", "KB")
+        self.assertEqual(count1, num // 10)
+        self.assertEqual(count2, num // 10)
@@ -0,0 +1,193 @@
+# coding: utf-8
+
+# Copyright (C) 1994-2021 Altair Engineering, Inc.
+# For more information, contact Altair at www.altair.com.
+#
+# This file is part of both the OpenPBS software ("OpenPBS")
+# and the PBS Professional ("PBS Pro") software.
+#
+# Open Source License Information:
+#
+# OpenPBS is free software. You can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# OpenPBS is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Commercial License Information:
+#
+# PBS Pro is commercially licensed software that shares a common core with
+# the OpenPBS software.  For a copy of the commercial license terms and
+# conditions, go to: (http://www.pbspro.com/agreement.html) or contact the
+# Altair Legal Department.
+#
+# Altair's dual-license business model allows companies, individuals, and
+# organizations to create proprietary derivative works of OpenPBS and
+# distribute them - whether embedded or bundled with other software -
+# under a commercial license agreement.
+#
+# Use of Altair's trademarks, including but not limited to "PBS™",
+# "OpenPBS®", "PBS Professional®", and "PBS Pro™" and Altair's logos is
+# subject to Altair's trademark licensing policies.
+
+
+import re
+from tests.performance import *
+
+
+class TestPowerPeriodicPerf(TestPerformance):
+    """
+    Time taken by an exechost_periodic hook to gather the energy usage of
+    the running jobs through the Cray power interface, against a fake capmc
+    that answers after a fixed delay
+    """
+    capmc = os.path.join(os.sep, 'opt', 'cray', 'capmc', 'default', 'bin',
+                         'capmc')
+
+    fake_capmc = """#!/usr/bin/env python3
+# Stand-in for capmc: record the call and report an energy counter for
+# every nid asked for
+import json
+import sys
+import time
+
+with open("%s", "a") as fp:
+    fp.write(" ".join(sys.argv[1:]) + "\\n")
+# capmc answers through a REST call to the SMW
+time.sleep(0.2)
+nids = []
+if "--nids" in sys.argv:
+    for r in sys.argv[sys.argv.index("--nids") + 1].split(","):
+        (first, _, last) = r.partition("-")
+        nids += range(int(first), int(last or first) + 1)
+print(json.dumps({"e": 0, "err_msg": "", "nid_count": len(nids),
+                  "nodes": [{"nid": n, "energy_ctr": 1000} for n in nids]}))
+"""
+
+    hook_body = """
+import time
+import pbs
+
+
+def ncalls():
+    try:
+        with open("%s") as fp:
+            return len(fp.readlines())
+    except IOError:
+        return 0
+
+
+e = pbs.event()
+power = pbs.Power("cray")
+power.connect()
+calls = ncalls()
+start = time.time()
+for jobid, job in e.job_list.items():
+    power.get_usage(job)
+elapsed = time.time() - start
+power.disconnect()
+pbs.logmsg(pbs.LOG_DEBUG, "power_periodic jobs=%%d calls=%%d time=%%f" %%
+           (len(e.job_list), ncalls() - calls, elapsed))
+e.accept()
+"""
+
+    def setUp(self):
+        TestPerformance.setUp(self)
+        if self.du.isfile(self.mom.hostname, self.capmc):
+            self.skipTest("capmc found on %s, not replacing it" %
+                          self.mom.hostname)
+        self.energy_files = []
+        self.calls = self.du.create_temp_file(self.mom.hostname)
+        fn = self.du.create_temp_file(body=self.fake_capmc % self.calls)
+        # the topmost directory of the capmc path that does not exist yet,
+        # removed with everything under it in tearDown
+        self.capmc_dir = None
+        path = os.path.dirname(self.capmc)
+        while not self.du.isdir(self.mom.hostname, path):
+            self.capmc_dir = path
+            path = os.path.dirname(path)
+        self.du.mkdir(self.mom.hostname, os.path.dirname(self.capmc),
+                      parents=True, sudo=True)
+        self.du.run_copy(self.mom.hostname, src=fn, dest=self.capmc,
+                         mode=0o755, sudo=True)
+        self.du.rm(path=fn)
+
+        attr = {ATTR_RESC_TYPE: 'string', ATTR_RESC_FLAG: 'h'}
+        self.server.manager(MGR_CMD_CREATE, RSC, attr, id='PBScraynid')
+        a = {'resources_available.ncpus': 1}
+        self.mom.create_vnodes(a, 64, attrfunc=self.cray_nid,
+                               usenatvnode=False)
+
+    def cray_nid(self, name, inst):
+        """
+        Give every vnode its own nid
+        """
+        return {'resources_available.PBScraynid': str(inst)}
+
+    def write_energy_file(self, jid):
+        """
+        Write the energy file PBS_power leaves behind when it activates
+        the profile of a job
+        """
+        path = os.path.join(self.mom.pbs_conf['PBS_HOME'], 'spool',
+                            jid + '.energy')
+        fn = self.du.create_temp_file(body='0')
+        self.du.run_copy(self.mom.hostname, src=fn, dest=path, sudo=True)
+        self.du.rm(path=fn)
+        self.energy_files.append(path)
+
+    @timeout(1800)
+    def test_energy_usage_many_jobs(self):
+        """
+        Gather the energy usage of 1, 16 and 64 running jobs in one
+        exechost_periodic run and report the time taken and the number
+        of capmc calls made, which should not grow with the jobs
+        """
+        a = {'event': 'exechost_periodic', 'enabled': 'True', 'freq': 10}
+        self.server.create_import_hook('power_periodic', a,
+                                       self.hook_body % self.calls)
+        jids = []
+        for njobs in (1, 16, 64):
+            while len(jids) < njobs:
+                j = Job(TEST_USER, {'Resource_List.select': '1:ncpus=1'})
+                j.set_sleep_time(3600)
+                jid = self.server.submit(j)
+                self.write_energy_file(jid)
+                jids.append(jid)
+            self.server.expect(JOB, {'job_state=R': njobs}, interval=5,
+                               max_attempts=60)
+            start = int(time.time())
+            msg = 'power_periodic jobs=%d calls=' % njobs
+            (_, line) = self.mom.log_match(msg, starttime=start,
+                                           max_attempts=60, interval=2)
+            m = re.search(r'calls=(\d+) time=([\d.]+)', line)
+            calls = int(m.group(1))
+            t = float(m.group(2))
+            self.logger.info('#' * 80)
+            self.logger.info('%d jobs: %d capmc calls in %.3f seconds' %
+                             (njobs, calls, t))
+            self.logger.info('#' * 80)
+            self.perf_test_result(t, 'energy_usage_%d_jobs' % njobs,
+                                  'sec')
+            self.perf_test_result(calls, 'capmc_calls_%d_jobs' % njobs,
+                                  'count')
+            self.assertEqual(calls, 1)
+
+    def tearDown(self):
+        if self.capmc_dir:
+            self.du.rm(self.mom.hostname, path=self.capmc_dir, sudo=True,
+                       recursive=True, force=True)
+        else:
+            self.du.rm(self.mom.hostname, path=self.capmc, sudo=True,
+                       force=True)
+        self.du.rm(self.mom.hostname, path=self.calls, force=True)
+        for path in self.energy_files:
+            self.du.rm(self.mom.hostname, path=path, sudo=True, force=True)
+        TestPerformance.tearDown(self)
@@ -0,0 +1,107 @@
+# coding: utf-8
+
+# Copyright (C) 1994-2021 Altair Engineering, Inc.
+# For more information, contact Altair at www.altair.com.
+#
+# This file is part of both the OpenPBS software ("OpenPBS")
+# and the PBS Professional ("PBS Pro") software.
+#
+# Open Source License Information:
+#
+# OpenPBS is free software. You can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# OpenPBS is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Commercial License Information:
+#
+# PBS Pro is commercially licensed software that shares a common core with
+# the OpenPBS software.  For a copy of the commercial license terms and
+# conditions, go to: (http://www.pbspro.com/agreement.html) or contact the
+# Altair Legal Department.
+#
+# Altair's dual-license business model allows companies, individuals, and
+# organizations to create proprietary derivative works of OpenPBS and
+# distribute them - whether embedded or bundled with other software -
+# under a commercial license agreement.
+#
+# Use of Altair's trademarks, including but not limited to "PBS™",
+# "OpenPBS®", "PBS Professional®", and "PBS Pro™" and Altair's logos is
+# subject to Altair's trademark licensing policies.
+
+import re
+
+from tests.performance import *
+
+
+class TestTypesPerf(TestPerformance):
+    """
+    Throughput of the pbs python resource types used by hooks
+    """
+
+    hook_body = """
+import time
+import pbs
+
+count = %d
+sel = pbs.select("2:ncpus=4:mem=8gb:ngpus=1+6:ncpus=8:mem=16gb")
+ev = "(vnA:ncpus=4:mem=8gb)+(vnB:ncpus=8:mem=16gb+vnC:ncpus=8:mem=16gb)"
+small = pbs.size("4kb")
+big = pbs.size("16gb")
+
+start = time.time()
+for _ in range(count):
+    sel.increment_chunks("50%%")
+t_select = time.time() - start
+
+start = time.time()
+for _ in range(count):
+    pbs.exec_vnode(ev)
+t_exec_vnode = time.time() - start
+
+start = time.time()
+for _ in range(count):
+    small < big
+    big == big
+t_size = time.time() - start
+
+start = time.time()
+for _ in range(count):
+    pbs.duration("01:30:00")
+t_duration = time.time() - start
+
+pbs.logmsg(pbs.EVENT_DEBUG,
+           "types_perf select=%%f exec_vnode=%%f size=%%f duration=%%f"
+           %% (t_select, t_exec_vnode, t_size, t_duration))
+"""
+
+    @timeout(600)
+    def test_resource_types_throughput(self):
+        """
+        Time 20000 select increments, exec_vnode parses, size comparisons
+        and duration conversions from a queuejob hook
+        """
+        count = 20000
+        a = {'event': 'queuejob', 'enabled': 'True'}
+        self.server.create_import_hook('types_perf', a,
+                                       self.hook_body % count)
+        start = time.time()
+        self.server.submit(Job(TEST_USER))
+        (_, msg) = self.server.log_match('types_perf select=',
+                                         starttime=start)
+        m = re.search(r'select=(\S+) exec_vnode=(\S+) size=(\S+) '
+                      r'duration=(\S+)', msg)
+        self.assertTrue(m, 'hook did not report its timings')
+        for (i, name) in enumerate(['select', 'exec_vnode', 'size',
+                                    'duration']):
+            t = float(m.group(i + 1))
+            self.logger.info('%d %s operations: %f sec', count, name, t)
+            self.perf_test_result(t, "%s_ops_time" % name, "sec")
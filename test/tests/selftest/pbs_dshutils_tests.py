@@ -86,3 +86,92 @@ class TestDshUtils(TestSelf):
         self.du.unset_pbs_environment(environ=['pbs_foo'])
         environ = self.du.parse_pbs_environment()
         self.assertNotIn('pbs_foo', environ, msg)
+
+    def fake_rsh(self, hosts):
+        """
+        Make run_cmd reach hosts, aliases of the local host, through a
+        fake remote shell that takes a second to connect, passes the host
+        name to the command in PTL_RSH_HOST, and fails for names ending
+        in -down as ssh would
+        """
+        body = """#!/bin/bash
+host=$1
+shift
+case "$host" in
+*-down) echo "ssh: connect to host $host port 22: Connection refused" >&2
+        exit 255 ;;
+esac
+sleep 1
+PTL_RSH_HOST=$host exec "$@"
+"""
+        rsh = self.du.create_temp_file(body=body)
+        os.chmod(rsh, 0o755)
+        saved = (self.du.rsh_cmd, dict(self.du._h2l))
+        for h in hosts:
+            self.du._h2l[h] = False
+
+        def restore():
+            self.du.set_rsh_cmd(' '.join(saved[0]))
+            self.du._h2l.clear()
+            self.du._h2l.update(saved[1])
+        self.addCleanup(restore)
+        self.du.set_rsh_cmd(rsh)
+
+    def test_run_cmd_parallel(self):
+        """
+        Test that run_cmd with parallel=True runs the command on all the
+        hosts at once and returns the result of each host
+        """
+        hosts = ['ptl-alias%d' % i for i in range(6)] + ['ptl-alias-down']
+        self.fake_rsh(hosts)
+        start = time.time()
+        ret = self.du.run_cmd(hosts, ['printenv', 'PTL_RSH_HOST'],
+                              parallel=True, logerr=False)
+        elapsed = time.time() - start
+        self.assertEqual(sorted(ret), sorted(hosts))
+        for h in hosts[:-1]:
+            self.assertEqual(ret[h]['rc'], 0)
+            self.assertEqual(ret[h]['out'], [h])
+        self.assertEqual(ret['ptl-alias-down']['rc'], 255)
+        self.assertIn('Connection refused', ret['ptl-alias-down']['err'][0])
+        # one after the other the hosts would take at least 6 seconds
+        self.assertLess(elapsed, 3)
+
+    def test_run_cmd_parallel_max_workers(self):
+        """
+        Test that run_cmd with parallel=True runs the command on at most
+        max_workers hosts at the same time, and that without it only the
+        result of the last host is returned
+        """
+        hosts = ['ptl-alias%d' % i for i in range(4)]
+        self.fake_rsh(hosts)
+        start = time.time()
+        ret = self.du.run_cmd(hosts, ['printenv', 'PTL_RSH_HOST'],
+                              parallel=True, max_workers=2)
+        elapsed = time.time() - start
+        self.assertEqual(sorted(ret), hosts)
+        self.assertGreaterEqual(elapsed, 2)
+        ret = self.du.run_cmd(hosts, ['printenv', 'PTL_RSH_HOST'])
+        self.assertEqual(ret['rc'], 0)
+        self.assertEqual(ret['out'], [hosts[-1]])
+
+    def test_run_cmd_parallel_exception(self):
+        """
+        Test that with parallel=True an exception raised while running
+        the command on one host is returned as the result of that host
+        and does not lose the results of the other hosts
+        """
+        hosts = ['ptl-alias0', 'ptl-alias1']
+        self.fake_rsh(hosts)
+        # ptl-local0 runs the command without the remote shell, so that
+        # starting a command that does not exist raises on that host only
+        self.du._h2l['ptl-local0'] = True
+        cmd = ['/nonexistent/ptl/command']
+        ret = self.du.run_cmd(hosts + ['ptl-local0'], cmd, parallel=True,
+                              logerr=False)
+        self.assertEqual(sorted(ret), hosts + ['ptl-local0'])
+        for h in hosts:
+            self.assertEqual(ret[h]['rc'], 127)
+        self.assertEqual(ret['ptl-local0']['rc'], 1)
+        self.assertEqual(ret['ptl-local0']['out'], [])
+        self.assertIn('ptl-local0', ret['ptl-local0']['err'][0])